@@ -0,0 +1,72 @@
+"""
+Password hashing benchmark.
+
+Reports the median time to hash and to verify a password for each bcrypt cost (and, when argon2-cffi
+is installed, each argon2id setting), so that BCRYPT_ROUNDS / ARGON2_* can be tuned for the hardware
+the API runs on. Login latency is roughly one verify; signup is roughly one hash.
+
+Usage::
+
+    python -m benchmarks.password_hashing --bcrypt-rounds 10 11 12 13 --repeat 5
+    python -m benchmarks.password_hashing --argon2 3:65536:4 2:19456:1
+"""
+import argparse
+import json
+import statistics
+import time
+
+from passlib.context import CryptContext
+
+PASSWORD = "correct horse battery staple"
+
+
+def measure(context: CryptContext, repeat: int) -> dict:
+    """
+    The measure function times hashing and verification with the given context.
+
+    :param context: CryptContext: The context configured with the setting to measure
+    :param repeat: int: Number of measured iterations
+    :return: A dictionary with median hash and verify times in milliseconds
+    """
+    hash_times, verify_times = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        hashed = context.hash(PASSWORD)
+        hash_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        context.verify(PASSWORD, hashed)
+        verify_times.append(time.perf_counter() - start)
+    return {"hash_ms": round(statistics.median(hash_times) * 1000, 2),
+            "verify_ms": round(statistics.median(verify_times) * 1000, 2)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bcrypt-rounds", type=int, nargs="*", default=[10, 11, 12, 13])
+    parser.add_argument("--argon2", nargs="*", default=[], metavar="TIME:MEMORY_KIB:PARALLELISM")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for rounds in args.bcrypt_rounds:
+        context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+        results.append({"scheme": "bcrypt", "setting": f"rounds={rounds}", **measure(context, args.repeat)})
+    for setting in args.argon2:
+        time_cost, memory_cost, parallelism = (int(value) for value in setting.split(":"))
+        context = CryptContext(schemes=["argon2"], argon2__type="ID", argon2__time_cost=time_cost,
+                               argon2__memory_cost=memory_cost, argon2__parallelism=parallelism)
+        results.append({"scheme": "argon2id",
+                        "setting": f"time_cost={time_cost} memory_cost={memory_cost} parallelism={parallelism}",
+                        **measure(context, args.repeat)})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'scheme':<10}{'setting':<52}{'hash ms':>10}{'verify ms':>12}")
+    for result in results:
+        print(f"{result['scheme']:<10}{result['setting']:<52}{result['hash_ms']:>10}{result['verify_ms']:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+In-process stand-ins for the services the API talks to, used by the benchmarks.
+
+MemoryRedis implements the handful of Redis commands the application sends (the user cache, the contacts
+version counter and the rate limiter), and wire_app points main.app at a given database and at it,
+so that a benchmark measures the application itself rather than the network or a shared Redis.
+"""
+import time
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from src.database.db import get_db, get_session_factory
+from src.database.models import Base
+
+
+class MemoryRedis:
+    """
+    Dictionary-backed stand-in for redis.asyncio.Redis. The rate limiter script always allows the request,
+    so load can be driven from a single client address.
+    """
+
+    def __init__(self):
+        self._data: dict[str, tuple[str, float | None]] = {}
+
+    def _alive(self, key: str) -> str | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def get(self, key: str) -> str | None:
+        return self._alive(key)
+
+    async def set(self, key: str, value, ex: int | None = None, px: int | None = None, nx: bool = False) -> bool:
+        if nx and self._alive(key) is not None:
+            return False
+        ttl = ex or (px / 1000 if px else None)
+        self._data[key] = (str(value), time.monotonic() + ttl if ttl else None)
+        return True
+
+    async def incr(self, key: str) -> int:
+        value = int(self._alive(key) or 0) + 1
+        self._data[key] = (str(value), None)
+        return value
+
+    async def delete(self, *keys: str) -> int:
+        return sum(self._data.pop(key, None) is not None for key in keys)
+
+    async def publish(self, channel: str, message: str) -> int:
+        return 0
+
+    async def script_load(self, script: str) -> str:
+        return "memory"
+
+    async def evalsha(self, sha: str, numkeys: int, *args) -> int:
+        return 0
+
+    def pipeline(self, transaction: bool = True) -> "MemoryPipeline":
+        return MemoryPipeline(self)
+
+
+class MemoryPipeline:
+    def __init__(self, r: MemoryRedis):
+        self.r = r
+        self._commands = []
+
+    def delete(self, *keys: str) -> None:
+        self._commands.append(self.r.delete(*keys))
+
+    def publish(self, channel: str, message: str) -> None:
+        self._commands.append(self.r.publish(channel, message))
+
+    async def execute(self) -> list:
+        results = [await command for command in self._commands]
+        self._commands.clear()
+        return results
+
+
+async def create_schema(engine: AsyncEngine) -> None:
+    """
+    The create_schema function drops and recreates all tables.
+
+    :param engine: AsyncEngine: The engine of the benchmark database
+    :return: None
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+
+def wire_services() -> MemoryRedis:
+    """
+    The wire_services function binds the user cache, the contacts version counter and the read-your-writes
+    window to a new MemoryRedis.
+
+    :return: The MemoryRedis the services now use
+    """
+    from src.services.cache import contacts_version, recent_writers, user_cache
+
+    r = MemoryRedis()
+    user_cache.r = r
+    user_cache.clear()
+    contacts_version.connect(r)
+    recent_writers.connect(r)
+    return r
+
+
+async def wire_app(app, engine: AsyncEngine) -> MemoryRedis:
+    """
+    The wire_app function points the application at the benchmark database and at a MemoryRedis,
+    the way the lifespan of main.app does for the real services. Confirmation emails are not sent.
+
+    :param app: FastAPI: The application, main.app
+    :param engine: AsyncEngine: The engine of the benchmark database
+    :return: The MemoryRedis the application now uses
+    """
+    from fastapi_limiter import FastAPILimiter
+
+    import src.routes.auth
+
+    session_factory = async_sessionmaker(bind=engine, class_=AsyncSession, autocommit=False, autoflush=False,
+                                         expire_on_commit=False)
+
+    async def get_benchmark_db():
+        async with session_factory() as session:
+            yield session
+
+    async def send_no_email(*args, **kwargs):
+        return None
+
+    app.dependency_overrides[get_db] = get_benchmark_db
+    app.dependency_overrides[get_session_factory] = lambda: session_factory
+    src.routes.auth.send_email = send_no_email
+
+    r = wire_services()
+    await FastAPILimiter.init(r)
+    return r
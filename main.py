@@ -1,20 +1,55 @@
+import logging
 import os
-import time
+import secrets
+from contextlib import asynccontextmanager
 
-import redis.asyncio as redis
 import uvicorn
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi_limiter import FastAPILimiter
 from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
 from src.config import messages
 from src.config.config import settings
+from src.database import db as database
 from src.database.db import get_db
+from src.database.redis_pool import redis_pool
 from src.routes import contacts, auth, users
+from src.services.cache import user_cache, contacts_version, recent_writers
+from src.services.logs import setup_logging
+from src.services.metrics import MetricsMiddleware, count_rate_limited, metrics_response
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    The lifespan function runs around the lifetime of the application.
+    On startup it sets up the JSON logging (here rather than on import, so importers keep their own logging)
+    and creates the shared async Redis connection pool and hands it to the rate limiter,
+    the user cache, the contacts version counter and the read-your-writes window; on shutdown it finishes
+    the pending slow query plans, stops the cache listener and closes the pool.
+
+    :param app: FastAPI: The application instance
+    :return: An async context manager
+    """
+    setup_logging()
+    r = await redis_pool.connect()
+    await FastAPILimiter.init(r, http_callback=count_rate_limited)
+    await user_cache.connect(r)
+    contacts_version.connect(r)
+    recent_writers.connect(r)
+    yield
+    if database.slow_query_log is not None:
+        await database.slow_query_log.wait()
+    await user_cache.close()
+    await redis_pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:3000"
@@ -26,42 +61,55 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-DB-Query-Count", "X-DB-Time-Ms"],
 )
 
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(auth.router, prefix='/api')
 app.include_router(contacts.router, prefix="/api")
 app.include_router(users.router, prefix='/api')
 
 
-@app.on_event("startup")
-async def startup():
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    The metrics function exposes the request latency, database pool, Redis, user cache and rate limiter metrics
+    in the Prometheus text format.
+
+    :return: The metrics of this worker
+    """
+    return metrics_response()
+
+
+def require_admin_token(credentials: HTTPAuthorizationCredentials | None = Depends(HTTPBearer(auto_error=False))):
     """
-    The startup function is called when the application starts up.
-    It can be used to perform tasks that are needed before the application can serve requests, such as initializing a
-    database connection or setting up caches.
+    The require_admin_token function guards the admin endpoints: they answer only a bearer token equal
+    to SLOW_QUERY_ADMIN_TOKEN, and are disabled while it is not set.
 
-    :return: A coroutine, which is async
+    :param credentials: HTTPAuthorizationCredentials: The bearer token of the request, if any
+    :return: None
     """
-    r = await redis.Redis(host=settings.redis_host, port=settings.redis_port, password=settings.redis_password, db=0,
-                          encoding="utf-8",
-                          decode_responses=True)
-    await FastAPILimiter.init(r)
+    if not settings.slow_query_admin_token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.SLOW_QUERY_ENDPOINT_DISABLED)
+    if credentials is None or not secrets.compare_digest(credentials.credentials.encode(),
+                                                         settings.slow_query_admin_token.encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.NOT_VALIDATE,
+                            headers={"WWW-Authenticate": "Bearer"})
 
 
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
+@app.get("/slow-queries", include_in_schema=False, dependencies=[Depends(require_admin_token)])
+def slow_queries():
     """
-    The add_process_time_header function adds a 'My-Process-Time' header to the response with the time taken to process the request.
+    The slow_queries function returns the statements recorded by the slow query log, newest first,
+    with their redacted parameters, route, duration and plan. It requires the SLOW_QUERY_ADMIN_TOKEN
+    as a bearer token; without one configured, the log is only available from SLOW_QUERY_LOG_FILE.
 
-    :param request: Request: Access the incoming request object
-    :param call_next: Call the next middleware or route handler
-    :return: The response object with the added 'my-process-time' header
+    :return: A list of the recorded statements
     """
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["My-Process-Time"] = str(process_time)
-    return response
+    if database.slow_query_log is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.SLOW_QUERY_LOG_DISABLED)
+    return database.slow_query_log.snapshot()
 
 
 @app.get("/", name="Project")
@@ -75,25 +123,25 @@ def read_root():
 
 
 @app.get("/api/healthchecker")
-def healthchecker(db: Session = Depends(get_db)):
+async def healthchecker(db: AsyncSession = Depends(get_db)):
     """
     The healthchecker function is used to check the health of the API by executing a query on the database.
 
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A message indicating the health status of the api
     """
     try:
         # Make request
-        result = db.execute(text("SELECT 1")).fetchone()
-        print(result)
+        result = await db.execute(text("SELECT 1"))
+        result = result.fetchone()
         if result is None:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=messages.DATABASE_ERROR,
             )
         return {"message": "Welcome to FastAPI!"}
-    except Exception as e:
-        print(e)
+    except Exception:
+        logger.exception("Health check failed")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=messages.DATABASE_CONNECTION_ERROR,
@@ -101,4 +149,6 @@ def healthchecker(db: Session = Depends(get_db)):
 
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="localhost", port=int(os.environ.get("PORT", 8000)), log_level="info")
\ No newline at end of file
+    # Without a log config of its own uvicorn logs through the root logger, i.e. the queue of setup_logging
+    uvicorn.run("main:app", host="localhost", port=int(os.environ.get("PORT", 8000)), log_level="info",
+                log_config=None)
\ No newline at end of file
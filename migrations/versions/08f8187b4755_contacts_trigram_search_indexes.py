@@ -0,0 +1,37 @@
+"""contacts trigram search indexes
+
+Revision ID: 08f8187b4755
+Revises: 6726b4f37824
+Create Date: 2026-10-17 10:03:47.520913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '08f8187b4755'
+down_revision: Union[str, None] = '6726b4f37824'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_COLUMNS = ('first_name', 'last_name', 'email')
+
+
+def upgrade() -> None:
+    # Only Postgres has trigram indexes; a plain index would not serve LIKE '%term%'
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for column in SEARCH_COLUMNS:
+        op.create_index(f'ix_contacts_{column}_trgm', 'contacts', [column], unique=False,
+                        postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for column in SEARCH_COLUMNS:
+        op.drop_index(f'ix_contacts_{column}_trgm', table_name='contacts')
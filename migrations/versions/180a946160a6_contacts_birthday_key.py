@@ -0,0 +1,37 @@
+"""contacts birthday key
+
+Revision ID: 180a946160a6
+Revises: 08f8187b4755
+Create Date: 2026-10-17 11:25:09.604377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '180a946160a6'
+down_revision: Union[str, None] = '08f8187b4755'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('birthday_key', sa.Integer(), nullable=True))
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("UPDATE contacts SET birthday_key = "
+                   "EXTRACT(MONTH FROM born_date) * 100 + EXTRACT(DAY FROM born_date)")
+    else:
+        op.execute("UPDATE contacts SET birthday_key = "
+                   "CAST(strftime('%m', born_date) AS INTEGER) * 100 + CAST(strftime('%d', born_date) AS INTEGER)")
+    with op.batch_alter_table('contacts') as batch_op:
+        batch_op.alter_column('birthday_key', existing_type=sa.Integer(), nullable=False)
+    op.create_index('ix_contacts_user_id_birthday_key', 'contacts', ['user_id', 'birthday_key'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_birthday_key', table_name='contacts')
+    with op.batch_alter_table('contacts') as batch_op:
+        batch_op.drop_column('birthday_key')
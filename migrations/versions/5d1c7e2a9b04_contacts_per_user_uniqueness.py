@@ -0,0 +1,71 @@
+"""contacts per-user uniqueness
+
+Revision ID: 5d1c7e2a9b04
+Revises: 180a946160a6
+Create Date: 2026-10-17 14:02:47.513920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d1c7e2a9b04'
+down_revision: Union[str, None] = '180a946160a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Names for the unnamed column-level UNIQUE constraints that SQLite reflects when batch mode rebuilds the table
+naming_convention = {"uq": "uq_%(table_name)s_%(column_0_name)s"}
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        # Build the indexes without locking out writes, then attach the unique ones as constraints,
+        # which only takes a short lock
+        with op.get_context().autocommit_block():
+            op.create_index('uq_contacts_user_id_email', 'contacts', ['user_id', 'email'], unique=True,
+                            postgresql_concurrently=True)
+            op.create_index('uq_contacts_user_id_phone_number', 'contacts', ['user_id', 'phone_number'], unique=True,
+                            postgresql_concurrently=True)
+            op.create_index('ix_contacts_user_id_last_name', 'contacts', ['user_id', 'last_name'], unique=False,
+                            postgresql_concurrently=True)
+        op.execute('ALTER TABLE contacts ADD CONSTRAINT uq_contacts_user_id_email '
+                   'UNIQUE USING INDEX uq_contacts_user_id_email')
+        op.execute('ALTER TABLE contacts ADD CONSTRAINT uq_contacts_user_id_phone_number '
+                   'UNIQUE USING INDEX uq_contacts_user_id_phone_number')
+        # Default names of the column-level UNIQUE constraints created with the table
+        op.execute('ALTER TABLE contacts DROP CONSTRAINT IF EXISTS contacts_email_key')
+        op.execute('ALTER TABLE contacts DROP CONSTRAINT IF EXISTS contacts_phone_number_key')
+        return
+    with op.batch_alter_table('contacts', naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('uq_contacts_email', type_='unique')
+        batch_op.drop_constraint('uq_contacts_phone_number', type_='unique')
+        batch_op.create_unique_constraint('uq_contacts_user_id_email', ['user_id', 'email'])
+        batch_op.create_unique_constraint('uq_contacts_user_id_phone_number', ['user_id', 'phone_number'])
+    op.create_index('ix_contacts_user_id_last_name', 'contacts', ['user_id', 'last_name'], unique=False)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.drop_index('ix_contacts_user_id_last_name', table_name='contacts', postgresql_concurrently=True)
+            op.create_index('contacts_email_key', 'contacts', ['email'], unique=True, postgresql_concurrently=True)
+            op.create_index('contacts_phone_number_key', 'contacts', ['phone_number'], unique=True,
+                            postgresql_concurrently=True)
+        op.execute('ALTER TABLE contacts ADD CONSTRAINT contacts_email_key UNIQUE USING INDEX contacts_email_key')
+        op.execute('ALTER TABLE contacts ADD CONSTRAINT contacts_phone_number_key '
+                   'UNIQUE USING INDEX contacts_phone_number_key')
+        op.drop_constraint('uq_contacts_user_id_phone_number', 'contacts', type_='unique')
+        op.drop_constraint('uq_contacts_user_id_email', 'contacts', type_='unique')
+        return
+    op.drop_index('ix_contacts_user_id_last_name', table_name='contacts')
+    with op.batch_alter_table('contacts') as batch_op:
+        batch_op.drop_constraint('uq_contacts_user_id_phone_number', type_='unique')
+        batch_op.drop_constraint('uq_contacts_user_id_email', type_='unique')
+        # The names upgrade gives the reflected constraints, so that it can run again
+        batch_op.create_unique_constraint('uq_contacts_phone_number', ['phone_number'])
+        batch_op.create_unique_constraint('uq_contacts_email', ['email'])
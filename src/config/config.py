@@ -9,14 +9,49 @@ class Settings(BaseSettings):
     sqlalchemy_database_url: str 
     secret_key: str 
     algorithm: str 
+    password_hash_workers: int = 4
+    password_schemes: list[str] = ["bcrypt"]
+    bcrypt_rounds: int = 12
+    argon2_time_cost: int = 3
+    argon2_memory_cost: int = 65536
+    argon2_parallelism: int = 4
     mail_username: str 
     mail_password: str 
     mail_from: str 
     mail_port: int 
     mail_server: str 
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_statement_timeout_ms: int | None = None
+    sqlalchemy_replica_urls: list[str] = []
+    replica_strategy: str = "round_robin"
+    read_your_writes_seconds: float = 5.0
+    contact_shards: dict[str, str] = {}
+    contact_shard_vnodes: int = 128
+    contact_shard_weights: dict[str, int] = {}
+    contact_shard_pins: dict[int, str] = {}
+    contact_shard_id_block: int = 100_000_000
     redis_host: str 
     redis_port: int 
     redis_password: str | None = None
+    redis_max_connections: int = 50
+    redis_socket_timeout: float = 1.0
+    redis_socket_connect_timeout: float = 1.0
+    user_cache_size: int = 1024
+    user_cache_ttl: int = 300
+    token_cache_size: int = 10000
+    log_level: str = "INFO"
+    log_levels: dict[str, str] = {}
+    log_sample_rate: float = 1.0
+    log_sql: bool = False
+    slow_query_threshold_ms: float | None = None
+    slow_query_analyze_sample_rate: float = 0.0
+    slow_query_log_size: int = 100
+    slow_query_log_file: str | None = None
+    slow_query_admin_token: str | None = None
     cloudinary_name: str 
     cloudinary_api_key: str
     cloudinary_api_secret: str
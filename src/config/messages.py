@@ -11,4 +11,17 @@ VERIFICATION_ERROR = "Verification error"
 NO_MORE_THAN = "No more than 10 requests per minute"
 INVALID_SCOPE = "Invalid scope for token"
 DATABASE_ERROR = "Database is not configured correctly"
-DATABASE_CONNECTION_ERROR = "Error connecting to the database"
\ No newline at end of file
+DATABASE_CONNECTION_ERROR = "Error connecting to the database"
+INVALID_CURSOR = "Invalid pagination cursor"
+DUPLICATE_EMAIL = "Contact with this email already exists"
+DUPLICATE_PHONE = "Contact with this phone number already exists"
+CONTACT_CONFLICT = "Contact conflicts with an existing contact"
+CONTACTS_MOVING = "Contacts are being moved to another database, try again shortly"
+UNSUPPORTED_IMPORT_FORMAT = "Unsupported import format, use text/csv or application/x-ndjson"
+INVALID_JSON = "Invalid JSON"
+INVALID_CSV_ROW = "Number of values does not match the header"
+UNTERMINATED_CSV_VALUE = "Quoted value is not closed before the end of the file"
+CSV_RECORD_TOO_LONG = "Record is too long, check for a quoted value that is not closed"
+LINE_TOO_LONG = "Line is too long"
+SLOW_QUERY_LOG_DISABLED = "Slow query log is disabled, set SLOW_QUERY_THRESHOLD_MS to enable it"
+SLOW_QUERY_ENDPOINT_DISABLED = "Slow query endpoint is disabled, set SLOW_QUERY_ADMIN_TOKEN or read SLOW_QUERY_LOG_FILE"
\ No newline at end of file
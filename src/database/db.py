@@ -1,31 +1,116 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import SQLAlchemyError
+import time
+
+from sqlalchemy import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from fastapi import HTTPException, status
 
 from src.config.config import settings
+from src.database.query_stats import track_queries
+from src.database.routing import ReplicaSet, RoutingAsyncSession
+from src.database.slow_queries import SlowQueryLog
+from src.services.metrics import DB_POOL_TIMEOUTS, DB_POOL_WAIT, watch_pool
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Connection pool that records how long every checkout waits for a connection
+    (including opening a new one when the pool is not full yet) and how often it times out,
+    under the label of its engine.
+    """
+    label = "primary"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            DB_POOL_TIMEOUTS.labels(self.label).inc()
+            raise
+        finally:
+            DB_POOL_WAIT.labels(self.label).observe(time.perf_counter() - start)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.label = self.label
+        return pool
+
+
+def make_engine(url: str, name: str = "primary") -> AsyncEngine:
+    """
+    The make_engine function creates an engine with the pool settings: DB_POOL_SIZE connections plus up to
+    DB_MAX_OVERFLOW more under a burst, a checkout that fails after DB_POOL_TIMEOUT seconds, connections
+    replaced after DB_POOL_RECYCLE seconds and tested before use when DB_POOL_PRE_PING is set.
+    On PostgreSQL (asyncpg) DB_STATEMENT_TIMEOUT_MS makes the server cancel longer statements.
+    The pool and query metrics of the engine are labelled with its name.
+
+    :param url: str: The database URL
+    :param name: str: The name of the engine in the metrics
+    :return: The new engine
+    """
+    connect_args = {}
+    if settings.db_statement_timeout_ms and make_url(url).get_driver_name() == "asyncpg":
+        connect_args["server_settings"] = {"statement_timeout": str(settings.db_statement_timeout_ms)}
+    new_engine = create_async_engine(url, poolclass=TimedQueuePool, pool_size=settings.db_pool_size,
+                                     max_overflow=settings.db_max_overflow, pool_timeout=settings.db_pool_timeout,
+                                     pool_recycle=settings.db_pool_recycle, pool_pre_ping=settings.db_pool_pre_ping,
+                                     connect_args=connect_args)
+    new_engine.sync_engine.pool.label = name
+    watch_pool(new_engine, name, settings.db_pool_size + settings.db_max_overflow)
+    track_queries(new_engine)
+    return new_engine
+
 
 url = settings.sqlalchemy_database_url
-engine = create_engine(url, echo=True, pool_size=5)
+engine = make_engine(url)
+replicas = [make_engine(replica_url, f"replica{number}")
+            for number, replica_url in enumerate(settings.sqlalchemy_replica_urls, 1)]
 
-DBSession = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+# Opt-in: set SLOW_QUERY_THRESHOLD_MS to record slower statements and their plans
+slow_query_log: SlowQueryLog | None = None
+if settings.slow_query_threshold_ms is not None:
+    slow_query_log = SlowQueryLog(settings.slow_query_threshold_ms, settings.slow_query_analyze_sample_rate,
+                                  settings.slow_query_log_size, settings.slow_query_log_file)
+    for watched in [engine, *replicas]:
+        slow_query_log.install(watched)
+
+if replicas:
+    # Reads go to the replicas, writes to the primary, see src.database.routing
+    DBSession = async_sessionmaker(bind=engine, class_=RoutingAsyncSession, autocommit=False, autoflush=False,
+                                   expire_on_commit=False,
+                                   replicas=ReplicaSet(replicas, settings.replica_strategy))
+else:
+    DBSession = async_sessionmaker(bind=engine, class_=AsyncSession, autocommit=False, autoflush=False,
+                                   expire_on_commit=False)
 
 
 # Dependency
-def get_db():
+async def get_db():
     """
-    The get_db function is a context manager that creates a database session and yields it.
+    The get_db function is an async context manager that creates a database session and yields it.
     The yield statement suspends the execution of get_db() and returns control to the caller.
-    When the with block ends, execution resumes in get_db(), where any exceptions are caught,
+    When the request is finished, execution resumes in get_db(), where any exceptions are caught,
     the session is rolled back (if necessary), and then closed.
 
-    :return: A database session
+    :return: An async database session
     """
     db = DBSession()
     try:
         yield db
     except SQLAlchemyError as err:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
     finally:
-        db.close()
\ No newline at end of file
+        await db.close()
+
+
+def get_session_factory() -> async_sessionmaker:
+    """
+    The get_session_factory function is a dependency that returns the session factory itself.
+    Streaming responses outlive the request scope (get_db closes its session before the body is sent),
+    so they open and close their own session with it while the body is being generated.
+
+    :return: The async session factory
+    """
+    return DBSession
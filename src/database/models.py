@@ -1,5 +1,7 @@
-from sqlalchemy import Column, Integer, String, func
-from sqlalchemy.orm import relationship
+from datetime import date
+
+from sqlalchemy import DDL, Column, Index, Integer, String, UniqueConstraint, event, func
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql.schema import ForeignKey
 from sqlalchemy.sql.sqltypes import Date, DateTime, Boolean
 from sqlalchemy.ext.declarative import declarative_base
@@ -7,14 +9,26 @@ from sqlalchemy.ext.declarative import declarative_base
 Base = declarative_base()
 
 
+def to_birthday_key(born_date: date) -> int:
+    """
+    The to_birthday_key function turns a date of birth into a sortable month*100+day key, e.g. 1 Dec -> 1201.
+    Keys of consecutive days are ordered within a year, so an upcoming-birthdays window is a range of keys.
+
+    :param born_date: date: Specify the date of birth
+    :return: The birthday key
+    """
+    return born_date.month * 100 + born_date.day
+
+
 class Contact(Base):
     __tablename__ = "contacts"
     id = Column(Integer, primary_key=True)
     first_name = Column(String(50), nullable=False)
     last_name = Column(String(50), nullable=False)
-    email = Column(String(100), nullable=False, unique=True)
-    phone_number = Column(String(15), nullable=False, unique=True)
+    email = Column(String(100), nullable=False)
+    phone_number = Column(String(15), nullable=False)
     born_date = Column(Date, nullable=False)
+    birthday_key = Column(Integer, nullable=False)
     description = Column(String(150), nullable=True)
     created_at = Column('crated_at', DateTime, default=func.now())
     updated_at = Column('updated_at', DateTime, default=func.now(), onupdate=func.now())
@@ -22,6 +36,39 @@ class Contact(Base):
         'users.id', ondelete='CASCADE'), default=None)
     user = relationship('User', backref="contacts")
 
+    @validates('born_date')
+    def validate_born_date(self, key, born_date):
+        """
+        The validate_born_date function keeps birthday_key in sync whenever born_date is set through the ORM.
+
+        :param key: str: Name of the validated attribute
+        :param born_date: date: The new date of birth
+        :return: The unchanged date of birth
+        """
+        self.birthday_key = to_birthday_key(born_date) if born_date is not None else None
+        return born_date
+
+    __table_args__ = (
+        # Emails and phone numbers are unique per owner; the constraints also index lookups by owner and value
+        UniqueConstraint('user_id', 'email', name='uq_contacts_user_id_email'),
+        UniqueConstraint('user_id', 'phone_number', name='uq_contacts_user_id_phone_number'),
+        Index('ix_contacts_user_id_id', 'user_id', 'id'),
+        Index('ix_contacts_user_id_last_name', 'user_id', 'last_name'),
+        Index('ix_contacts_user_id_birthday_key', 'user_id', 'birthday_key'),
+        # Trigram indexes serve LIKE '%term%' searches on Postgres. Other dialects have no equivalent,
+        # and a plain index cannot serve a leading wildcard, so they are not created there
+        Index('ix_contacts_first_name_trgm', 'first_name', postgresql_using='gin',
+              postgresql_ops={'first_name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        Index('ix_contacts_last_name_trgm', 'last_name', postgresql_using='gin',
+              postgresql_ops={'last_name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        Index('ix_contacts_email_trgm', 'email', postgresql_using='gin',
+              postgresql_ops={'email': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
+
+
+event.listen(Contact.__table__, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
 
 class User(Base):
     __tablename__ = "users"
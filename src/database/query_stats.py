@@ -0,0 +1,70 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+@dataclass
+class QueryStats:
+    """
+    Number of SQL statements and the time spent in them, accumulated over one request.
+    The ASGI scope of the request tells the slow query log which route ran a statement.
+    """
+    count: int = 0
+    duration: float = 0.0
+    scope: dict | None = None
+
+
+current_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += time.perf_counter() - context.query_start
+
+
+def track_queries(engine: AsyncEngine | Engine) -> None:
+    """
+    The track_queries function counts the statements executed by an engine into the QueryStats of the current
+    request. SQLAlchemy runs the async engine's events in the context of the awaiting task, so every request
+    only sees its own statements.
+
+    :param engine: AsyncEngine | Engine: The engine to instrument
+    :return: None
+    """
+    engine = getattr(engine, "sync_engine", engine)
+    if not event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def count_queries(engine: AsyncEngine | Engine):
+    """
+    The count_queries function counts every statement an engine executes inside the with block,
+    from any thread or task. Meant for tests.
+
+    :param engine: AsyncEngine | Engine: The engine to watch
+    :return: A context manager yielding the QueryStats of the block
+    """
+    engine = getattr(engine, "sync_engine", engine)
+    stats = QueryStats()
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        stats.count += 1
+
+    event.listen(engine, "after_cursor_execute", count)
+    try:
+        yield stats
+    finally:
+        event.remove(engine, "after_cursor_execute", count)
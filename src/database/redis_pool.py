@@ -0,0 +1,77 @@
+import time
+
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+
+from src.config.config import settings
+from src.services.metrics import REDIS_LATENCY
+
+
+class TimedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            REDIS_LATENCY.labels("PIPELINE").observe(time.perf_counter() - start)
+
+
+class TimedRedis(redis.Redis):
+    """
+    Async Redis client that records the round-trip latency of every command and pipeline, labelled by command.
+    """
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_LATENCY.labels(args[0]).observe(time.perf_counter() - start)
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None) -> TimedPipeline:
+        return TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class RedisPool:
+    """
+    Owner of the single async Redis connection pool of the worker.
+    The pool is created in the application lifespan and shared by authentication, rate limiting and caching.
+    """
+
+    def __init__(self):
+        self.pool: redis.ConnectionPool | None = None
+        self.client: redis.Redis | None = None
+
+    async def connect(self) -> redis.Redis:
+        """
+        The connect function creates the connection pool and a client bound to it, which reports command latency.
+        Pool size and timeouts are taken from the settings.
+
+        :param self: Represent the instance of the class
+        :return: An async redis client
+        """
+        self.pool = redis.ConnectionPool(host=settings.redis_host, port=settings.redis_port,
+                                         password=settings.redis_password, db=0,
+                                         max_connections=settings.redis_max_connections,
+                                         socket_timeout=settings.redis_socket_timeout,
+                                         socket_connect_timeout=settings.redis_socket_connect_timeout,
+                                         encoding="utf-8", decode_responses=True)
+        self.client = TimedRedis(connection_pool=self.pool)
+        return self.client
+
+    async def close(self) -> None:
+        """
+        The close function closes the client and disconnects every pooled connection.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+        if self.pool is not None:
+            await self.pool.disconnect()
+            self.pool = None
+
+
+redis_pool = RedisPool()
@@ -0,0 +1,110 @@
+"""
+Read replica routing.
+
+With replicas configured, a session sends its reads to one replica and everything else to the primary:
+flushes, INSERT/UPDATE/DELETE statements, SELECT ... FOR UPDATE and textual SQL. Once a session has written,
+it stays on the primary, so it reads its own uncommitted changes. Across requests, a user who wrote in the last
+READ_YOUR_WRITES_SECONDS is kept on the primary until the replicas have caught up.
+"""
+import itertools
+
+from sqlalchemy import Delete, Insert, Select, TextClause, Update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+from src.database.models import User
+from src.services.cache import recent_writers
+
+STRATEGIES = ("round_robin", "least_loaded")
+
+
+class ReplicaSet:
+    """
+    The replica engines and the strategy that picks one of them for a session: round_robin,
+    or least_loaded for the replica with the fewest connections checked out of its pool.
+    """
+
+    def __init__(self, engines: list[AsyncEngine], strategy: str = "round_robin"):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown replica strategy {strategy!r}, use one of {', '.join(STRATEGIES)}")
+        self.engines = engines
+        self.strategy = strategy
+        self._cycle = itertools.cycle(engines)
+
+    def choose(self) -> AsyncEngine:
+        if self.strategy == "least_loaded":
+            return min(self.engines, key=lambda engine: engine.sync_engine.pool.checkedout())
+        return next(self._cycle)
+
+
+class RoutingSession(Session):
+    """
+    Session that binds reads to a replica and writes to the primary, see the module docstring.
+    Setting info["primary"] keeps all statements of the session on the primary.
+    """
+
+    def __init__(self, replicas: ReplicaSet | None = None, **kw):
+        super().__init__(**kw)
+        self.replicas = replicas
+        self.replica = None
+        self.wrote = False
+        self.uncommitted_write = False
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or isinstance(clause, (Insert, Update, Delete)):
+            self.wrote = self.uncommitted_write = True
+        if (self.wrote or self.replicas is None or self.info.get("primary") or isinstance(clause, TextClause)
+                or (isinstance(clause, Select) and clause._for_update_arg is not None)):
+            return super().get_bind(mapper, clause=clause, **kw)
+        # One replica per session, so that its reads see one consistent snapshot
+        if self.replica is None:
+            self.replica = self.replicas.choose().sync_engine
+        return self.replica
+
+
+class RoutingAsyncSession(AsyncSession):
+    """
+    AsyncSession of a RoutingSession. A commit that wrote starts the read-your-writes window of the user
+    of the session, set by route_user.
+    """
+    sync_session_class = RoutingSession
+
+    async def commit(self) -> None:
+        await super().commit()
+        if self.sync_session.uncommitted_write:
+            self.sync_session.uncommitted_write = False
+            user_id = self.info.get("user_id")
+            if user_id is not None:
+                await recent_writers.mark(user_id)
+
+    async def rollback(self) -> None:
+        await super().rollback()
+        self.sync_session.uncommitted_write = False
+
+
+async def route_user(db: AsyncSession, user: User) -> None:
+    """
+    The route_user function ties a session to the authenticated user: the writes of the session start
+    the read-your-writes window of the user, and a user inside the window is read from the primary.
+    It does nothing without replicas.
+
+    :param db: AsyncSession: The session of the request
+    :param user: User: The authenticated user
+    :return: None
+    """
+    if isinstance(db, RoutingAsyncSession):
+        db.info["user_id"] = user.id
+        if await recent_writers.is_recent(user.id):
+            db.info["primary"] = True
+
+
+def use_primary(db: AsyncSession) -> None:
+    """
+    The use_primary function sends all statements of a session to the primary, for reads that must not lag,
+    such as comparing a refresh token that was just rotated. Like route_user, it does nothing without replicas.
+
+    :param db: AsyncSession: The session
+    :return: None
+    """
+    if isinstance(db, RoutingAsyncSession):
+        db.info["primary"] = True
@@ -0,0 +1,237 @@
+"""
+Synthetic data seeding.
+
+Generates users and contacts with realistic names, emails, phone numbers and birthdays and bulk-loads them:
+with COPY on PostgreSQL (asyncpg) and with executemany INSERTs on other databases. The output is fully
+determined by the seed and by the date the ages are counted back from (--today), which is a fixed date
+by default, so a seed gives the same birthdays on any day. All users share one password hash, so seeding
+a million users does not pay for a million bcrypt rounds.
+
+Contacts are spread over the users evenly, along a Zipf curve (--skew) or with a few heavy users on top
+(--heavy 3:500000 gives the first three users 500k contacts each).
+
+Usage::
+
+    python -m src.database.seed --users 1000 --contacts 1000000
+    python -m src.database.seed --users 10000 --contacts 2000000 --skew 1.1 --heavy 3:500000 --seed 7
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Iterator
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+
+from src.database.models import Base, Contact, User, to_birthday_key
+
+DEFAULT_PASSWORD = "password"
+BATCH_SIZE = 50_000
+
+FIRST_NAMES = ["Olha", "Ivan", "Taras", "Lesya", "Petro", "Mariia", "Andrii", "Iryna", "Oleh", "Sofiia", "Dmytro",
+               "Anna", "Mykola", "Kateryna", "Serhii", "Yuliia", "Volodymyr", "Natalia", "Bohdan", "Oksana",
+               "James", "Mary", "John", "Linda", "Michael", "Emma", "David", "Olivia", "Daniel", "Sophia"]
+LAST_NAMES = ["Shevchenko", "Kovalenko", "Bondarenko", "Tkachenko", "Kravchenko", "Melnyk", "Boyko", "Franko",
+              "Kovalchuk", "Oliinyk", "Shevchuk", "Polishchuk", "Lysenko", "Marchenko", "Savchenko", "Rudenko",
+              "Smith", "Johnson", "Brown", "Taylor", "Miller", "Wilson", "Moore", "Anderson", "Clark", "Lewis"]
+EMAIL_DOMAINS = ["gmail.com", "ukr.net", "i.ua", "outlook.com", "yahoo.com", "meta.ua", "proton.me"]
+MOBILE_CODES = ["50", "63", "66", "67", "68", "73", "93", "95", "96", "97", "98", "99"]
+# Ages follow a normal distribution clipped to adults, counted back from the reference date
+REFERENCE_DATE = date(2024, 1, 1)
+AGE_MEAN, AGE_SD, AGE_MIN, AGE_MAX = 38, 14, 18, 90
+# Any step coprime to 10 ** 7 walks through distinct subscriber numbers, so the phones of a user are unique
+PHONE_STRIDE = 7_919
+
+
+def contact_counts(users: int, contacts: int, skew: float = 0.0,
+                   heavy: list[tuple[int, int]] | None = None) -> list[int]:
+    """
+    The contact_counts function decides how many contacts every user gets.
+    Heavy users come first and get exactly the requested number; the remaining contacts are split among
+    the other users in proportion to 1 / rank ** skew, so a skew of 0 is an even split.
+
+    :param users: int: Number of users
+    :param contacts: int: Total number of contacts
+    :param skew: float: Exponent of the Zipf distribution
+    :param heavy: list[tuple[int, int]]: Pairs of (number of users, contacts of each of them)
+    :return: The number of contacts of every user, by user number
+    """
+    counts = []
+    for number, size in heavy or []:
+        counts += [size] * number
+    counts = counts[:users]
+    rest = users - len(counts)
+    remaining = max(contacts - sum(counts), 0)
+    if rest:
+        weights = [1 / (rank ** skew) for rank in range(1, rest + 1)]
+        total = sum(weights)
+        shares = [int(remaining * weight / total) for weight in weights]
+        for rank in range(remaining - sum(shares)):
+            shares[rank % rest] += 1
+        counts += shares
+    return counts
+
+
+def generate_users(users: int, password_hash: str, now: datetime, start: int = 0) -> Iterator[dict]:
+    """
+    The generate_users function yields the rows of the users table. User n logs in as user{n}@example.com.
+
+    :param users: int: Number of users
+    :param password_hash: str: The hash every user gets
+    :param now: datetime: The creation time of the rows
+    :param start: int: The number of the first user
+    :return: An iterator of row dictionaries
+    """
+    for number in range(start, start + users):
+        yield dict(username=f"user{number}", email=f"user{number}@example.com", password=password_hash,
+                   crated_at=now, updated_at=now, avatar=None, refresh_token=None, confirmed=True)
+
+
+def generate_contacts(user_id: int, user_number: int, count: int, seed: int, now: datetime,
+                      today: date = REFERENCE_DATE) -> Iterator[dict]:
+    """
+    The generate_contacts function yields the contacts of one user.
+    Every user has its own random stream, so the contacts of a user do not depend on the other users.
+
+    :param user_id: int: The id of the owner
+    :param user_number: int: The number of the owner, which selects its random stream
+    :param count: int: Number of contacts
+    :param seed: int: Seed of the data set
+    :param now: datetime: The creation time of the rows
+    :param today: date: The reference date the ages are counted back from
+    :return: An iterator of row dictionaries
+    """
+    rnd = random.Random(f"{seed}:{user_number}")
+    phone_base = rnd.randrange(10 ** 7)
+    for index in range(count):
+        first_name = rnd.choice(FIRST_NAMES)
+        last_name = rnd.choice(LAST_NAMES)
+        age = min(max(rnd.gauss(AGE_MEAN, AGE_SD), AGE_MIN), AGE_MAX)
+        born_date = today - timedelta(days=int(age * 365.25))
+        subscriber = (phone_base + index * PHONE_STRIDE) % 10 ** 7
+        yield dict(first_name=first_name, last_name=last_name,
+                   email=f"{first_name}.{last_name}{index}@{rnd.choice(EMAIL_DOMAINS)}".lower(),
+                   phone_number=f"+380{rnd.choice(MOBILE_CODES)}{subscriber:07d}",
+                   born_date=born_date, birthday_key=to_birthday_key(born_date),
+                   description=None, crated_at=now, updated_at=now, user_id=user_id)
+
+
+def batches(rows: Iterator[dict], size: int) -> Iterator[list[dict]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def load(conn: AsyncConnection, table, rows: Iterator[dict], batch_size: int = BATCH_SIZE) -> int:
+    """
+    The load function bulk-loads rows into a table, with COPY on PostgreSQL and executemany elsewhere.
+
+    :param conn: AsyncConnection: The connection inside the seeding transaction
+    :param table: Table: The target table
+    :param rows: Iterator[dict]: The rows, keyed by column name
+    :param batch_size: int: Number of rows sent at once
+    :return: The number of loaded rows
+    """
+    loaded = 0
+    if conn.dialect.driver == "asyncpg":
+        raw = await conn.get_raw_connection()
+        for batch in batches(rows, batch_size):
+            columns = list(batch[0])
+            await raw.driver_connection.copy_records_to_table(
+                table.name, records=[tuple(row[column] for column in columns) for row in batch], columns=columns)
+            loaded += len(batch)
+    else:
+        for batch in batches(rows, batch_size):
+            await conn.execute(insert(table), batch)
+            loaded += len(batch)
+    return loaded
+
+
+async def seed_database(engine: AsyncEngine, users: int, contacts: int, seed: int = 0, skew: float = 0.0,
+                        heavy: list[tuple[int, int]] | None = None, password: str = DEFAULT_PASSWORD,
+                        batch_size: int = BATCH_SIZE, today: date = REFERENCE_DATE) -> list[str]:
+    """
+    The seed_database function generates and loads users and their contacts in one transaction.
+    The new users are numbered from the current largest user id, so seeding a database that already has users
+    adds to them instead of failing on taken emails: a seeded user's number is always below its own id.
+
+    :param engine: AsyncEngine: The engine of the target database, whose tables must exist
+    :param users: int: Number of users
+    :param contacts: int: Total number of contacts
+    :param seed: int: Seed of the data set
+    :param skew: float: Exponent of the Zipf distribution of contacts over users
+    :param heavy: list[tuple[int, int]]: Pairs of (number of users, contacts of each of them)
+    :param password: str: The password of every user
+    :param batch_size: int: Number of rows sent at once
+    :param today: date: The reference date the ages are counted back from
+    :return: The emails of the users, heaviest first
+    """
+    from src.services.auth import auth_service
+
+    password_hash = auth_service.pwd_context.hash(password)
+    counts = contact_counts(users, contacts, skew, heavy)
+    now = datetime.utcnow()
+    async with engine.begin() as conn:
+        start = (await conn.execute(select(func.max(User.id)))).scalar() or 0
+        await load(conn, User.__table__, generate_users(users, password_hash, now, start), batch_size)
+        emails = [f"user{number}@example.com" for number in range(start, start + users)]
+        ids = dict((await conn.execute(select(User.email, User.id).where(User.id > start))).all())
+
+        def rows():
+            for number, count in enumerate(counts, start):
+                yield from generate_contacts(ids[f"user{number}@example.com"], number, count, seed, now, today)
+
+        await load(conn, Contact.__table__, rows(), batch_size)
+    return emails
+
+
+def heavy_users(value: str) -> tuple[int, int]:
+    number, size = value.split(":")
+    return int(number), int(size)
+
+
+def main() -> None:
+    from src.config.config import settings
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=settings.sqlalchemy_database_url, help="database URL")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--contacts", type=int, default=100_000, help="total number of contacts")
+    parser.add_argument("--skew", type=float, default=0.0, help="Zipf exponent, 0 for an even split")
+    parser.add_argument("--heavy", type=heavy_users, action="append", metavar="USERS:CONTACTS",
+                        help="give this many users this many contacts each, may be repeated")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--today", type=date.fromisoformat, default=REFERENCE_DATE,
+                        help=f"reference date of the birthdays, {REFERENCE_DATE} by default")
+    parser.add_argument("--password", default=DEFAULT_PASSWORD)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--create-tables", action="store_true",
+                        help="create missing tables first, for databases not managed by alembic")
+    args = parser.parse_args()
+
+    async def run():
+        engine = create_async_engine(args.url)
+        try:
+            if args.create_tables:
+                async with engine.begin() as conn:
+                    await conn.run_sync(Base.metadata.create_all)
+            start = time.perf_counter()
+            await seed_database(engine, args.users, args.contacts, args.seed, args.skew, args.heavy, args.password,
+                                args.batch_size, args.today)
+            contacts = sum(contact_counts(args.users, args.contacts, args.skew, args.heavy))
+            print(f"Seeded {args.users} users and {contacts} contacts in {time.perf_counter() - start:.1f} s")
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
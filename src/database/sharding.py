@@ -0,0 +1,534 @@
+"""
+Contact sharding.
+
+With CONTACT_SHARDS set (a JSON object of shard name to database URL), the contacts live on those databases
+instead of the main one, which keeps the users. A user's contacts all live on one shard, picked by a
+consistent hash ring of the user id: every shard owns CONTACT_SHARD_VNODES points of the ring, times its
+weight in CONTACT_SHARD_WEIGHTS. Adding a shard moves only the users whose ring points it takes over.
+CONTACT_SHARD_PINS places single users on a given shard, whatever the ring says.
+The repository functions need no changes: every contact query is already scoped by user_id,
+and the contact routes get the session of the user's shard from get_contacts_db.
+
+Users are moved between shards with the contact_moves table of the shard the map gives them. While a user
+has a move there, the routes use the source database instead: reads and writes while the move is pending,
+only reads while it is copying, when writes are answered with 503. A user's contacts are copied in one
+transaction that also marks the move copied, after which the routes use the new shard and the rows left on
+the source are deleted, and the contacts version of the user is bumped so that clients drop their ETags.
+
+Contacts keep their ids when they move, so the ids a client holds still address the same contacts. For that,
+ids are unique across the databases: on PostgreSQL, create-schema limits the id sequence of every shard to its
+own block of CONTACT_SHARD_ID_BLOCK ids, and the main database keeps the ids below the first block.
+SQLite shards, used in tests, have no sequences and number new contacts after the highest id.
+
+Shard schemas are created with create-schema. To change the shard map, run prepare with the new map, which
+keeps the users that will move on their current database, then deploy the new map and run rebalance,
+which moves them. Users who get their first contacts on the database of the old map after prepare are found
+there by placement, as long as their shard has moves. Rebalance can be repeated after an interruption. A shard that is being emptied stays in
+CONTACT_SHARDS, with a weight of 0, until rebalance is done.
+
+Usage::
+
+    python -m src.database.sharding create-schema
+    python -m src.database.sharding prepare --include-primary
+    python -m src.database.sharding plan --include-primary
+    python -m src.database.sharding rebalance --include-primary
+"""
+import argparse
+import asyncio
+import bisect
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Iterable
+
+from fastapi import Depends, HTTPException, Request, status
+from sqlalchemy import (Column, Integer, MetaData, String, Table, delete, func, inspect, insert, select, text,
+                        update)
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.schema import CreateTable
+
+from src.config import messages
+from src.config.config import settings
+from src.database import db as database
+from src.database.db import get_db, get_session_factory, make_engine
+from src.database.models import Contact, User
+from src.services.auth import auth_service
+from src.services.cache import ContactsVersion
+
+MOVE_BATCH_SIZE = 10_000
+# The name of the main database as the source of a move, when sharding is introduced
+PRIMARY = "primary"
+# How long a worker trusts that a shard has no moves before it looks again
+MOVE_POLL_SECONDS = 1.0
+# How long rebalance waits after blocking writes, for the workers to notice and in-flight writes to finish
+MOVE_SETTLE_SECONDS = 5.0
+PENDING, COPYING, COPIED = "pending", "copying", "copied"
+READ_METHODS = ("GET", "HEAD")
+# contacts.id is a 32-bit integer on PostgreSQL
+MAX_CONTACT_ID = 2 ** 31 - 1
+
+moves_table = Table(
+    "contact_moves", MetaData(),
+    Column("user_id", Integer, primary_key=True),
+    Column("source", String(50), nullable=False),
+    Column("state", String(10), nullable=False),
+)
+
+
+def hash_key(key: str) -> int:
+    # A stable hash, unlike hash(), so every worker and every run places a user on the same shard
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring of user ids over shard names, see the module docstring.
+    """
+
+    def __init__(self, shards: Iterable[str], vnodes: int = 128, weights: dict[str, int] | None = None,
+                 pins: dict[int, str] | None = None):
+        shards = list(shards)
+        weights = weights or {}
+        self.pins = pins or {}
+        if not shards:
+            raise ValueError("The shard map needs at least one shard")
+        unknown = (set(weights) | set(self.pins.values())) - set(shards)
+        if unknown:
+            raise ValueError(f"Unknown shards in the weights or pins: {', '.join(sorted(unknown))}")
+        points = sorted((hash_key(f"{name}#{point}"), name)
+                        for name in shards for point in range(vnodes * weights.get(name, 1)))
+        if not points:
+            raise ValueError("The shard map needs a shard with a weight above 0")
+        self._points = [point for point, _ in points]
+        self._names = [name for _, name in points]
+
+    def shard_for(self, user_id: int) -> str:
+        """
+        The shard_for function returns the shard of a user: its pin, or the owner of the next ring point.
+
+        :param user_id: int: The id of the user
+        :return: The shard name
+        """
+        pinned = self.pins.get(user_id)
+        if pinned is not None:
+            return pinned
+        index = bisect.bisect(self._points, hash_key(str(user_id))) % len(self._points)
+        return self._names[index]
+
+
+class ShardRouter:
+    """
+    The shard engines, their session factories and the ring that assigns users to them.
+    """
+
+    def __init__(self, engines: dict[str, AsyncEngine], ring: HashRing, move_poll: float = MOVE_POLL_SECONDS,
+                 primary: AsyncEngine | None = None):
+        self.engines = engines
+        self.ring = ring
+        self.move_poll = move_poll
+        self.primary = primary
+        self.session_factories = {
+            name: async_sessionmaker(bind=engine, class_=AsyncSession, autocommit=False, autoflush=False,
+                                     expire_on_commit=False)
+            for name, engine in engines.items()}
+        self._moves_checked: dict[str, tuple[float, bool]] = {}
+
+    def shard_for(self, user_id: int) -> str:
+        return self.ring.shard_for(user_id)
+
+    def session_factory(self, user_id: int) -> async_sessionmaker:
+        return self.session_factories[self.ring.shard_for(user_id)]
+
+    async def _has_moves(self, name: str) -> bool:
+        checked_at, has_moves = self._moves_checked.get(name, (float("-inf"), False))
+        if time.monotonic() - checked_at >= self.move_poll:
+            async with self.engines[name].connect() as conn:
+                has_moves = await conn.scalar(select(moves_table.c.user_id).limit(1)) is not None
+            self._moves_checked[name] = (time.monotonic(), has_moves)
+        return has_moves
+
+    async def _find_contacts(self, user_id: int, shard: str) -> str | None:
+        databases = {PRIMARY: self.primary, **self.engines} if self.primary is not None else self.engines
+        for name, engine in databases.items():
+            if name == shard:
+                continue
+            async with engine.connect() as conn:
+                if await conn.scalar(select(Contact.id).where(Contact.user_id == user_id).limit(1)) is not None:
+                    return name
+        return None
+
+    async def placement(self, user_id: int) -> tuple[str, str | None]:
+        """
+        The placement function returns the database that holds the contacts of a user: its shard,
+        or the source of a move to the shard that is not copied yet, together with the state of that move.
+        A shard is only asked for the move of the user while it has any moves. While it has, a user without a move
+        and without contacts on it is looked up on the other databases: prepare only sees the users who had
+        contacts, and one who wrote first under the old shard map, before it was deployed, is routed to those
+        contacts like a pending move until rebalance moves them.
+
+        :param user_id: int: The id of the user
+        :return: The shard name (or PRIMARY) and the state of the move, None without one
+        """
+        name = self.ring.shard_for(user_id)
+        if not await self._has_moves(name):
+            return name, None
+        async with self.engines[name].connect() as conn:
+            move = (await conn.execute(select(moves_table.c.source, moves_table.c.state)
+                                       .where(moves_table.c.user_id == user_id))).first()
+            has_contacts = move is None and await conn.scalar(
+                select(Contact.id).where(Contact.user_id == user_id).limit(1)) is not None
+        if move is not None:
+            return (name, None) if move.state == COPIED else (move.source, move.state)
+        source = None if has_contacts else await self._find_contacts(user_id, name)
+        return (name, None) if source is None else (source, PENDING)
+
+
+shard_router: ShardRouter | None = None
+if settings.contact_shards:
+    shard_router = ShardRouter(
+        {name: make_engine(shard_url, f"shard-{name}") for name, shard_url in settings.contact_shards.items()},
+        HashRing(settings.contact_shards, settings.contact_shard_vnodes, settings.contact_shard_weights,
+                 settings.contact_shard_pins),
+        primary=database.engine)
+    if database.slow_query_log is not None:
+        for shard_engine in shard_router.engines.values():
+            database.slow_query_log.install(shard_engine)
+
+
+async def contacts_placement(request: Request, user_id: int) -> str:
+    name, state = await shard_router.placement(user_id)
+    if state == COPYING and request.method not in READ_METHODS:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=messages.CONTACTS_MOVING,
+                            headers={"Retry-After": str(round(MOVE_SETTLE_SECONDS))})
+    return name
+
+
+async def get_contacts_db(request: Request, current_user: User = Depends(auth_service.get_current_user),
+                          db: AsyncSession = Depends(get_db)):
+    """
+    The get_contacts_db function is the session dependency of the contact routes. Without shards it is the
+    session of get_db; with shards it is a session of the database that holds the contacts of the current user,
+    handled like get_db does. Writes of a user whose contacts are being copied are answered with 503.
+
+    :param request: Request: The request, whose method tells reads from writes
+    :param current_user: User: The authenticated user, whose shard is used
+    :param db: AsyncSession: The session of the main database
+    :return: An async database session
+    """
+    if shard_router is None:
+        yield db
+        return
+    name = await contacts_placement(request, current_user.id)
+    if name == PRIMARY:
+        yield db
+        return
+    session = shard_router.session_factories[name]()
+    try:
+        yield session
+    except SQLAlchemyError as err:
+        await session.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
+    finally:
+        await session.close()
+
+
+async def get_contacts_session_factory(request: Request,
+                                       current_user: User = Depends(auth_service.get_current_user),
+                                       session_factory: async_sessionmaker = Depends(get_session_factory)
+                                       ) -> async_sessionmaker:
+    """
+    The get_contacts_session_factory function is get_session_factory for the contacts of the current user.
+
+    :param request: Request: The request, whose method tells reads from writes
+    :param current_user: User: The authenticated user, whose shard is used
+    :param session_factory: async_sessionmaker: The session factory of the main database
+    :return: The async session factory
+    """
+    if shard_router is None:
+        return session_factory
+    name = await contacts_placement(request, current_user.id)
+    return session_factory if name == PRIMARY else shard_router.session_factories[name]
+
+
+async def create_shard_schema(engine: AsyncEngine) -> None:
+    """
+    The create_shard_schema function creates the contacts table with its indexes and the contact_moves table
+    on a shard, if they are missing. The users live on the main database, so contacts have no foreign key to them.
+
+    :param engine: AsyncEngine: The engine of the shard
+    :return: None
+    """
+    table = Contact.__table__
+
+    def create(conn):
+        if conn.dialect.name == "postgresql":
+            conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        moves_table.create(conn, checkfirst=True)
+        if inspect(conn).has_table(table.name):
+            return
+        conn.execute(CreateTable(table, include_foreign_key_constraints=[]))
+        for index in table.indexes:
+            # Index.create skips the indexes of other dialects, like the trigram ones
+            index.create(conn)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(create)
+
+
+def plan_id_blocks(blocks: dict[str, int | None]) -> dict[str, int]:
+    """
+    The plan_id_blocks function gives the shards without a block of contact ids the next free blocks.
+    Block 0 belongs to the main database, and a shard keeps its block for good, also when others are removed.
+
+    :param blocks: dict[str, int | None]: The block of every shard, None for the shards without one
+    :return: The new blocks of the shards that had none
+    """
+    taken = max((block for block in blocks.values() if block is not None), default=0)
+    new_blocks = {}
+    for name, block in blocks.items():
+        if block is None:
+            taken += 1
+            new_blocks[name] = taken
+    return new_blocks
+
+
+async def assign_id_blocks(engines: dict[str, AsyncEngine], size: int) -> dict[str, int]:
+    """
+    The assign_id_blocks function limits the contact id sequence of every PostgreSQL shard to its own block,
+    the ids from block * size to (block + 1) * size - 1, so that the shards never hand out the same id.
+    The shards of other dialects are left alone.
+
+    :param engines: dict[str, AsyncEngine]: The shards
+    :param size: int: The number of ids in a block
+    :return: The block of every PostgreSQL shard
+    """
+    sequences, blocks = {}, {}
+    for name, engine in engines.items():
+        async with engine.connect() as conn:
+            if conn.dialect.name != "postgresql":
+                continue
+            sequences[name], minimum = (await conn.execute(text(
+                "SELECT seqrelid::regclass::text, seqmin FROM pg_sequence "
+                "WHERE seqrelid = pg_get_serial_sequence('contacts', 'id')::regclass"))).one()
+        blocks[name] = minimum // size if minimum >= size else None
+    for name, block in plan_id_blocks(blocks).items():
+        first, last = block * size, (block + 1) * size - 1
+        if last > MAX_CONTACT_ID:
+            raise ValueError(f"No contact ids left for shard {name}, lower CONTACT_SHARD_ID_BLOCK")
+        async with engines[name].begin() as conn:
+            await conn.exec_driver_sql(f"ALTER SEQUENCE {sequences[name]} MINVALUE {first} MAXVALUE {last} "
+                                       f"START WITH {first} RESTART WITH {first}")
+        blocks[name] = block
+    return blocks
+
+
+@dataclass
+class Move:
+    user_id: int
+    source: str
+    target: str
+    moved: int = 0
+    error: str | None = None
+
+
+async def plan_moves(router: ShardRouter, sources: dict[str, AsyncEngine] | None = None) -> list[Move]:
+    """
+    The plan_moves function lists the users whose contacts are on another database than their shard.
+
+    :param router: ShardRouter: The shards and the ring
+    :param sources: dict[str, AsyncEngine]: The databases to look at, the shards by default
+    :return: One move per user and source database
+    """
+    moves = []
+    for name, engine in (sources or router.engines).items():
+        async with engine.connect() as conn:
+            user_ids = (await conn.execute(select(Contact.user_id).distinct().order_by(Contact.user_id))).scalars()
+            for user_id in user_ids:
+                target = router.shard_for(user_id)
+                if target != name:
+                    moves.append(Move(user_id, name, target))
+    return moves
+
+
+async def set_move_state(target: AsyncEngine, move: Move, state: str | None) -> None:
+    """
+    The set_move_state function records the state of a move on its target shard, or removes the move.
+
+    :param target: AsyncEngine: The engine of the target shard
+    :param move: Move: The user and the source
+    :param state: str | None: PENDING, COPYING or COPIED, None to remove the move
+    :return: None
+    """
+    async with target.begin() as conn:
+        await conn.execute(delete(moves_table).where(moves_table.c.user_id == move.user_id))
+        if state is not None:
+            await conn.execute(insert(moves_table).values(user_id=move.user_id, source=move.source, state=state))
+
+
+async def prepare(router: ShardRouter, sources: dict[str, AsyncEngine] | None = None) -> list[Move]:
+    """
+    The prepare function marks the users found by plan_moves as pending, so that the routes keep using
+    their current database once the new shard map is deployed.
+
+    :param router: ShardRouter: The shards and the new ring
+    :param sources: dict[str, AsyncEngine]: The databases to look at, the shards by default
+    :return: The pending moves
+    """
+    moves = await plan_moves(router, sources)
+    for move in moves:
+        await set_move_state(router.engines[move.target], move, PENDING)
+    return moves
+
+
+async def move_user(move: Move, source: AsyncEngine, target: AsyncEngine, versions: ContactsVersion | None = None,
+                    batch_size: int = MOVE_BATCH_SIZE) -> Move:
+    """
+    The move_user function copies the contacts of a user, whose writes are blocked, to the target shard with
+    their ids, marks the move copied in the same transaction and then deletes the copied rows from the source.
+    A contact that clashes with one already on the target rolls the copy back and sets the move back to pending,
+    which unblocks the writes on the source.
+
+    :param move: Move: The user, the source and the target
+    :param source: AsyncEngine: The engine the contacts are on
+    :param target: AsyncEngine: The engine of the shard of the user
+    :param versions: ContactsVersion: The contacts versions to bump, so that clients drop their ETags
+    :param batch_size: int: Number of rows inserted or deleted at once
+    :return: The move with the number of moved rows or the error
+    """
+    table = Contact.__table__
+    async with source.connect() as src:
+        rows = [dict(row._mapping) for row in await src.execute(select(table).where(table.c.user_id == move.user_id))]
+    try:
+        async with target.begin() as dst:
+            await dst.execute(update(moves_table).where(moves_table.c.user_id == move.user_id)
+                              .values(state=COPIED))
+            for start in range(0, len(rows), batch_size):
+                await dst.execute(insert(table), rows[start:start + batch_size])
+    except IntegrityError as err:
+        move.error = str(err.orig)
+        await set_move_state(target, move, PENDING)
+        return move
+    if versions is not None:
+        await versions.bump(move.user_id)
+    ids = [row["id"] for row in rows]
+    async with source.begin() as src:
+        for start in range(0, len(ids), batch_size):
+            await src.execute(delete(table).where(table.c.user_id == move.user_id,
+                                                  table.c.id.in_(ids[start:start + batch_size])))
+    await set_move_state(target, move, None)
+    move.moved = len(rows)
+    return move
+
+
+async def finish_moves(router: ShardRouter, sources: dict[str, AsyncEngine]) -> None:
+    """
+    The finish_moves function completes the moves that an interrupted rebalance had already copied: their target
+    holds the contacts, so whatever is left of them on the source is deleted. Moves of users that have no contacts
+    left on the source are dropped as well.
+
+    :param router: ShardRouter: The shards and the ring
+    :param sources: dict[str, AsyncEngine]: The databases moves may come from
+    :return: None
+    """
+    table = Contact.__table__
+    for name, engine in router.engines.items():
+        async with engine.connect() as conn:
+            moves = (await conn.execute(select(moves_table))).all()
+        for user_id, source, state in moves:
+            if source not in sources:
+                continue
+            async with sources[source].begin() as src:
+                if state == COPIED:
+                    await src.execute(delete(table).where(table.c.user_id == user_id))
+                elif await src.scalar(select(table.c.id).where(table.c.user_id == user_id).limit(1)) is not None:
+                    continue
+            await set_move_state(engine, Move(user_id, source, name), None)
+
+
+async def rebalance(router: ShardRouter, sources: dict[str, AsyncEngine] | None = None,
+                    versions: ContactsVersion | None = None, settle: float = MOVE_SETTLE_SECONDS) -> list[Move]:
+    """
+    The rebalance function moves every user found by plan_moves to its shard. The writes of all of them
+    are blocked first; after settle seconds, when every worker has noticed and in-flight writes are done,
+    the users are copied one at a time. A write that takes longer than settle may be lost.
+
+    :param router: ShardRouter: The shards and the ring
+    :param sources: dict[str, AsyncEngine]: The databases to move from, the shards by default
+    :param versions: ContactsVersion: The contacts versions to bump for the moved users
+    :param settle: float: Seconds to wait between blocking the writes and copying
+    :return: The moves with their results
+    """
+    sources = sources or router.engines
+    await finish_moves(router, sources)
+    moves = await plan_moves(router, sources)
+    for move in moves:
+        await set_move_state(router.engines[move.target], move, COPYING)
+    if moves:
+        await asyncio.sleep(settle)
+    for move in moves:
+        await move_user(move, sources[move.source], router.engines[move.target], versions)
+    return moves
+
+
+async def count_contacts(engines: dict[str, AsyncEngine]) -> dict[str, int]:
+    counts = {}
+    for name, engine in engines.items():
+        async with engine.connect() as conn:
+            counts[name] = await conn.scalar(select(func.count()).select_from(Contact.__table__))
+    return counts
+
+
+def main() -> None:
+    from src.database.redis_pool import redis_pool
+    from src.services.cache import contacts_version
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["create-schema", "prepare", "plan", "rebalance"])
+    parser.add_argument("--include-primary", action="store_true",
+                        help="also move the contacts stored on the main database, when sharding is introduced")
+    parser.add_argument("--settle", type=float, default=MOVE_SETTLE_SECONDS,
+                        help="seconds between blocking the writes of the moving users and copying them")
+    args = parser.parse_args()
+    if shard_router is None:
+        parser.error("CONTACT_SHARDS is not set")
+
+    async def run():
+        sources = dict(shard_router.engines)
+        if args.include_primary:
+            sources = {PRIMARY: create_async_engine(settings.sqlalchemy_database_url), **sources}
+        try:
+            if args.command == "create-schema":
+                for engine in shard_router.engines.values():
+                    await create_shard_schema(engine)
+                size = settings.contact_shard_id_block
+                blocks = await assign_id_blocks(shard_router.engines, size)
+                for name in shard_router.engines:
+                    print(f"{name}: contacts tables ready"
+                          + (f", ids from {blocks[name] * size}" if name in blocks else ""))
+                return
+            if args.command == "rebalance":
+                contacts_version.connect(await redis_pool.connect())
+                moves = await rebalance(shard_router, sources, contacts_version, args.settle)
+            else:
+                moves = await (plan_moves if args.command == "plan" else prepare)(shard_router, sources)
+            for move in moves:
+                result = f"error: {move.error}" if move.error else f"{move.moved} contacts"
+                print(f"user {move.user_id}: {move.source} -> {move.target}"
+                      + (f" ({result})" if args.command == "rebalance" else ""))
+            if args.command == "rebalance":
+                print(f"{sum(move.error is None for move in moves)} of {len(moves)} users moved")
+            else:
+                print(f"{len(moves)} users to move" + (", marked pending" if args.command == "prepare" else ""))
+            for name, count in (await count_contacts(sources)).items():
+                print(f"{name}: {count} contacts")
+        finally:
+            for engine in sources.values():
+                await engine.dispose()
+            await redis_pool.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Slow query log.
+
+Statements that run longer than a threshold are kept in a bounded ring buffer together with their route,
+their duration and their bound parameters, in which everything but numbers is redacted, so names, emails and
+phone numbers never reach the log. Each slow statement is then explained in a background task on a separate
+connection: with EXPLAIN, or with EXPLAIN ANALYZE for a sampled share of SELECTs, which runs them once more.
+The buffer is served by the /slow-queries endpoint to the holder of SLOW_QUERY_ADMIN_TOKEN and can also be
+appended to a JSON lines file.
+"""
+import asyncio
+import contextvars
+import json
+import random
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.database.query_stats import current_stats, track_queries
+
+EXPLAINABLE = ("select", "insert", "update", "delete", "with")
+# Explaining puts extra load on the database, so a burst of slow statements is only partly explained
+MAX_RUNNING_EXPLAINS = 2
+
+
+@dataclass
+class SlowQuery:
+    statement: str
+    parameters: list | dict | None
+    rows: int
+    duration_ms: float
+    route: str | None
+    database: str | None
+    at: str
+    plan: list[str] | None = None
+    analyzed: bool = False
+    explain_error: str | None = None
+
+
+def redact(parameters):
+    """
+    The redact function keeps the numbers, booleans and None values of bound parameters (ids, limits, offsets)
+    and replaces every other value with its type name.
+
+    :param parameters: The parameters of a statement, or a single value
+    :return: The parameters with the values replaced
+    """
+    if isinstance(parameters, dict):
+        return {key: redact(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [redact(value) for value in parameters]
+    if parameters is None or isinstance(parameters, (bool, int, float)):
+        return parameters
+    return f"<{type(parameters).__name__}>"
+
+
+def explain_statement(dialect: str, statement: str, analyze: bool) -> str:
+    if dialect == "postgresql":
+        return f"EXPLAIN (ANALYZE, BUFFERS) {statement}" if analyze else f"EXPLAIN {statement}"
+    if dialect == "sqlite":
+        return f"EXPLAIN QUERY PLAN {statement}"
+    return f"EXPLAIN ANALYZE {statement}" if analyze else f"EXPLAIN {statement}"
+
+
+class SlowQueryLog:
+    """
+    Records the statements of an engine that are slower than threshold_ms, see the module docstring.
+    """
+
+    def __init__(self, threshold_ms: float, analyze_sample_rate: float = 0.0, size: int = 100,
+                 path: str | None = None):
+        self.threshold = threshold_ms / 1000
+        self.analyze_sample_rate = analyze_sample_rate
+        self.entries: deque[SlowQuery] = deque(maxlen=size)
+        self.path = path
+        self.engines: dict = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._running_explains = 0
+
+    def install(self, engine: AsyncEngine) -> None:
+        """
+        The install function starts recording the slow statements of an engine. It may be called
+        for several engines, e.g. the primary and its replicas.
+
+        :param engine: AsyncEngine: The engine to watch, which also runs the EXPLAIN statements
+        :return: None
+        """
+        self.engines[engine.sync_engine] = engine
+        track_queries(engine)
+        event.listen(engine.sync_engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def snapshot(self) -> list[dict]:
+        """
+        The snapshot function returns the recorded statements, newest first.
+
+        :return: A list of dictionaries
+        """
+        return [asdict(entry) for entry in reversed(self.entries)]
+
+    async def wait(self) -> None:
+        """
+        The wait function waits until the pending EXPLAIN statements and file writes are done.
+
+        :return: None
+        """
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - context.query_start
+        if duration < self.threshold or not context.execution_options.get("slow_query_log", True):
+            return
+        stats = current_stats.get()
+        route = stats.scope.get("route") if stats is not None and stats.scope is not None else None
+        first = parameters[0] if executemany and parameters else parameters
+        entry = SlowQuery(statement=statement, parameters=redact(first),
+                          rows=len(parameters) if executemany else 1, duration_ms=round(duration * 1000, 3),
+                          route=route.path if route is not None else None,
+                          database=getattr(conn.engine.pool, "label", None),
+                          at=datetime.now(timezone.utc).isoformat())
+        self.entries.append(entry)
+
+        explain = (statement.lstrip()[:6].lower().startswith(EXPLAINABLE)
+                   and self._running_explains < MAX_RUNNING_EXPLAINS)
+        if not explain and self.path is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # A statement of a synchronous engine (e.g. a migration): nothing to explain it with
+            if self.path is not None:
+                self._append(entry)
+            return
+        if explain:
+            self._running_explains += 1
+        # A fresh context, so the EXPLAIN is not counted as a statement of the request
+        task = loop.create_task(self._complete(entry, self.engines[conn.engine], statement, first, explain),
+                                context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _complete(self, entry: SlowQuery, engine: AsyncEngine, statement: str, parameters,
+                        explain: bool) -> None:
+        if explain:
+            try:
+                await self._explain(entry, engine, statement, parameters)
+            except Exception as err:
+                entry.explain_error = str(err)
+            finally:
+                self._running_explains -= 1
+        if self.path is not None:
+            await asyncio.to_thread(self._append, entry)
+
+    async def _explain(self, entry: SlowQuery, engine: AsyncEngine, statement: str, parameters) -> None:
+        dialect = engine.dialect.name
+        analyze = (statement.lstrip()[:6].lower() == "select" and dialect != "sqlite"
+                   and random.random() < self.analyze_sample_rate)
+        # A list would be taken for several parameter sets
+        if isinstance(parameters, list):
+            parameters = tuple(parameters)
+        async with engine.connect() as conn:
+            await conn.execution_options(slow_query_log=False)
+            result = await conn.exec_driver_sql(explain_statement(dialect, statement, analyze), parameters)
+            entry.plan = [str(row[-1]) for row in result]
+            entry.analyzed = analyze
+            await conn.rollback()
+
+    def _append(self, entry: SlowQuery) -> None:
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(asdict(entry), ensure_ascii=False) + "\n")
@@ -1,148 +1,393 @@
+import base64
+import binascii
+from calendar import isleap
 from datetime import date, timedelta
-from typing import List, Type
-from sqlalchemy import String, and_, extract, func, or_
+from typing import AsyncIterator, List, Type
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.models import Contact, User
-from src.schemas import ContactModel, ContactUpdate
+from src.config import messages
+from src.database.models import Contact, User, to_birthday_key
+from src.schemas import ContactBatchOperation, ContactModel, ContactPatch, ContactUpdate
+from src.services.cache import contacts_version
 
 
-async def get_contacts(skip: int, limit: int, user: User, db: Session) -> List[Contact]:
+def encode_cursor(contact_id: int) -> str:
+    """
+    The encode_cursor function turns the id of the last contact on a page into an opaque pagination cursor.
+
+    :param contact_id: int: Specify the id of the last contact returned
+    :return: A url-safe cursor string
+    """
+    return base64.urlsafe_b64encode(str(contact_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    The decode_cursor function turns an opaque pagination cursor back into the id of the last contact seen.
+
+    :param cursor: str: Pass the cursor received from a previous page
+    :return: The id of the last contact seen
+    :raises ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+async def get_contacts(skip: int, limit: int, user: User, db: AsyncSession, after: int | None = None) -> List[Contact]:
     """
     The get_contacts function retrieves contacts based on the provided skip, limit, user, and database session parameters.
+    Contacts are ordered by id. When after is given, the page starts right after that id (keyset pagination),
+    so deep pages cost the same as the first one and skip is ignored.
 
     :param skip: int: Indicate the number of records to skip
     :param limit: int: Limit the number of records that are returned
     :param user: User: Specify the user whose contacts are being retrieved
-    :param db: Session: Create a database session object
+    :param db: AsyncSession: Create a database session object
+    :param after: int | None: Specify the id of the last contact of the previous page
     :return: A list of contact objects that match the criteria specified
     """
-    return db.query(Contact).filter(Contact.user_id == user.id).offset(skip).limit(limit).all()
+    stmt = select(Contact).filter(Contact.user_id == user.id)
+    if after is not None:
+        stmt = stmt.filter(Contact.id > after)
+    else:
+        stmt = stmt.offset(skip)
+    stmt = stmt.order_by(Contact.id).limit(limit)
+    contacts = await db.execute(stmt)
+    return contacts.scalars().all()
 
 
-async def get_contact(contact_id: int, user: User, db: Session) -> Type[Contact] | None:
+async def get_contact(contact_id: int, user: User, db: AsyncSession) -> Type[Contact] | None:
     """
     The get_contact function retrieves a contact from the database based on the provided contact ID, user, and database session.
 
     :param contact_id: int: Specify the id of the contact to retrieve
     :param user: User: Ensure that the contact is associated with the user
-    :param db: Session: Execute the query
+    :param db: AsyncSession: Execute the query
     :return: A contact object or none
     """
-    return db.query(Contact).filter(and_(Contact.id == contact_id), Contact.user_id == user.id).first()
+    stmt = select(Contact).filter(and_(Contact.id == contact_id), Contact.user_id == user.id)
+    contact = await db.execute(stmt)
+    return contact.scalar_one_or_none()
 
 
-async def get_contacts_first_name(first_name: str, user: User, db: Session) -> list[Type[Contact]]:
+async def get_contacts_first_name(first_name: str, user: User, db: AsyncSession) -> list[Type[Contact]]:
     """
     The get_contacts_first_name function retrieves contacts by first name for a specific user from the database.
 
     :param first_name: str: Specify the first name to search for in contacts
     :param user: User: Retrieve contacts for a specific user
-    :param db: Session: Pass the database session object to the function
+    :param db: AsyncSession: Pass the database session object to the function
     :return: A list of contact objects
     """
-    return db.query(Contact).filter(and_(Contact.first_name.like(f'%{first_name}%'), Contact.user_id == user.id)).all()
+    stmt = select(Contact).filter(and_(Contact.first_name.like(f'%{first_name}%'), Contact.user_id == user.id))
+    contacts = await db.execute(stmt)
+    return contacts.scalars().all()
 
 
-async def get_contacts_last_name(last_name: str, user: User, db: Session) -> list[Type[Contact]]:
+async def get_contacts_last_name(last_name: str, user: User, db: AsyncSession) -> list[Type[Contact]]:
     """
     The get_contacts_last_name function asynchronously retrieves a list of contacts with a specific last name for the given user.
 
     :param last_name: str: Specify the last name to search for
     :param user: User: Pass in the user object
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A list of contact objects which have the specified last name
     """
-    return db.query(Contact).filter(and_(Contact.last_name.like(f'%{last_name}%'), Contact.user_id == user.id)).all()
+    stmt = select(Contact).filter(and_(Contact.last_name.like(f'%{last_name}%'), Contact.user_id == user.id))
+    contacts = await db.execute(stmt)
+    return contacts.scalars().all()
 
 
-async def get_contacts_email(email_part: str, user: User, db: Session) -> list[Type[Contact]]:
+async def get_contacts_email(email_part: str, user: User, db: AsyncSession) -> list[Type[Contact]]:
     """
     The get_contacts_email function retrieves contacts with emails containing a specific part, belonging to a user.
 
     :param email_part: str: Specify the part of the email to search for
     :param user: User: Filter the contacts by user
-    :param db: Session: Create a database session
+    :param db: AsyncSession: Create a database session
     :return: A list of contact objects that match the search criteria
     """
-    return db.query(Contact).filter(and_(Contact.email.like(f'%{email_part}%'), Contact.user_id == user.id)).all()
+    stmt = select(Contact).filter(and_(Contact.email.like(f'%{email_part}%'), Contact.user_id == user.id))
+    contacts = await db.execute(stmt)
+    return contacts.scalars().all()
 
 
-async def get_contacts_birthday(user: User, db: Session) -> list[Type[Contact]]:
+async def get_contacts_birthday(user: User, db: AsyncSession, days: int = 7) -> list[Type[Contact]]:
     """
-    The get_contacts_birthday function retrieves a list of contacts whose birthday is within the next 7 days for a given user.
+    The get_contacts_birthday function retrieves a list of contacts whose birthday is within the next days days
+    (today included) for a given user.
+    The window is a range scan over the indexed birthday_key (month*100+day); a window that crosses
+    the new year is split into the end of December and the beginning of January. In a year without
+    February 29 those birthdays are counted on the day after February 28, so they are in every window
+    that holds both February 28 and March 1. A window of a year or more returns every contact.
 
     :param user: User: Specify the user for whom to retrieve contacts
-    :param db: Session: Pass the database session to the function
-    :return: A list of contact objects whose birthday is within the next 7 days
+    :param db: AsyncSession: Pass the database session to the function
+    :param days: int: Specify the size of the window in days
+    :return: A list of contact objects whose birthday is within the window
     """
-    days = []
-    for i in range(7):
-        day = date.today() + timedelta(days=i)
-        days.append(str(day.day) + str(day.month))
+    stmt = select(Contact).filter(Contact.user_id == user.id)
+    if days < 365:
+        start = date.today()
+        end = start + timedelta(days=days - 1)
+        start_key, end_key = to_birthday_key(start), to_birthday_key(end)
+        if start_key <= end_key:
+            window = Contact.birthday_key.between(start_key, end_key)
+        else:
+            window = or_(Contact.birthday_key >= start_key, Contact.birthday_key <= end_key)
+        if any(not isleap(year) and start <= start.replace(year=year, month=2, day=28)
+               and start.replace(year=year, month=3, day=1) <= end
+               for year in {start.year, end.year}):
+            window = or_(window, Contact.birthday_key == 229)
+        stmt = stmt.filter(window)
+    contacts = await db.execute(stmt)
+    return contacts.scalars().all()
 
-    contacts = db.query(Contact).filter(and_(
-        or_(func.concat(
-            extract('day', Contact.born_date).cast(String),
-            extract('month', Contact.born_date).cast(String)
-        ).in_(days))), Contact.user_id == user.id).all()
-    return contacts
 
+async def stream_contacts(user: User, db: AsyncSession, batch_size: int = 1000) -> AsyncIterator[list]:
+    """
+    The stream_contacts function reads all contacts of a user through a server-side cursor.
+    Rows are fetched batch_size at a time, so memory stays constant regardless of the size of the address book.
 
-async def create_contact(body: ContactModel, user: User, db: Session) -> Contact:
+    :param user: User: Specify the user whose contacts are exported
+    :param db: AsyncSession: Pass the database session to the function
+    :param batch_size: int: Specify how many rows are fetched per round trip
+    :return: An async iterator of lists of rows with the public contact fields
+    """
+    stmt = select(Contact.id, Contact.first_name, Contact.last_name, Contact.email, Contact.phone_number,
+                  Contact.born_date, Contact.description).filter(Contact.user_id == user.id) \
+        .order_by(Contact.id).execution_options(yield_per=batch_size)
+    result = await db.stream(stmt)
+    async for partition in result.partitions():
+        yield partition
+
+
+async def create_contact(body: ContactModel, user: User, db: AsyncSession) -> Contact:
     """
     The create_contact function creates a new contact in the database.
 
     :param body: ContactModel: Get the data from the request body
     :param user: User: Get the user id of the contact
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A contact object
     """
     contact = Contact(first_name=body.first_name, last_name=body.last_name, email=body.email,
                       phone_number=body.phone_number, born_date=body.born_date,
                       description=body.description, user_id=user.id)
     db.add(contact)
-    db.commit()
-    db.refresh(contact)
+    await db.commit()
+    await contacts_version.bump(user.id)
+    await db.refresh(contact)
     return contact
 
 
-async def remove_contact(contact_id: int, user: User, db: Session) -> Contact | None:
+async def insert_contacts(bodies: list[ContactModel], user: User,
+                          db: AsyncSession) -> tuple[list[int | None], list[str | None]]:
+    """
+    The insert_contacts function inserts a batch of contacts with a single multi-row INSERT ... RETURNING
+    without committing. Rows that duplicate an email or phone number of the same user, either within the batch
+    or in the database, are skipped. If the INSERT still hits a unique constraint (e.g. a concurrent write), the batch is retried
+    row by row inside savepoints, so one bad row never aborts the others.
+
+    :param bodies: list[ContactModel]: Pass the validated contacts to create
+    :param user: User: Get the user id of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The id of every created contact and the error message of every rejected one, in the order of bodies
+    """
+    ids: list[int | None] = [None] * len(bodies)
+    errors: list[str | None] = [None] * len(bodies)
+    stmt = select(Contact.email, Contact.phone_number).filter(
+        Contact.user_id == user.id,
+        or_(Contact.email.in_({body.email for body in bodies}),
+            Contact.phone_number.in_({body.phone_number for body in bodies})))
+    existing = await db.execute(stmt)
+    emails, phones = set(), set()
+    for email, phone_number in existing:
+        emails.add(email)
+        phones.add(phone_number)
+
+    rows = []
+    for index, body in enumerate(bodies):
+        if body.email in emails:
+            errors[index] = messages.DUPLICATE_EMAIL
+        elif body.phone_number in phones:
+            errors[index] = messages.DUPLICATE_PHONE
+        else:
+            rows.append((index, dict(first_name=body.first_name, last_name=body.last_name, email=body.email,
+                                     phone_number=body.phone_number, born_date=body.born_date,
+                                     birthday_key=to_birthday_key(body.born_date),
+                                     description=body.description, user_id=user.id)))
+        emails.add(body.email)
+        phones.add(body.phone_number)
+
+    if rows:
+        stmt = insert(Contact).returning(Contact.id, sort_by_parameter_order=True)
+        try:
+            async with db.begin_nested():
+                created = await db.execute(stmt, [values for _, values in rows])
+                for (index, _), contact_id in zip(rows, created.scalars().all()):
+                    ids[index] = contact_id
+        except IntegrityError:
+            for index, values in rows:
+                try:
+                    async with db.begin_nested():
+                        created = await db.execute(stmt, [values])
+                        ids[index] = created.scalar_one()
+                except IntegrityError:
+                    errors[index] = messages.CONTACT_CONFLICT
+    return ids, errors
+
+
+async def create_contacts(bodies: list[ContactModel], user: User, db: AsyncSession) -> list[str | None]:
+    """
+    The create_contacts function inserts a batch of contacts with insert_contacts and commits it.
+
+    :param bodies: list[ContactModel]: Pass the validated contacts to create
+    :param user: User: Get the user id of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A list with an error message for every rejected contact and none for every created one
+    """
+    _, errors = await insert_contacts(bodies, user, db)
+    await db.commit()
+    await contacts_version.bump(user.id)
+    return errors
+
+
+async def batch_contacts(operations: list[ContactBatchOperation], user: User, db: AsyncSession) -> list[dict]:
+    """
+    The batch_contacts function applies a list of create, update and delete operations in one transaction.
+    The contacts targeted by updates and deletes are checked with one SELECT, then all deletes run as one DELETE,
+    all updates as one executemany UPDATE and all creates as one multi-row INSERT, followed by a single commit.
+    Deletes run first and creates last, so values freed by a delete or an update can be reused in the same batch.
+    Operations that target a missing contact or conflict with another contact are reported and skipped.
+
+    :param operations: list[ContactBatchOperation]: Pass the operations in the order the client made them
+    :param user: User: Get the owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A list with the index, status, id and detail of every operation
+    """
+    results = [{"index": index, "status": 200, "id": getattr(operation, "id", None), "detail": None}
+               for index, operation in enumerate(operations)]
+    targets = {operation.id for operation in operations if operation.op != "create"}
+    owned = set()
+    if targets:
+        stmt = select(Contact.id).filter(Contact.user_id == user.id, Contact.id.in_(targets))
+        owned = set((await db.execute(stmt)).scalars().all())
+
+    deleted, updates, creates = set(), [], []
+    for index, operation in enumerate(operations):
+        if operation.op == "create":
+            creates.append(index)
+        elif operation.id not in owned or operation.id in deleted:
+            results[index].update(status=404, detail=messages.CONTACT_NOT_FOUND)
+        elif operation.op == "delete":
+            deleted.add(operation.id)
+        else:
+            updates.append(index)
+    # An update followed by a delete of the same contact is superseded by the delete
+    updates = [index for index in updates if operations[index].id not in deleted]
+
+    if deleted:
+        stmt = delete(Contact).filter(Contact.user_id == user.id, Contact.id.in_(deleted))
+        await db.execute(stmt.execution_options(synchronize_session=False))
+
+    if updates:
+        values = [dict(id=operations[index].id, **operations[index].data.model_dump(),
+                       birthday_key=to_birthday_key(operations[index].data.born_date)) for index in updates]
+        try:
+            async with db.begin_nested():
+                await db.execute(update(Contact), values)
+        except IntegrityError:
+            for index, row in zip(updates, values):
+                try:
+                    async with db.begin_nested():
+                        await db.execute(update(Contact), [row])
+                except IntegrityError:
+                    results[index].update(status=409, detail=messages.CONTACT_CONFLICT)
+
+    if creates:
+        ids, errors = await insert_contacts([operations[index].data for index in creates], user, db)
+        for index, contact_id, error in zip(creates, ids, errors):
+            if error is None:
+                results[index].update(status=201, id=contact_id)
+            else:
+                results[index].update(status=409, detail=error)
+
+    await db.commit()
+    await contacts_version.bump(user.id)
+    return results
+
+
+async def remove_contact(contact_id: int, user: User, db: AsyncSession) -> Contact | None:
     """
     The remove_contact function removes a contact from the database.
+    Where the dialect supports it, a single DELETE ... RETURNING both deletes the contact and reads it back;
+    otherwise the contact is selected first.
 
     :param contact_id: int: Specify the id of the contact to be updated
     :param user: User: Get the user object from the database
-    :param db: Session: Pass the database session object to the function
+    :param db: AsyncSession: Pass the database session object to the function
     :return: The removed contact object if it exists, otherwise none
     """
-    contact = db.query(Contact).filter(
-        and_(Contact.id == contact_id), Contact.user_id == user.id).first()
+    # db.bind is the primary engine; get_bind() without a statement may choose a replica
+    if db.bind.dialect.delete_returning:
+        stmt = delete(Contact).filter(Contact.id == contact_id, Contact.user_id == user.id).returning(Contact)
+        contact = await db.execute(stmt.execution_options(synchronize_session=False))
+        contact = contact.scalar_one_or_none()
+        if contact:
+            await db.commit()
+            await contacts_version.bump(user.id)
+        return contact
+    stmt = select(Contact).filter(and_(Contact.id == contact_id), Contact.user_id == user.id)
+    contact = await db.execute(stmt)
+    contact = contact.scalar_one_or_none()
     if contact:
-        db.delete(contact)
-        db.commit()
+        await db.delete(contact)
+        await db.commit()
+        await contacts_version.bump(user.id)
     return contact
 
 
-async def update_contact(contact_id: int, body: ContactUpdate, user: User, db: Session) -> Contact | None:
+async def update_contact(contact_id: int, body: ContactUpdate | ContactPatch, user: User,
+                         db: AsyncSession) -> Contact | None:
     """
     The update_contact function updates a contact in the database.
+    Only the fields set in the body are written, so a ContactPatch updates just the fields it was sent.
+    Where the dialect supports it, a single UPDATE ... RETURNING both updates the contact and reads it back;
+    otherwise the contact is selected first and updated through the ORM.
 
     :param contact_id: int: Specify the id of the contact to update
-    :param body: ContactUpdate: Pass in the new information for the contact
+    :param body: ContactUpdate | ContactPatch: Pass in the new information for the contact
     :param user: User: Ensure that the user performing the update is authorized to do so
-    :param db: Session: Pass the database connection to the function
+    :param db: AsyncSession: Pass the database connection to the function
     :return: The updated contact object or none if the contact was not found
     """
-    contact = db.query(Contact).filter(
-        and_(Contact.id == contact_id), Contact.user_id == user.id).first()
+    values = body.model_dump(exclude_unset=True)
+    if not values:
+        return await get_contact(contact_id, user, db)
+    if db.bind.dialect.update_returning:
+        if "born_date" in values:
+            values["birthday_key"] = to_birthday_key(values["born_date"])
+        stmt = update(Contact).filter(Contact.id == contact_id, Contact.user_id == user.id) \
+            .values(**values).returning(Contact)
+        contact = await db.execute(stmt.execution_options(synchronize_session=False))
+        contact = contact.scalar_one_or_none()
+        if contact:
+            await db.commit()
+            await contacts_version.bump(user.id)
+        return contact
+    stmt = select(Contact).filter(and_(Contact.id == contact_id), Contact.user_id == user.id)
+    contact = await db.execute(stmt)
+    contact = contact.scalar_one_or_none()
     if contact:
-        contact.first_name = body.first_name
-        contact.last_name = body.last_name
-        contact.email = body.email
-        contact.phone_number = body.phone_number
-        contact.born_date = body.born_date
-        contact.description = body.description
-        db.commit()
-    return contact
\ No newline at end of file
+        for field, value in values.items():
+            setattr(contact, field, value)
+        await db.commit()
+        await contacts_version.bump(user.id)
+    return contact
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, HTTPException, Depends, status, Request, Security, BackgroundTasks
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.config import messages
 from src.database.db import get_db
+from src.database.routing import use_primary
 from src.schemas import UserModel, UserResponse, TokenModel, RequestEmail
 from src.repository import users as repository_users
 from src.services.auth import auth_service
@@ -14,33 +15,34 @@ security = HTTPBearer()
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: AsyncSession = Depends(get_db)):
     """
     The signup function creates a new user account.
 
     :param body: UserModel: Get the user data to be created
     :param background_tasks: BackgroundTasks: Execute the send_email function asynchronously
     :param request: Request: Get the base url of the application
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: A dictionary
     """
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT,
                             detail=messages.ACCOUNT_EXIST)
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash(body.password)
     new_user = await repository_users.create_user(body, db)
     background_tasks.add_task(send_email, new_user.email, new_user.username, str(request.base_url))
     return {"user": new_user, "detail": "User successfully created"}
 
 
 @router.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """
     The login function authenticates a user and returns access and refresh tokens.
+    A password hash made with an outdated scheme or cost is transparently replaced with a fresh one.
 
     :param body: OAuth2PasswordRequestForm: Validate the request body
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A tokenmodel object
     """
     user = await repository_users.get_user_by_email(body.username, db)
@@ -50,9 +52,12 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
     if not user.confirmed:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.EMAIL_NOT_CONFIRM)
-    if not auth_service.verify_password(body.password, user.password):
+    if not await auth_service.verify_password(body.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.INVALID_PASSWORD)
+    if auth_service.password_needs_update(user.password):
+        new_password = await auth_service.get_password_hash(body.password)
+        await repository_users.update_password(user, new_password, db)
     # Generate JWT
     access_token = await auth_service.create_access_token(data={"sub": user.email})
     refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
@@ -61,16 +66,18 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
 
 
 @router.get('/refresh_token', response_model=TokenModel)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: AsyncSession = Depends(get_db)):
     """
     The refresh_token function is used to refresh the access token using the refresh token.
 
     :param credentials: HTTPAuthorizationCredentials: Get the credentials from the request
-    :param db: Session: Connect to the database
+    :param db: AsyncSession: Connect to the database
     :return: A dictionary of the access token, refresh token and bearer
     """
     token = credentials.credentials
     email = await auth_service.decode_refresh_token(token)
+    # The stored token was rotated by the last login or refresh, which a replica may not have yet
+    use_primary(db)
     user = await repository_users.get_user_by_email(email, db)
     if user.refresh_token != token:
         await repository_users.update_token(user, None, db)
@@ -84,14 +91,14 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(sec
 
 
 @router.get('/confirmed_email/{token}')
-async def confirmed_email(token: str, db: Session = Depends(get_db)):
+async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     """
     The confirmed_email function is an endpoint for confirming the user's email address using the provided token.
     It retrieves the email from the token, checks if the user exists, and if the email is already confirmed.
     If it finds that a user with that email does not exist or has already been confirmed, it raises an HTTPException with a status code of 400 and an error detail message.
 
     :param token: str: Retrieve the email from the token
-    :param db: Session: Pass in the database session
+    :param db: AsyncSession: Pass in the database session
     :return: A success message if the user's email is already confirmed
     """
     email = await auth_service.get_email_from_token(token)
@@ -107,14 +114,14 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
 
 @router.post('/request_email')
 async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: Session = Depends(get_db)):
+                        db: AsyncSession = Depends(get_db)):
     """
     The request_email function is used to request an email for confirming a user's account.
 
     :param body: RequestEmail: Pass in the request body
     :param background_tasks: BackgroundTasks: Run background tasks
     :param request: Request: Get the base url of the request
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A dictionary containing a message indicating the status of the email request
     """
     user = await repository_users.get_user_by_email(body.email, db)
@@ -1,45 +1,84 @@
-from typing import List
+from typing import List, Literal
 
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, status, Request, Response, Query
+from fastapi.responses import StreamingResponse
 from fastapi_limiter.depends import RateLimiter
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from src.config import messages
-from src.database.db import get_db
+from src.database.sharding import get_contacts_db, get_contacts_session_factory
 from src.database.models import User
-from src.schemas import ContactModel, ContactUpdate, ContactResponse
+from src.schemas import (ContactModel, ContactUpdate, ContactPatch, ContactResponse, ContactImportResponse,
+                         ContactBatchRequest, ContactBatchResponse)
 from src.repository import contacts as repository_contacts
 from src.routes.auth import auth_service
+from src.services import contacts_io
+from src.services.etag import ContactsETag
 
 router = APIRouter(prefix='/contacts', tags=["contacts"])
 
 
 @router.get("/", response_model=List[ContactResponse], description=messages.NO_MORE_THAN,
-            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def get_contacts(skip: int = 0, limit: int = 100,
-                       current_user: User = Depends(auth_service.get_current_user), db: Session = Depends(get_db)):
+            dependencies=[Depends(RateLimiter(times=10, seconds=60)), Depends(ContactsETag())])
+async def get_contacts(response: Response, skip: int = 0, limit: int = 100, after: str | None = None,
+                       current_user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_contacts_db)):
     """
     The get_contacts function retrieves a list of contacts.
+    Like the other reads, the response carries an ETag; a request with a matching If-None-Match gets 304.
+    If the page is full, the cursor of the next page is returned in the X-Next-Cursor header;
+    pass it back as the after parameter to fetch the next page without skipping rows in the database.
 
+    :param response: Response: Set the X-Next-Cursor header
     :param skip: int: Determine how many records to skip
     :param limit: int: Limit the number of contacts returned
+    :param after: str | None: Pass the cursor of the next page
     :param current_user: User: Get the currently authenticated user
-    :param db: Session: Pass the database session to the repository layer
+    :param db: AsyncSession: Pass the database session to the repository layer
     :return: A list of contactresponse objects
     """
-    contacts = await repository_contacts.get_contacts(skip, limit, current_user, db)
+    last_id = None
+    if after is not None:
+        try:
+            last_id = repository_contacts.decode_cursor(after)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=messages.INVALID_CURSOR)
+    contacts = await repository_contacts.get_contacts(skip, limit, current_user, db, after=last_id)
+    if contacts and len(contacts) == limit:
+        response.headers["X-Next-Cursor"] = repository_contacts.encode_cursor(contacts[-1].id)
     return contacts
 
 
-@router.get("/{contact_id}", response_model=ContactResponse, description=messages.NO_MORE_THAN,
+@router.get("/export", response_class=StreamingResponse, description=messages.NO_MORE_THAN,
             dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def get_contact(contact_id: int, db: Session = Depends(get_db),
+async def export_contacts(export_format: Literal["ndjson", "csv"] = Query(default="ndjson", alias="format"),
+                          current_user: User = Depends(auth_service.get_current_user),
+                          session_factory: async_sessionmaker = Depends(get_contacts_session_factory)):
+    """
+    The export_contacts function streams all contacts of the current user as NDJSON or CSV.
+    Rows are read from a server-side cursor and written to the response as they arrive,
+    so neither the database driver nor the application buffers the whole address book.
+
+    :param export_format: Literal[&quot;ndjson&quot;, &quot;csv&quot;]: Specify the format of the export
+    :param current_user: User: Get the currently authenticated user
+    :param session_factory: async_sessionmaker: Open the database session used while streaming
+    :return: A streaming response with the contacts
+    """
+    media_type = contacts_io.CSV_MEDIA_TYPE if export_format == "csv" else contacts_io.NDJSON_MEDIA_TYPE
+    return StreamingResponse(contacts_io.export_contacts(media_type, current_user, session_factory),
+                             media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="contacts.{export_format}"'})
+
+
+@router.get("/{contact_id}", response_model=ContactResponse, description=messages.NO_MORE_THAN,
+            dependencies=[Depends(RateLimiter(times=10, seconds=60)), Depends(ContactsETag())])
+async def get_contact(contact_id: int, db: AsyncSession = Depends(get_contacts_db),
                       current_user: User = Depends(auth_service.get_current_user)):
     """
     The get_contact function retrieves a contact from the database by its ID.
 
     :param contact_id: int: Specify the id of the contact to retrieve
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :param current_user: User: Ensure that the user making the request is authorized to do so
     :return: A contactresponse object
     """
@@ -51,8 +90,8 @@ async def get_contact(contact_id: int, db: Session = Depends(get_db),
 
 
 @router.get("/search/first_name", response_model=List[ContactResponse], description=messages.NO_MORE_THAN,
-            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def get_contacts_first_name(first_name: str, db: Session = Depends(get_db),
+            dependencies=[Depends(RateLimiter(times=10, seconds=60)), Depends(ContactsETag())])
+async def get_contacts_first_name(first_name: str, db: AsyncSession = Depends(get_contacts_db),
                                   current_user: User = Depends(auth_service.get_current_user)):
     """
     The get_contacts_first_name function retrieves contacts from the database based on the provided first name. It uses
@@ -61,7 +100,7 @@ async def get_contacts_first_name(first_name: str, db: Session = Depends(get_db)
     found&quot;.
 
     :param first_name: str: Specify the first name of the contacts to search for
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :param current_user: User: Get the current user
     :return: A list of contacts matching the given first name
     """
@@ -73,14 +112,14 @@ async def get_contacts_first_name(first_name: str, db: Session = Depends(get_db)
 
 
 @router.get("/search/last_name", response_model=List[ContactResponse], description=messages.NO_MORE_THAN,
-            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def get_contacts_last_name(last_name: str, db: Session = Depends(get_db),
+            dependencies=[Depends(RateLimiter(times=10, seconds=60)), Depends(ContactsETag())])
+async def get_contacts_last_name(last_name: str, db: AsyncSession = Depends(get_contacts_db),
                                  current_user: User = Depends(auth_service.get_current_user)):
     """
     The get_contacts_last_name function is used to get contacts by last name.
 
     :param last_name: str: Get contacts by last name
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the current user
     :return: A list of contacts with the given last name
     """
@@ -92,14 +131,14 @@ async def get_contacts_last_name(last_name: str, db: Session = Depends(get_db),
 
 
 @router.get("/search/email", response_model=List[ContactResponse], description=messages.NO_MORE_THAN,
-            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def get_contacts_email(email: str, db: Session = Depends(get_db),
+            dependencies=[Depends(RateLimiter(times=10, seconds=60)), Depends(ContactsETag())])
+async def get_contacts_email(email: str, db: AsyncSession = Depends(get_contacts_db),
                              current_user: User = Depends(auth_service.get_current_user)):
     """
     The get_contacts_email function retrieves contacts by email address.
 
     :param email: str: Specify the email address of the contact
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :param current_user: User: Get the current authenticated user
     :return: A list of contactresponse objects representing the contacts with the specified email
     """
@@ -112,17 +151,18 @@ async def get_contacts_email(email: str, db: Session = Depends(get_db),
 
 @router.get("/search/birthdays", response_model=List[ContactResponse],
             description=messages.NO_MORE_THAN,
-            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def get_birthdays(db: Session = Depends(get_db),
+            dependencies=[Depends(RateLimiter(times=10, seconds=60)), Depends(ContactsETag(daily=True))])
+async def get_birthdays(days: int = Query(default=7, ge=1, le=366), db: AsyncSession = Depends(get_contacts_db),
                         current_user: User = Depends(auth_service.get_current_user)):
     """
-    The get_birthdays function retrieves the birthdays of contacts.
+    The get_birthdays function retrieves the contacts whose birthday is within the next days days.
 
-    :param db: Session: Pass the database session to the function
+    :param days: int: Specify the size of the window in days, today included
+    :param db: AsyncSession: Pass the database session to the function
     :param current_user: User: Retrieve the current user
     :return: A list of contact responses
     """
-    contacts = await repository_contacts.get_contacts_birthday(current_user, db)
+    contacts = await repository_contacts.get_contacts_birthday(current_user, db, days)
     if not contacts:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail=messages.CONTACT_NOT_FOUND)
@@ -132,29 +172,87 @@ async def get_birthdays(db: Session = Depends(get_db),
 @router.post("/", response_model=ContactResponse, status_code=status.HTTP_201_CREATED,
              description=messages.NO_MORE_THAN,
              dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def create_contact(body: ContactModel, db: Session = Depends(get_db),
+async def create_contact(body: ContactModel, db: AsyncSession = Depends(get_contacts_db),
                          current_user: User = Depends(auth_service.get_current_user)):
     """
     The create_contact function creates a new contact.
 
     :param body: ContactModel: Pass the contact data to be created
-    :param db: Session: Pass the database session dependency
+    :param db: AsyncSession: Pass the database session dependency
     :param current_user: User: Get the currently authenticated user
     :return: A contactresponse
     """
     return await repository_contacts.create_contact(body, current_user, db)
 
 
+@router.post("/import", response_model=ContactImportResponse, description=messages.NO_MORE_THAN,
+             dependencies=[Depends(RateLimiter(times=10, seconds=60))])
+async def import_contacts(request: Request, db: AsyncSession = Depends(get_contacts_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The import_contacts function bulk-loads contacts from a CSV (text/csv) or NDJSON (application/x-ndjson) body.
+    The body is parsed while it is being uploaded and inserted in batches; rows that fail validation
+    or duplicate an existing email or phone number are reported by their 1-based row number.
+
+    :param request: Request: Read the body stream and its content type
+    :param db: AsyncSession: Pass the database session to the function
+    :param current_user: User: Get the currently authenticated user
+    :return: The number of created contacts and the per-row errors
+    """
+    media_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if media_type not in (contacts_io.CSV_MEDIA_TYPE, contacts_io.NDJSON_MEDIA_TYPE):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=messages.UNSUPPORTED_IMPORT_FORMAT)
+    return await contacts_io.import_contacts(request.stream(), media_type, current_user, db)
+
+
+@router.post("/batch", response_model=ContactBatchResponse, description=messages.NO_MORE_THAN,
+             dependencies=[Depends(RateLimiter(times=10, seconds=60))])
+async def batch_contacts(body: ContactBatchRequest, db: AsyncSession = Depends(get_contacts_db),
+                         current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The batch_contacts function applies up to 1000 create, update and delete operations in a single transaction.
+    The whole batch counts as one request toward the rate limit.
+    Every operation gets its own result: 201 with the new id, 200, 404 for a missing contact or 409 for a conflict.
+
+    :param body: ContactBatchRequest: Pass the list of operations
+    :param db: AsyncSession: Pass the database session to the function
+    :param current_user: User: Get the currently authenticated user
+    :return: The per-operation results in the order of the operations
+    """
+    return {"results": await repository_contacts.batch_contacts(body.operations, current_user, db)}
+
+
 @router.put("/{contact_id}", response_model=ContactResponse, description=messages.NO_MORE_THAN,
             dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def update_contact(body: ContactUpdate, contact_id: int, db: Session = Depends(get_db),
+async def update_contact(body: ContactUpdate, contact_id: int, db: AsyncSession = Depends(get_contacts_db),
                          current_user: User = Depends(auth_service.get_current_user)):
     """
     The update_contact function updates a contact with the given contact_id using the provided ContactUpdate body.
 
     :param body: ContactUpdate: Pass the updated contact information to the function
     :param contact_id: int: Identify the contact to be deleted
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
+    :param current_user: User: Get the current authenticated user
+    :return: A contactresponse object
+    """
+    contact = await repository_contacts.update_contact(contact_id, body, current_user, db)
+    if contact is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=messages.CONTACT_NOT_FOUND)
+    return contact
+
+
+@router.patch("/{contact_id}", response_model=ContactResponse, description=messages.NO_MORE_THAN,
+              dependencies=[Depends(RateLimiter(times=10, seconds=60))])
+async def patch_contact(body: ContactPatch, contact_id: int, db: AsyncSession = Depends(get_contacts_db),
+                        current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The patch_contact function updates only the fields of a contact that are present in the body.
+
+    :param body: ContactPatch: Pass the fields to change
+    :param contact_id: int: Identify the contact to be updated
+    :param db: AsyncSession: Pass the database session to the function
     :param current_user: User: Get the current authenticated user
     :return: A contactresponse object
     """
@@ -167,13 +265,13 @@ async def update_contact(body: ContactUpdate, contact_id: int, db: Session = Dep
 
 @router.delete("/{contact_id}", response_model=ContactResponse, description=messages.NO_MORE_THAN,
                dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def remove_contact(contact_id: int, db: Session = Depends(get_db),
+async def remove_contact(contact_id: int, db: AsyncSession = Depends(get_contacts_db),
                          current_user: User = Depends(auth_service.get_current_user)):
     """
     The remove_contact function removes a contact from the database.
 
     :param contact_id: int: Specify the id of the contact to be updated
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :param current_user: User: Get the current user
     :return: A contactresponse
     """
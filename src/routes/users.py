@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, UploadFile, File
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import cloudinary
 import cloudinary.uploader
 
@@ -26,16 +26,16 @@ async def read_users_me(current_user: User = Depends(auth_service.get_current_us
 
 @router.patch('/avatar', response_model=UserDb)
 async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user),
-                             db: Session = Depends(get_db)):
+                             db: AsyncSession = Depends(get_db)):
     """
     The update_avatar_user function is used to update the avatar of a user.
         It takes in an UploadFile object, which contains the file containing the avatar image.
         It also takes in a User object, which represents the currently authenticated user.
-        Finally it takes in a Session object, which represents our database session dependency.
+        Finally it takes in an AsyncSession object, which represents our database session dependency.
 
     :param file: UploadFile: Upload the file to the server
     :param current_user: User: Get the currently authenticated user
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: The updated user object with the new avatar
     """
     cloudinary.config(
@@ -1,4 +1,6 @@
 from datetime import date, datetime
+from typing import Annotated, Literal, Union
+
 from pydantic import BaseModel, Field, EmailStr
 
 from src.config import messages
@@ -20,6 +22,16 @@ class ContactUpdate(ContactModel):
     ...
 
 
+class ContactPatch(BaseModel):
+    # Omitted fields keep their value; the defaults are never validated, so an explicit null is rejected
+    first_name: str = Field(default=None, max_length=50)
+    last_name: str = Field(default=None, max_length=50)
+    email: EmailStr = None
+    phone_number: str = Field(default=None, max_length=15)
+    born_date: date = None
+    description: str = Field(default=None, max_length=150)
+
+
 class ContactResponse(ContactBase):
     id: int
     first_name: str | None
@@ -33,6 +45,51 @@ class ContactResponse(ContactBase):
         from_attributes = True
 
 
+class ContactImportError(BaseModel):
+    row: int
+    detail: str
+
+
+class ContactImportResponse(BaseModel):
+    created: int
+    errors: list[ContactImportError]
+
+
+class ContactCreateOperation(BaseModel):
+    op: Literal["create"]
+    data: ContactModel
+
+
+class ContactUpdateOperation(BaseModel):
+    op: Literal["update"]
+    id: int
+    data: ContactUpdate
+
+
+class ContactDeleteOperation(BaseModel):
+    op: Literal["delete"]
+    id: int
+
+
+ContactBatchOperation = Annotated[Union[ContactCreateOperation, ContactUpdateOperation, ContactDeleteOperation],
+                                  Field(discriminator="op")]
+
+
+class ContactBatchRequest(BaseModel):
+    operations: list[ContactBatchOperation] = Field(min_length=1, max_length=1000)
+
+
+class ContactBatchResult(BaseModel):
+    index: int
+    status: int
+    id: int | None = None
+    detail: str | None = None
+
+
+class ContactBatchResponse(BaseModel):
+    results: list[ContactBatchResult]
+
+
 class UserModel(BaseModel):
     username: str = Field(min_length=3, max_length=16)
     email: EmailStr
@@ -51,6 +108,20 @@ class UserDb(BaseModel):
         from_attributes = True
 
 
+class UserCacheModel(BaseModel):
+    id: int
+    username: str | None
+    email: str
+    created_at: datetime | None
+    updated_at: datetime | None
+    avatar: str | None
+    confirmed: bool | None
+
+    class Config:
+        from_attributes = True
+        frozen = True
+
+
 class UserResponse(BaseModel):
     user: UserDb
     detail: str = messages.SUCCESSFULLY_CREATED
@@ -1,6 +1,6 @@
-import pickle
-import redis
-
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 from jose import JWTError, jwt
@@ -8,45 +8,74 @@ from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.config import messages
 from src.config.config import settings
 from src.database.db import get_db
+from src.database.routing import route_user, use_primary
 from src.repository import users as repository_users
+from src.services.cache import user_cache, token_cache
+from src.services.metrics import USER_CACHE_HIT, USER_CACHE_MISS
+
+logger = logging.getLogger(__name__)
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    # The first scheme hashes new passwords; hashes of the other schemes or with other costs are upgraded on login
+    pwd_context = CryptContext(schemes=settings.password_schemes, deprecated="auto",
+                               bcrypt__rounds=settings.bcrypt_rounds,
+                               argon2__type="ID",
+                               argon2__time_cost=settings.argon2_time_cost,
+                               argon2__memory_cost=settings.argon2_memory_cost,
+                               argon2__parallelism=settings.argon2_parallelism)
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+    # bcrypt releases the GIL, so a bounded thread pool spreads hashing across cores off the event loop
+    hash_executor = ThreadPoolExecutor(max_workers=settings.password_hash_workers, thread_name_prefix="password-hash")
 
-    r = redis.Redis(host=settings.redis_host, port=settings.redis_port, password=settings.redis_password, db=0)
+    user_cache = user_cache
+    token_cache = token_cache
 
-    def verify_password(self, plain_password, hashed_password):
+    async def verify_password(self, plain_password, hashed_password):
         """
         The verify_password function is used to verify a plain text password against a hashed password.
         The function returns True if the plain text password matches the hashed one, and False otherwise.
+        The check runs in the hashing thread pool, so it does not block the event loop.
 
         :param self: Represent the instance of the class
         :param plain_password: Verify the password that is entered by the user
         :param hashed_password: Compare the hashed password to the plain_password parameter
         :return: True or false depending on whether the password matches
         """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.hash_executor, self.pwd_context.verify, plain_password,
+                                          hashed_password)
 
-    def get_password_hash(self, password: str):
+    async def get_password_hash(self, password: str):
         """
         The get_password_hash function takes a password string and returns the hashed version of that password.
         The hashing algorithm used is determined by the CryptContext object passed to FastAPI when creating an instance of
-        the Security class.
+        the Security class. Hashing runs in the hashing thread pool, so it does not block the event loop.
 
         :param self: Represent the instance of the class
         :param password: str: Pass in the password that is to be hashed
         :return: A hashed password
         """
-        return self.pwd_context.hash(password)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.hash_executor, self.pwd_context.hash, password)
+
+    def password_needs_update(self, hashed_password: str) -> bool:
+        """
+        The password_needs_update function checks whether a stored hash was made with a deprecated scheme
+        or with cost settings other than the configured ones, so it should be replaced after a successful login.
+
+        :param self: Represent the instance of the class
+        :param hashed_password: str: Pass the stored hash
+        :return: True if the hash should be recomputed
+        """
+        return self.pwd_context.needs_update(hashed_password)
 
     # define a function to generate a new access token
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
@@ -110,15 +139,17 @@ class Auth:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                                 detail=messages.NOT_VALIDATE)
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
         """
         The get_current_user function is a dependency that will be used to retrieve the current user.
         It uses the OAuth2PasswordBearer scheme to validate and decode JWT tokens.
+        Claims of verified tokens are cached until the token expires, so repeat requests skip decoding.
         If credentials are invalid or if no user with such email exists, it raises an HTTPException.
+        The user is a detached copy whether it came from the cache or from the database.
 
         :param self: Refer to the class itself
         :param token: str: Get the token from the request header
-        :param db: Session: Get the database session
+        :param db: AsyncSession: Get the database session
         :return: The current user based on the provided token
         """
         credentials_exception = HTTPException(
@@ -127,31 +158,38 @@ class Auth:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-        try:
-            # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY,
-                                 algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload["sub"]
-                if email is None:
-                    raise credentials_exception
-            else:
+        payload = self.token_cache.get(token)
+        if payload is None:
+            try:
+                # Decode JWT
+                payload = jwt.decode(token, self.SECRET_KEY,
+                                     algorithms=[self.ALGORITHM])
+            except JWTError:
                 raise credentials_exception
-        except JWTError as e:
+            self.token_cache.set(token, payload)
+        if payload['scope'] == 'access_token':
+            email = payload["sub"]
+            if email is None:
+                raise credentials_exception
+        else:
             raise credentials_exception
 
-        user_hash = str(email)
-        user = self.r.get(user_hash)
+        user = await self.user_cache.get(email)
         if user is None:
-            print("User from database")
+            USER_CACHE_MISS.inc()
+            generation = await self.user_cache.generation(email)
+            # The cache was emptied by a write or has expired; a lagging replica could still return the old row,
+            # which would then be cached, so this request reads from the primary
+            use_primary(db)
             user = await repository_users.get_user_by_email(email, db)
             if user is None:
                 raise credentials_exception
-            self.r.set(user_hash, pickle.dumps(user))
-            self.r.expire(user_hash, 300)
+            logger.debug("User from database")
+            user = await self.user_cache.set(user, generation)
         else:
-            print("User from cache")
-            user = pickle.loads(user)
+            USER_CACHE_HIT.inc()
+            logger.debug("User from cache")
+        await route_user(db, user)
         return user
 
 
@@ -192,7 +230,7 @@ async def get_email_from_token(self, token: str):
         email = payload["sub"]
         return email
     except JWTError as e:
-        print(e)
+        logger.info("Invalid email verification token: %s", e)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                             detail=messages.INVALID_TOKEN)
 
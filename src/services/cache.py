@@ -0,0 +1,337 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from src.config.config import settings
+from src.database.models import User
+from src.schemas import UserCacheModel
+
+
+class UserCache:
+    """
+    Two-tier cache of authenticated users: a bounded in-process LRU in front of Redis.
+    Users are stored as a compact JSON UserCacheModel instead of a pickled ORM object.
+    Writes call invalidate, which drops the entry from both tiers and broadcasts the email
+    over Redis pub/sub so that the other workers drop their local copy too.
+    Every invalidation also moves a per-user generation forward. A miss reads the generation before loading
+    the user from the database, and set stores the user only if the generation is still the same,
+    so a load that raced a write cannot put the old user back for the whole TTL.
+    """
+    channel = "users:invalidate"
+    prefix = "user:"
+    generation_prefix = "user-generation:"
+    # KEYS: user key, generation key; ARGV: generation read before the load, JSON value, TTL
+    set_if_generation = """
+        if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+            return 0
+        end
+        redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+        return 1
+    """
+
+    def __init__(self, maxsize: int, ttl: int, r: redis.Redis | None = None):
+        self.r = r
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._local: OrderedDict[str, tuple[float, UserCacheModel]] = OrderedDict()
+        self._listener: asyncio.Task | None = None
+
+    def _remember(self, email: str, user: UserCacheModel) -> None:
+        self._local[email] = (time.monotonic() + self.ttl, user)
+        self._local.move_to_end(email)
+        while len(self._local) > self.maxsize:
+            self._local.popitem(last=False)
+
+    def _forget(self, email: str) -> None:
+        self._local.pop(email, None)
+
+    def _lookup(self, email: str) -> UserCacheModel | None:
+        entry = self._local.get(email)
+        if entry is None:
+            return None
+        expires, user = entry
+        if expires < time.monotonic():
+            del self._local[email]
+            return None
+        self._local.move_to_end(email)
+        return user
+
+    async def get(self, email: str) -> User | None:
+        """
+        The get function looks the user up in the local LRU first and in Redis second.
+        A Redis hit is copied into the local LRU, so the next lookup costs no network round trip.
+
+        :param self: Represent the instance of the class
+        :param email: str: Specify the email of the user
+        :return: A detached user object or none on a miss
+        """
+        user = self._lookup(email)
+        if user is None:
+            raw = await self.r.get(self.prefix + email)
+            if raw is None:
+                return None
+            user = UserCacheModel.model_validate_json(raw)
+            self._remember(email, user)
+        return User(**user.model_dump())
+
+    async def generation(self, email: str) -> int:
+        """
+        The generation function returns the number of invalidations of the user so far.
+        It is read on a miss, before the user is loaded from the database, and passed on to set.
+
+        :param self: Represent the instance of the class
+        :param email: str: Specify the email of the user
+        :return: The generation of the user
+        """
+        return int(await self.r.get(self.generation_prefix + email) or 0)
+
+    async def set(self, user: User, generation: int) -> User:
+        """
+        The set function stores the user in both tiers, unless the user was invalidated after generation was read.
+        The check, the value and its expiry are one atomic script run.
+
+        :param self: Represent the instance of the class
+        :param user: User: Pass the user loaded from the database
+        :param generation: int: The generation read before the user was loaded
+        :return: A detached user object, like the one get returns
+        """
+        cached = UserCacheModel.model_validate(user)
+        stored = await self.r.eval(self.set_if_generation, 2, self.prefix + cached.email,
+                                   self.generation_prefix + cached.email, generation, cached.model_dump_json(),
+                                   self.ttl)
+        if stored:
+            self._remember(cached.email, cached)
+        return User(**cached.model_dump())
+
+    async def invalidate(self, email: str) -> None:
+        """
+        The invalidate function drops the user from both tiers and tells the other workers to do the same.
+        INCR of the generation, DEL and PUBLISH are pipelined into a single round trip.
+
+        :param self: Represent the instance of the class
+        :param email: str: Specify the email of the changed user
+        :return: None
+        """
+        self._forget(email)
+        pipe = self.r.pipeline(transaction=False)
+        pipe.incr(self.generation_prefix + email)
+        pipe.delete(self.prefix + email)
+        pipe.publish(self.channel, email)
+        await pipe.execute()
+
+    def clear(self) -> None:
+        """
+        The clear function empties the local LRU.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        self._local.clear()
+
+    async def connect(self, r: redis.Redis) -> None:
+        """
+        The connect function binds the cache to the shared redis client and starts listening
+        for invalidations published by other workers.
+
+        :param self: Represent the instance of the class
+        :param r: redis.Redis: Pass the shared async redis client
+        :return: None
+        """
+        self.r = r
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def close(self) -> None:
+        """
+        The close function stops the invalidation listener.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self.r.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                while True:
+                    # A bounded wait, so that the socket timeout of the pool does not apply to an idle channel
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=30.0)
+                    if message is not None:
+                        self._forget(message["data"])
+            except RedisError:
+                # Invalidations may have been missed while disconnected
+                self.clear()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+
+class TokenCache:
+    """
+    Bounded in-process cache of verified JWT claims, keyed by the SHA-256 digest of the token.
+    A repeat request with the same token skips signature verification and claim parsing.
+    Entries are dropped once the exp claim of the token has passed.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._claims: OrderedDict[bytes, dict] = OrderedDict()
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> dict | None:
+        """
+        The get function returns the cached claims of a token that was already verified and has not expired yet.
+
+        :param self: Represent the instance of the class
+        :param token: str: Pass the encoded token
+        :return: A dictionary with the scope, sub and exp claims or none
+        """
+        key = self._digest(token)
+        claims = self._claims.get(key)
+        if claims is None:
+            return None
+        if claims["exp"] <= time.time():
+            del self._claims[key]
+            return None
+        self._claims.move_to_end(key)
+        return claims
+
+    def set(self, token: str, payload: dict) -> None:
+        """
+        The set function remembers the claims of a verified token. Tokens without an exp claim are not cached.
+
+        :param self: Represent the instance of the class
+        :param token: str: Pass the encoded token
+        :param payload: dict: Pass the verified payload of the token
+        :return: None
+        """
+        exp = payload.get("exp")
+        if exp is None:
+            return
+        key = self._digest(token)
+        self._claims[key] = {"scope": payload.get("scope"), "sub": payload.get("sub"), "exp": exp}
+        self._claims.move_to_end(key)
+        while len(self._claims) > self.maxsize:
+            self._claims.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        The clear function drops every cached token.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        self._claims.clear()
+
+
+class ContactsVersion:
+    """
+    Per-user version counter of the contacts, stored in Redis and bumped after every contact write.
+    Responses derived from the contacts carry an ETag built from it, so an unchanged version means
+    an unchanged response and a conditional GET can be answered without querying the database.
+    """
+    prefix = "contacts:version:"
+
+    def __init__(self, r: redis.Redis | None = None):
+        self.r = r
+
+    async def get(self, user_id: int) -> int:
+        """
+        The get function returns the current contacts version of a user.
+        A missing counter (a new user or a flushed Redis) starts at the current time in milliseconds
+        rather than at zero, so that it never repeats a version a client may still hold an ETag for.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: Specify the owner of the contacts
+        :return: The version number
+        """
+        key = self.prefix + str(user_id)
+        version = await self.r.get(key)
+        if version is None:
+            await self.r.set(key, time.time_ns() // 1_000_000, nx=True)
+            version = await self.r.get(key)
+        return int(version)
+
+    async def bump(self, user_id: int) -> None:
+        """
+        The bump function moves the contacts version of a user forward after a write.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: Specify the owner of the changed contacts
+        :return: None
+        """
+        await self.r.incr(self.prefix + str(user_id))
+
+    def connect(self, r: redis.Redis) -> None:
+        """
+        The connect function binds the counter to the shared redis client.
+
+        :param self: Represent the instance of the class
+        :param r: redis.Redis: Pass the shared async redis client
+        :return: None
+        """
+        self.r = r
+
+
+class RecentWriters:
+    """
+    Users who wrote to the primary database in the last few seconds, stored in Redis so that every worker sees them.
+    With read replicas, the reads of these users stay on the primary until the replicas have caught up,
+    so a client always reads its own writes.
+    """
+    prefix = "recent-writer:"
+
+    def __init__(self, window: float, r: redis.Redis | None = None):
+        self.window = window
+        self.r = r
+
+    async def mark(self, user_id: int) -> None:
+        """
+        The mark function starts the read-your-writes window of a user.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: Specify the user who wrote
+        :return: None
+        """
+        await self.r.set(self.prefix + str(user_id), 1, px=int(self.window * 1000))
+
+    async def is_recent(self, user_id: int) -> bool:
+        """
+        The is_recent function tells whether a user wrote within the window.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: Specify the user
+        :return: True if the reads of the user must go to the primary
+        """
+        return await self.r.get(self.prefix + str(user_id)) is not None
+
+    def connect(self, r: redis.Redis) -> None:
+        """
+        The connect function binds the set to the shared redis client.
+
+        :param self: Represent the instance of the class
+        :param r: redis.Redis: Pass the shared async redis client
+        :return: None
+        """
+        self.r = r
+
+
+user_cache = UserCache(maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl)
+token_cache = TokenCache(maxsize=settings.token_cache_size)
+contacts_version = ContactsVersion()
+recent_writers = RecentWriters(window=settings.read_your_writes_seconds)
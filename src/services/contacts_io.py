@@ -0,0 +1,226 @@
+import codecs
+import csv
+import io
+import json
+from typing import AsyncIterator
+
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.config import messages
+from src.database.models import User
+from src.database.routing import route_user
+from src.repository import contacts as repository_contacts
+from src.schemas import ContactModel
+
+IMPORT_BATCH_SIZE = 1000
+# Longest line kept in memory while waiting for its end
+MAX_LINE_SIZE = 64 * 1024
+# Longest CSV record kept in memory while waiting for the end of a quoted value
+MAX_CSV_RECORD_SIZE = 64 * 1024
+
+CSV_MEDIA_TYPE = "text/csv"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+EXPORT_FIELDS = ("id", "first_name", "last_name", "email", "phone_number", "born_date", "description")
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line_size: int = MAX_LINE_SIZE) -> AsyncIterator[str | None]:
+    """
+    The iter_lines function splits a stream of utf-8 encoded chunks into lines as the chunks arrive.
+    A leading byte order mark is dropped. A line longer than max_line_size characters is not buffered:
+    the rest of it is skipped and None takes its place, so the lines after it keep their numbers.
+
+    :param chunks: AsyncIterator[bytes]: Pass the request body stream
+    :param max_line_size: int: Specify the longest line that is buffered
+    :return: An async iterator of lines without line endings, and None for each line that is too long
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    too_long = False
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            if too_long or len(line) > max_line_size:
+                too_long = False
+                yield None
+            else:
+                yield line.rstrip("\r")
+        if len(buffer) > max_line_size:
+            too_long, buffer = True, ""
+    buffer += decoder.decode(b"", final=True)
+    if too_long or len(buffer) > max_line_size:
+        yield None
+    elif buffer:
+        yield buffer.rstrip("\r")
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[dict | None, str | None]]:
+    """
+    The iter_ndjson function parses newline-delimited JSON objects incrementally. Blank lines are skipped
+    and lines longer than MAX_LINE_SIZE are reported as errors.
+
+    :param chunks: AsyncIterator[bytes]: Pass the request body stream
+    :return: An async iterator of (row, none) for parsed rows and (none, error) for malformed ones
+    """
+    async for line in iter_lines(chunks):
+        if line is None:
+            yield None, messages.LINE_TOO_LONG
+            continue
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            yield None, messages.INVALID_JSON
+            continue
+        if not isinstance(row, dict):
+            yield None, messages.INVALID_JSON
+            continue
+        yield row, None
+
+
+def csv_record_complete(record: str) -> bool:
+    """
+    The csv_record_complete function tells whether a record ends outside of a quoted value, by the rules of
+    the csv module: a quote only opens a quoted value at the start of a field, so O"Brien is a plain value.
+
+    :param record: str: The lines of the record, joined with newlines
+    :return: False if a quoted value continues on the next line
+    """
+    try:
+        for _ in csv.reader([record], strict=True):
+            pass
+    except csv.Error as err:
+        return str(err) != "unexpected end of data"
+    return True
+
+
+async def iter_csv(chunks: AsyncIterator[bytes],
+                   max_record_size: int = MAX_CSV_RECORD_SIZE) -> AsyncIterator[tuple[dict | None, str | None]]:
+    """
+    The iter_csv function parses CSV records incrementally; the first record is the header.
+    Quoted values may span several lines, up to max_record_size characters per record. A longer record
+    and a quoted value that is still open at the end of the stream are reported as errors. Blank records are skipped.
+
+    :param chunks: AsyncIterator[bytes]: Pass the request body stream
+    :param max_record_size: int: Specify the longest record that is buffered
+    :return: An async iterator of (row, none) for parsed rows and (none, error) for malformed ones
+    """
+    header = None
+    pending = []
+    size = 0
+    async for line in iter_lines(chunks):
+        if line is None:
+            pending, size = [], 0
+            yield None, messages.CSV_RECORD_TOO_LONG
+            continue
+        pending.append(line)
+        size += len(line) + 1
+        record = "\n".join(pending)
+        if not csv_record_complete(record):
+            if size > max_record_size:
+                pending, size = [], 0
+                yield None, messages.CSV_RECORD_TOO_LONG
+            continue
+        pending, size = [], 0
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [name.strip() for name in values]
+        elif len(values) != len(header):
+            yield None, messages.INVALID_CSV_ROW
+        else:
+            yield dict(zip(header, values)), None
+    if pending:
+        yield None, messages.UNTERMINATED_CSV_VALUE
+
+
+def validation_detail(err: ValidationError) -> str:
+    """
+    The validation_detail function flattens a pydantic validation error into one line.
+
+    :param err: ValidationError: Pass the validation error
+    :return: A string like "email: value is not a valid email address"
+    """
+    return "; ".join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in err.errors())
+
+
+async def import_contacts(chunks: AsyncIterator[bytes], media_type: str, user: User, db: AsyncSession,
+                          batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """
+    The import_contacts function streams contacts from a CSV or NDJSON body into the database.
+    Rows are validated with the ContactModel rules and inserted in batches of batch_size;
+    invalid or conflicting rows are reported and skipped without aborting the import.
+
+    :param chunks: AsyncIterator[bytes]: Pass the request body stream
+    :param media_type: str: Specify the format, text/csv or application/x-ndjson
+    :param user: User: Get the owner of the imported contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :param batch_size: int: Specify how many rows are inserted at once
+    :return: A dictionary with the number of created contacts and the per-row errors
+    """
+    rows = iter_csv(chunks) if media_type == CSV_MEDIA_TYPE else iter_ndjson(chunks)
+    created = 0
+    errors = []
+    batch: list[tuple[int, ContactModel]] = []
+
+    async def flush():
+        nonlocal created
+        results = await repository_contacts.create_contacts([body for _, body in batch], user, db)
+        for (number, _), error in zip(batch, results):
+            if error is None:
+                created += 1
+            else:
+                errors.append({"row": number, "detail": error})
+        batch.clear()
+
+    number = 0
+    async for row, error in rows:
+        number += 1
+        if error is not None:
+            errors.append({"row": number, "detail": error})
+            continue
+        try:
+            batch.append((number, ContactModel.model_validate(row)))
+        except ValidationError as err:
+            errors.append({"row": number, "detail": validation_detail(err)})
+            continue
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+    errors.sort(key=lambda error: error["row"])
+    return {"created": created, "errors": errors}
+
+
+async def export_contacts(media_type: str, user: User, session_factory: async_sessionmaker) -> AsyncIterator[bytes]:
+    """
+    The export_contacts function streams all contacts of a user as CSV or NDJSON.
+    It owns its database session for the lifetime of the response and serializes one cursor batch per chunk,
+    so the first bytes are sent right away and memory does not grow with the address book.
+    Like the request sessions, the session is routed by route_user, so a user who just wrote reads from the primary.
+
+    :param media_type: str: Specify the format, text/csv or application/x-ndjson
+    :param user: User: Specify the user whose contacts are exported
+    :param session_factory: async_sessionmaker: Open the database session used while streaming
+    :return: An async iterator of encoded chunks
+    """
+    if media_type == CSV_MEDIA_TYPE:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        yield buffer.getvalue().encode()
+    async with session_factory() as db:
+        await route_user(db, user)
+        async for rows in repository_contacts.stream_contacts(user, db):
+            if media_type == CSV_MEDIA_TYPE:
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows(row._mapping for row in rows)
+                yield buffer.getvalue().encode()
+            else:
+                yield "".join(
+                    json.dumps(dict(row._mapping), default=str, ensure_ascii=False) + "\n" for row in rows).encode()
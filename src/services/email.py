@@ -1,3 +1,4 @@
+import logging
 from pathlib import Path
 
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
@@ -7,6 +8,8 @@ from pydantic import EmailStr
 from src.services.auth import auth_service
 from src.config.config import settings
 
+logger = logging.getLogger(__name__)
+
 conf = ConnectionConfig(
     MAIL_USERNAME=settings.mail_username,
     MAIL_PASSWORD=settings.mail_password,
@@ -43,5 +46,5 @@ async def send_email(email: EmailStr, username: str, host: str):
 
         fm = FastMail(conf)
         await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
\ No newline at end of file
+    except ConnectionErrors:
+        logger.exception("Sending the confirmation email failed")
\ No newline at end of file
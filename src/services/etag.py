@@ -0,0 +1,48 @@
+from datetime import date
+
+from fastapi import Depends, HTTPException, Request, Response, status
+
+from src.database.models import User
+from src.services.auth import auth_service
+from src.services.cache import contacts_version
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    The etag_matches function compares an If-None-Match header with an ETag using the weak comparison.
+
+    :param if_none_match: str | None: Pass the value of the If-None-Match header
+    :param etag: str: Pass the current ETag
+    :return: True if the client already holds the current representation
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+class ContactsETag:
+    """
+    Dependency that tags a contacts read with a weak ETag built from the contacts version of the current user.
+    If the If-None-Match header of the request holds that ETag, it answers 304 Not Modified
+    before the endpoint runs, so no query is sent to the database.
+    The version is read before the query, so a concurrent write can only make a response newer than its ETag,
+    never older.
+    """
+
+    def __init__(self, daily: bool = False):
+        # Results that depend on today's date, like upcoming birthdays, also change at midnight
+        self.daily = daily
+
+    async def __call__(self, request: Request, response: Response,
+                       current_user: User = Depends(auth_service.get_current_user)) -> None:
+        version = await contacts_version.get(current_user.id)
+        parts = [current_user.id, version]
+        if self.daily:
+            parts.append(date.today().isoformat())
+        etag = 'W/"' + "-".join(str(part) for part in parts) + '"'
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        response.headers["ETag"] = etag
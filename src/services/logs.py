@@ -0,0 +1,98 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from src.config.config import settings
+
+# Attributes every LogRecord has; anything else was passed with extra= and is logged as a field
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line: time, level, logger, message, the fields passed
+    with extra= and the traceback of an exception.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Passes the given share of the DEBUG and INFO records and every warning and error.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves the formatting to the listener thread. Only the message arguments are merged
+    in the calling thread, since the objects they refer to may change after the call.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+_listener: QueueListener | None = None
+
+
+def setup_logging() -> QueueListener:
+    """
+    The setup_logging function routes all logging through a queue: the application only puts records on it,
+    and a listener thread formats them as JSON and writes them to stdout, so a slow terminal or log collector
+    never blocks the event loop. The level, the per-logger levels, the sampling of DEBUG and INFO records
+    and the SQL statement log come from the settings. Calling it again has no effect.
+
+    :return: The running queue listener
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+    log_queue = queue.SimpleQueue()
+    handler = DeferredQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(settings.log_sample_rate))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(settings.log_level.upper())
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO if settings.log_sql else logging.WARNING)
+    for name, level in settings.log_levels.items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
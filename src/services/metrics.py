@@ -0,0 +1,120 @@
+import time
+
+from fastapi import Request, Response
+from fastapi_limiter import http_default_callback
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from starlette.datastructures import MutableHeaders
+
+from src.database.query_stats import QueryStats, current_stats
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Latency of HTTP requests by route template",
+                            ["method", "route", "status"])
+DB_QUERIES_PER_REQUEST = Histogram("db_queries_per_request", "SQL statements executed per HTTP request", ["route"],
+                                   buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100))
+DB_TIME_PER_REQUEST = Histogram("db_time_per_request_seconds", "Time spent in SQL statements per HTTP request",
+                                ["route"])
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being processed")
+DB_POOL_WAIT = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a database connection", ["pool"],
+                         buckets=(.0001, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5))
+DB_POOL_TIMEOUTS = Counter("db_pool_checkout_timeouts_total", "Checkouts that gave up waiting for a connection",
+                           ["pool"])
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Database connections currently checked out of the pool", ["pool"])
+DB_POOL_OVERFLOW = Gauge("db_pool_overflow", "Database connections opened above the pool size", ["pool"])
+DB_POOL_CAPACITY = Gauge("db_pool_capacity", "Maximum number of connections of the pool, overflow included", ["pool"])
+DB_POOL_SATURATION = Gauge("db_pool_saturation", "Share of the pool capacity that is checked out", ["pool"])
+REDIS_LATENCY = Histogram("redis_command_duration_seconds", "Round-trip latency of Redis commands", ["command"],
+                          buckets=(.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, 1))
+USER_CACHE_REQUESTS = Counter("user_cache_requests_total", "Lookups of the authenticated user in the user cache",
+                              ["result"])
+USER_CACHE_HIT = USER_CACHE_REQUESTS.labels("hit")
+USER_CACHE_MISS = USER_CACHE_REQUESTS.labels("miss")
+RATE_LIMITED = Counter("rate_limiter_rejections_total", "Requests rejected by the rate limiter", ["route"])
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware that records the latency of every HTTP request under its route template
+    (e.g. /api/contacts/{contact_id}) and the number of requests in flight. It avoids BaseHTTPMiddleware,
+    so it costs a few microseconds per request instead of an extra task and response stream.
+    It also collects the SQL statements of the request: their number and total time are sent in the
+    X-DB-Query-Count and X-DB-Time-Ms headers (statements run while a body streams are only in the metrics).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+        stats = QueryStats(scope=scope)
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("X-DB-Query-Count", str(stats.count))
+                headers.append("X-DB-Time-Ms", f"{stats.duration * 1000:.2f}")
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_stats.reset(token)
+            REQUESTS_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope; unmatched paths share one label
+            route = scope.get("route")
+            route = route.path if route is not None else "unmatched"
+            REQUEST_LATENCY.labels(scope["method"], route, str(status_code)).observe(elapsed)
+            DB_QUERIES_PER_REQUEST.labels(route).observe(stats.count)
+            DB_TIME_PER_REQUEST.labels(route).observe(stats.duration)
+
+
+def watch_pool(engine, name: str, capacity: int) -> None:
+    """
+    The watch_pool function exposes the state of the connection pool of an engine. The gauges are read
+    from the pool when the metrics are scraped, so nothing is added to the request path. The pool is looked up
+    on every scrape, as disposing the engine replaces it.
+
+    :param engine: AsyncEngine: The engine
+    :param name: str: The pool label of the metrics
+    :param capacity: int: The pool size plus the maximum overflow
+    :return: None
+    """
+    def pool():
+        return engine.sync_engine.pool
+
+    DB_POOL_CAPACITY.labels(name).set(capacity)
+    DB_POOL_CHECKED_OUT.labels(name).set_function(lambda: pool().checkedout())
+    DB_POOL_OVERFLOW.labels(name).set_function(lambda: max(pool().overflow(), 0))
+    DB_POOL_SATURATION.labels(name).set_function(lambda: pool().checkedout() / capacity if capacity else 0)
+
+
+async def count_rate_limited(request: Request, response: Response, pexpire: int):
+    """
+    The count_rate_limited function is the rate limiter callback: it counts the rejection and then
+    answers 429 like the default callback of fastapi-limiter.
+
+    :param request: Request: The rejected request
+    :param response: Response: The response of the request
+    :param pexpire: int: The milliseconds until the limit resets
+    :return: None, it raises an HTTPException
+    """
+    route = request.scope.get("route")
+    RATE_LIMITED.labels(route.path if route is not None else request.url.path).inc()
+    return await http_default_callback(request, response, pexpire)
+
+
+def metrics_response() -> Response:
+    """
+    The metrics_response function renders all metrics in the Prometheus text format.
+
+    :return: The response for the /metrics endpoint
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
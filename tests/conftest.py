@@ -1,71 +1,88 @@
+import asyncio
+from contextlib import contextmanager
+from unittest.mock import patch
+
 import pytest
 import pytest_asyncio
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine, StaticPool
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 from main import app
 from src.database.models import Base, User
-from src.database.db import get_db
+from src.database.db import get_db, get_session_factory
+from src.database.query_stats import count_queries, track_queries
 from src.services.auth import auth_service
+from src.services.cache import user_cache, contacts_version
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
-engine = create_engine(
+engine = create_async_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False},
     poolclass=StaticPool
 )
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+TestingSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+track_queries(engine)
 
 test_user = {"username": "olf", "email": "test@example.com", "password": "12345678"}
 
 
 @pytest.fixture(scope="module", autouse=True)
 def init_models_wrap():
-    def init_models():
-        with engine.begin() as conn:
-            Base.metadata.drop_all(bind=conn)
-            Base.metadata.create_all(bind=conn)
-        with TestingSessionLocal() as session:
-            hash_password = auth_service.get_password_hash(test_user["password"])
+    async def init_models():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+        async with TestingSessionLocal() as session:
+            hash_password = await auth_service.get_password_hash(test_user["password"])
             current_user = User(username=test_user["username"], email=test_user["email"], password=hash_password,
                                 confirmed=True)
             session.add(current_user)
-            session.commit()
+            await session.commit()
 
-    init_models()
+    asyncio.run(init_models())
 
 
 @pytest.fixture(scope="module")
-def session():
-    # Create the database
-
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
-
-    db = TestingSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-@pytest.fixture(scope="module")
-def client(session):
+def client():
     # Dependency override
 
-    def override_get_db():
+    async def override_get_db():
+        session = TestingSessionLocal()
         try:
             yield session
+        except Exception:
+            await session.rollback()
+            raise
         finally:
-            session.close()
+            await session.close()
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_session_factory] = lambda: TestingSessionLocal
+    user_cache.clear()
 
-    yield TestClient(app)
+    with patch.object(user_cache, "get", return_value=None), patch.object(user_cache, "generation", return_value=0), \
+            patch.object(user_cache, "set", side_effect=lambda user, generation: user), \
+            patch.object(user_cache, "invalidate"), patch.object(contacts_version, "get", return_value=1), \
+            patch.object(contacts_version, "bump"):
+        yield TestClient(app)
 
 
 @pytest_asyncio.fixture()
 async def get_token():
     token = await auth_service.create_access_token(data={"sub": test_user["email"]})
-    return token
\ No newline at end of file
+    return token
+
+
+@pytest.fixture()
+def assert_max_queries():
+    """
+    Usage: with assert_max_queries(2): client.get(...) fails if the block runs more than two SQL statements.
+    """
+    @contextmanager
+    def check(limit: int):
+        with count_queries(engine) as stats:
+            yield stats
+        assert stats.count <= limit, f"{stats.count} queries executed, the budget is {limit}"
+
+    return check
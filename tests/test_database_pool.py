@@ -0,0 +1,48 @@
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from src.config.config import settings
+from src.database.db import make_engine
+
+
+def sample(name: str, pool: str) -> float | None:
+    return REGISTRY.get_sample_value(name, {"pool": pool})
+
+
+@pytest.fixture()
+def pool_settings(monkeypatch):
+    monkeypatch.setattr(settings, "db_pool_size", 1)
+    monkeypatch.setattr(settings, "db_max_overflow", 1)
+    monkeypatch.setattr(settings, "db_pool_timeout", 0.05)
+
+
+def test_make_engine_pool_settings(pool_settings, tmp_path):
+    engine = make_engine(f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}", name="test-settings")
+    pool = engine.sync_engine.pool
+    assert pool.size() == 1
+    assert pool.timeout() == 0.05
+    assert pool._pre_ping is True
+    assert pool._recycle == settings.db_pool_recycle
+    assert sample("db_pool_capacity", "test-settings") == 2
+
+
+@pytest.mark.asyncio
+async def test_pool_saturation_and_timeouts(pool_settings, tmp_path):
+    engine = make_engine(f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}", name="test-saturation")
+    waited = sample("db_pool_checkout_wait_seconds_sum", "test-saturation")
+    try:
+        first = await engine.connect()
+        second = await engine.connect()
+        assert sample("db_pool_saturation", "test-saturation") == 1.0
+        with pytest.raises(PoolTimeoutError):
+            await engine.connect()
+        assert sample("db_pool_checkout_timeouts_total", "test-saturation") == 1
+        assert sample("db_pool_checkout_wait_seconds_sum", "test-saturation") >= (waited or 0) + 0.05
+        await first.close()
+        await second.close()
+        assert sample("db_pool_saturation", "test-saturation") == 0.0
+    finally:
+        await engine.dispose()
+    # Disposing replaces the pool, which keeps its label and is the one the gauges read
+    assert engine.sync_engine.pool.label == "test-saturation"
@@ -0,0 +1,145 @@
+from datetime import date
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.database.db import make_engine
+from src.database.models import Base, Contact, User
+from src.database.routing import ReplicaSet, RoutingAsyncSession, route_user, use_primary
+from src.repository import users as repository_users
+from src.services.auth import auth_service
+from src.services.cache import user_cache
+from src.services.contacts_io import NDJSON_MEDIA_TYPE, export_contacts
+
+
+@pytest_asyncio.fixture()
+async def databases(tmp_path):
+    primary = make_engine(f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}", "test-primary")
+    replica = make_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}", "test-replica")
+    # The replica lags behind: it does not have the newest user yet
+    for engine, emails in ((primary, ["old@example.com", "new@example.com"]), (replica, ["old@example.com"])):
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            for number, email in enumerate(emails, 1):
+                await conn.execute(User.__table__.insert().values(id=number, username=f"user{number}", email=email,
+                                                                   password="hash", confirmed=True))
+    session_factory = async_sessionmaker(bind=primary, class_=RoutingAsyncSession, expire_on_commit=False,
+                                         replicas=ReplicaSet([replica]))
+    yield session_factory
+    await primary.dispose()
+    await replica.dispose()
+
+
+async def emails(db) -> list[str]:
+    return list((await db.execute(select(User.email).order_by(User.id))).scalars())
+
+
+@pytest.mark.asyncio
+async def test_reads_go_to_replica(databases):
+    async with databases() as db:
+        assert await repository_users.get_user_by_email("new@example.com", db) is None
+        assert (await repository_users.get_user_by_email("old@example.com", db)).id == 1
+
+
+@pytest.mark.asyncio
+async def test_locking_and_textual_reads_go_to_primary(databases):
+    async with databases() as db:
+        assert len((await db.execute(select(User).with_for_update())).all()) == 2
+        assert (await db.execute(text("SELECT count(*) FROM users"))).scalar() == 2
+
+
+@pytest.mark.asyncio
+async def test_session_stays_on_primary_after_write(databases):
+    async with databases() as db:
+        user = await repository_users.get_user_by_email("old@example.com", db)
+        with patch.object(user_cache, "invalidate"):
+            await repository_users.update_avatar(user.email, "https://example.com/a.png", db)
+        assert await emails(db) == ["old@example.com", "new@example.com"]
+
+
+@pytest.mark.asyncio
+async def test_use_primary(databases):
+    async with databases() as db:
+        use_primary(db)
+        assert await emails(db) == ["old@example.com", "new@example.com"]
+
+
+@pytest.mark.asyncio
+async def test_write_starts_read_your_writes_window(databases):
+    with patch("src.database.routing.recent_writers") as recent_writers:
+        recent_writers.is_recent = AsyncMock(return_value=False)
+        recent_writers.mark = AsyncMock()
+        async with databases() as db:
+            user = await db.get(User, 1)
+            await route_user(db, user)
+            assert await emails(db) == ["old@example.com"]
+            await db.commit()
+            recent_writers.mark.assert_not_awaited()
+            user.avatar = "https://example.com/a.png"
+            await db.commit()
+            recent_writers.mark.assert_awaited_once_with(1)
+
+        recent_writers.is_recent.return_value = True
+        async with databases() as db:
+            await route_user(db, User(id=1))
+            assert await emails(db) == ["old@example.com", "new@example.com"]
+
+
+@pytest.mark.asyncio
+async def test_current_user_after_write_is_read_from_primary(databases):
+    async with databases() as db:
+        user = await repository_users.get_user_by_email("old@example.com", db)
+        with patch.object(user_cache, "invalidate") as invalidate, \
+                patch("src.database.routing.recent_writers") as recent_writers:
+            recent_writers.mark = AsyncMock()
+            await repository_users.update_avatar(user.email, "https://example.com/a.png", db)
+        invalidate.assert_awaited_once_with("old@example.com")
+
+    token = await auth_service.create_access_token(data={"sub": "old@example.com"})
+    with patch.object(user_cache, "get", AsyncMock(return_value=None)), \
+            patch.object(user_cache, "generation", AsyncMock(return_value=0)), \
+            patch.object(user_cache, "set", AsyncMock(side_effect=lambda user, generation: user)) as cache_set, \
+            patch("src.database.routing.recent_writers") as recent_writers:
+        # Also when the read-your-writes window has already ended
+        recent_writers.is_recent = AsyncMock(return_value=False)
+        async with databases() as db:
+            current = await auth_service.get_current_user(token, db)
+    assert current.avatar == "https://example.com/a.png"
+    cache_set.assert_awaited_once_with(current, 0)
+
+
+@pytest.mark.asyncio
+async def test_export_after_write_is_read_from_primary(databases):
+    async with databases() as db:
+        await db.execute(Contact.__table__.insert().values(
+            first_name="Ann", last_name="Lee", email="ann@example.com", phone_number="+380501234567",
+            born_date=date(1990, 1, 1), birthday_key=101, description="", user_id=1))
+        await db.commit()
+        user = await db.get(User, 1)
+
+    with patch("src.database.routing.recent_writers") as recent_writers:
+        recent_writers.is_recent = AsyncMock(return_value=True)
+        chunks = [chunk async for chunk in export_contacts(NDJSON_MEDIA_TYPE, user, databases)]
+    assert b"ann@example.com" in b"".join(chunks)
+    recent_writers.is_recent.assert_awaited_once_with(1)
+
+
+@pytest.mark.asyncio
+async def test_route_user_without_replicas():
+    db = AsyncMock()
+    await route_user(db, User(id=1))
+    db.info.__setitem__.assert_not_called()
+
+
+def test_replica_set_strategies():
+    engines = [MagicMock(), MagicMock(), MagicMock()]
+    for engine, checked_out in zip(engines, (3, 1, 2)):
+        engine.sync_engine.pool.checkedout.return_value = checked_out
+    round_robin = ReplicaSet(engines)
+    assert [round_robin.choose() for _ in range(4)] == [*engines, engines[0]]
+    assert ReplicaSet(engines, "least_loaded").choose() is engines[1]
+    with pytest.raises(ValueError):
+        ReplicaSet(engines, "random")
@@ -0,0 +1,74 @@
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.database.models import Base, Contact, User
+from src.database.seed import REFERENCE_DATE, contact_counts, generate_contacts, seed_database
+
+
+def test_contact_counts_even():
+    assert contact_counts(3, 10) == [4, 3, 3]
+
+
+def test_contact_counts_skewed():
+    counts = contact_counts(4, 1000, skew=1.0)
+    assert sum(counts) == 1000
+    assert counts == sorted(counts, reverse=True)
+    assert counts[0] > 2 * counts[3]
+
+
+def test_contact_counts_heavy_users():
+    assert contact_counts(5, 1_000_100, heavy=[(2, 500_000)]) == [500_000, 500_000, 34, 33, 33]
+
+
+def test_generate_contacts_is_deterministic_and_unique():
+    now = datetime(2024, 1, 1)
+    first = list(generate_contacts(1, 0, 2000, seed=7, now=now))
+    assert first == list(generate_contacts(1, 0, 2000, seed=7, now=now))
+    assert first != list(generate_contacts(1, 0, 2000, seed=8, now=now))
+    assert len({row["email"] for row in first}) == 2000
+    assert len({row["phone_number"] for row in first}) == 2000
+    assert all(len(row["phone_number"]) <= 15 for row in first)
+    assert all(17 < (REFERENCE_DATE - row["born_date"]).days / 365.25 <= 90 for row in first)
+
+
+def test_generate_contacts_does_not_depend_on_the_current_date():
+    first = list(generate_contacts(1, 0, 100, seed=7, now=datetime(2024, 1, 1)))
+    later = list(generate_contacts(1, 0, 100, seed=7, now=datetime(2025, 6, 30)))
+    assert [row["born_date"] for row in first] == [row["born_date"] for row in later]
+    assert [row["birthday_key"] for row in first] == [row["birthday_key"] for row in later]
+    moved = list(generate_contacts(1, 0, 100, seed=7, now=datetime(2024, 1, 1), today=date(2025, 1, 1)))
+    assert [row["born_date"].year for row in moved] != [row["born_date"].year for row in first]
+
+
+@pytest.mark.asyncio
+async def test_seed_database():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    emails = await seed_database(engine, users=3, contacts=50, seed=1, heavy=[(1, 30)], batch_size=16)
+    async with engine.connect() as conn:
+        counts = dict((await conn.execute(
+            select(User.email, func.count(Contact.id)).join(Contact, Contact.user_id == User.id)
+            .group_by(User.email))).all())
+    await engine.dispose()
+    assert counts == {emails[0]: 30, emails[1]: 10, emails[2]: 10}
+
+
+@pytest.mark.asyncio
+async def test_seed_database_adds_to_existing_users():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    first = await seed_database(engine, users=2, contacts=4, seed=1)
+    second = await seed_database(engine, users=2, contacts=6, seed=1)
+    async with engine.connect() as conn:
+        counts = dict((await conn.execute(
+            select(User.email, func.count(Contact.id)).join(Contact, Contact.user_id == User.id)
+            .group_by(User.email))).all())
+    await engine.dispose()
+    assert first == ["user0@example.com", "user1@example.com"]
+    assert second == ["user2@example.com", "user3@example.com"]
+    assert counts == {first[0]: 2, first[1]: 2, second[0]: 3, second[1]: 3}
@@ -0,0 +1,251 @@
+from collections import Counter
+from datetime import date
+from unittest.mock import AsyncMock, patch
+
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.config import messages
+from src.database import sharding
+from src.database.db import make_engine
+from src.database.models import Contact, User, to_birthday_key
+from src.database.sharding import (COPIED, COPYING, PENDING, HashRing, Move, ShardRouter, count_contacts,
+                                   create_shard_schema, get_contacts_db, moves_table, plan_id_blocks, plan_moves,
+                                   prepare, rebalance, set_move_state)
+from src.repository import contacts as repository_contacts
+from src.schemas import ContactModel
+
+
+def test_ring_spreads_users_evenly():
+    ring = HashRing(["a", "b", "c"])
+    counts = Counter(ring.shard_for(user_id) for user_id in range(3000))
+    assert set(counts) == {"a", "b", "c"}
+    assert all(700 < count < 1300 for count in counts.values())
+    assert HashRing(["a", "b", "c"]).shard_for(42) == ring.shard_for(42)
+
+
+def test_ring_adding_a_shard_only_moves_users_to_it():
+    before = HashRing(["a", "b", "c"])
+    after = HashRing(["a", "b", "c", "d"])
+    moved = [user_id for user_id in range(3000) if before.shard_for(user_id) != after.shard_for(user_id)]
+    assert all(after.shard_for(user_id) == "d" for user_id in moved)
+    assert 450 < len(moved) < 1050
+
+
+def test_ring_weights_and_pins():
+    ring = HashRing(["a", "b"], weights={"b": 3}, pins={7: "a"})
+    counts = Counter(ring.shard_for(user_id) for user_id in range(4000))
+    assert counts["b"] > 2 * counts["a"]
+    assert ring.shard_for(7) == "a"
+    with pytest.raises(ValueError):
+        HashRing(["a"], pins={7: "z"})
+    with pytest.raises(ValueError):
+        HashRing([])
+    with pytest.raises(ValueError):
+        HashRing(["a", "b"], weights={"a": 0, "b": 0})
+
+
+@pytest_asyncio.fixture()
+async def router(tmp_path):
+    engines = {name: make_engine(f"sqlite+aiosqlite:///{tmp_path / name}.db", f"test-shard-{name}")
+               for name in ("a", "b")}
+    for engine in engines.values():
+        await create_shard_schema(engine)
+        await create_shard_schema(engine)
+    yield ShardRouter(engines, HashRing(engines), move_poll=0)
+    for engine in engines.values():
+        await engine.dispose()
+
+
+def contact(number: int, user_id: int) -> dict:
+    return dict(id=number, first_name="Shard", last_name="Test", email=f"shard{number}@example.com",
+                phone_number=f"55500{number:04d}", born_date=date(1990, 1, 1),
+                birthday_key=to_birthday_key(date(1990, 1, 1)), description="", user_id=user_id)
+
+
+def contact_model(number: int) -> ContactModel:
+    return ContactModel(first_name="Shard", last_name="Test", email=f"shard{number}@example.com",
+                        phone_number=f"55500{number:04d}", born_date=date(1990, 1, 1), description="")
+
+
+def request(method: str) -> Request:
+    return Request({"type": "http", "method": method, "headers": []})
+
+
+def users_on(router: ShardRouter, name: str, count: int = 2) -> list[int]:
+    return [user_id for user_id in range(1, 100) if router.shard_for(user_id) == name][:count]
+
+
+async def contacts_on(router: ShardRouter, name: str) -> list[tuple[int, int]]:
+    async with router.engines[name].connect() as conn:
+        return list(await conn.execute(select(Contact.id, Contact.user_id).order_by(Contact.id)))
+
+
+async def moves_on(router: ShardRouter, name: str) -> list[tuple[int, str, str]]:
+    async with router.engines[name].connect() as conn:
+        return list(await conn.execute(select(moves_table).order_by(moves_table.c.user_id)))
+
+
+@pytest.mark.asyncio
+async def test_repository_writes_to_the_shard_of_the_user(router):
+    user = User(id=1)
+    with patch.object(repository_contacts.contacts_version, "bump"):
+        async with router.session_factory(user.id)() as db:
+            created = await repository_contacts.create_contact(contact_model(1), user, db)
+    home = router.shard_for(user.id)
+    other = "b" if home == "a" else "a"
+    assert await contacts_on(router, home) == [(created.id, 1)]
+    assert await contacts_on(router, other) == []
+
+
+@pytest.mark.asyncio
+async def test_get_contacts_db(router, monkeypatch):
+    monkeypatch.setattr(sharding, "shard_router", router)
+    dependency = get_contacts_db(request("GET"), User(id=1), db=None)
+    session = await anext(dependency)
+    assert session.bind is router.engines[router.shard_for(1)]
+    await dependency.aclose()
+
+    monkeypatch.setattr(sharding, "shard_router", None)
+    dependency = get_contacts_db(request("GET"), User(id=1), db="main session")
+    assert await anext(dependency) == "main session"
+
+
+@pytest.mark.asyncio
+async def test_rebalance_moves_users_to_their_shard(router):
+    # Users 1..6 all start on shard a, as if b had just been added
+    async with router.engines["a"].begin() as conn:
+        await conn.execute(Contact.__table__.insert(), [contact(number, number % 6 + 1) for number in range(1, 13)])
+    expected = sorted(user_id for user_id in range(1, 7) if router.shard_for(user_id) == "b")
+    assert expected
+
+    moves = await plan_moves(router)
+    assert [(move.user_id, move.source, move.target) for move in moves] == [(user_id, "a", "b") for user_id in expected]
+    moves = await rebalance(router, settle=0)
+    assert all(move.error is None and move.moved == 2 for move in moves)
+    assert sorted({user_id for _, user_id in await contacts_on(router, "b")}) == expected
+    assert await count_contacts(router.engines) == {"a": 12 - 2 * len(expected), "b": 2 * len(expected)}
+    assert await plan_moves(router) == []
+    assert await moves_on(router, "b") == []
+
+
+@pytest.mark.asyncio
+async def test_rebalance_keeps_the_contact_ids(router):
+    # The shards hand out ids from their own blocks, as create-schema sets them up on PostgreSQL
+    user_id, neighbour = users_on(router, "b")
+    async with router.engines["a"].begin() as conn:
+        await conn.execute(Contact.__table__.insert(), [contact(101, user_id), contact(102, user_id)])
+    async with router.engines["b"].begin() as conn:
+        await conn.execute(Contact.__table__.insert(), [contact(1, neighbour)])
+
+    versions = AsyncMock()
+    moves = await rebalance(router, versions=versions, settle=0)
+    assert moves == [Move(user_id, "a", "b", moved=2)]
+    versions.bump.assert_awaited_once_with(user_id)
+    assert await contacts_on(router, "a") == []
+    assert await contacts_on(router, "b") == [(1, neighbour), (101, user_id), (102, user_id)]
+    assert await moves_on(router, "b") == []
+
+    # An id the client had before the move still addresses the same contact
+    with patch.object(repository_contacts.contacts_version, "bump"):
+        async with router.session_factory(user_id)() as db:
+            assert (await repository_contacts.get_contact(101, User(id=user_id), db)).email == "shard101@example.com"
+            assert (await repository_contacts.remove_contact(102, User(id=user_id), db)).email == \
+                "shard102@example.com"
+            assert await repository_contacts.get_contact(1, User(id=user_id), db) is None
+    assert await contacts_on(router, "b") == [(1, neighbour), (101, user_id)]
+
+
+def test_plan_id_blocks():
+    assert plan_id_blocks({"a": None, "b": None}) == {"a": 1, "b": 2}
+    # A new shard gets a block after every block in use, also after a shard was removed
+    assert plan_id_blocks({"b": 2, "c": None}) == {"c": 3}
+    assert plan_id_blocks({"a": 1, "b": 2}) == {}
+
+
+@pytest.mark.asyncio
+async def test_routes_use_the_source_until_the_copy_is_done(router, monkeypatch):
+    monkeypatch.setattr(sharding, "shard_router", router)
+    user_id = users_on(router, "b", 1)[0]
+    async with router.engines["a"].begin() as conn:
+        await conn.execute(Contact.__table__.insert(), [contact(1, user_id)])
+
+    async def routed_to(method: str) -> AsyncEngine:
+        dependency = get_contacts_db(request(method), User(id=user_id), db=None)
+        try:
+            return (await anext(dependency)).bind
+        finally:
+            await dependency.aclose()
+
+    assert await prepare(router) == [Move(user_id, "a", "b")]
+    assert await routed_to("GET") is router.engines["a"]
+    assert await routed_to("POST") is router.engines["a"]
+
+    await set_move_state(router.engines["b"], Move(user_id, "a", "b"), COPYING)
+    assert await routed_to("GET") is router.engines["a"]
+    with pytest.raises(HTTPException) as err:
+        await routed_to("POST")
+    assert err.value.status_code == 503
+    assert err.value.detail == messages.CONTACTS_MOVING
+
+    await rebalance(router, settle=0)
+    assert await routed_to("POST") is router.engines["b"]
+
+
+@pytest.mark.asyncio
+async def test_routes_find_contacts_written_after_prepare(router):
+    user_id, newcomer = users_on(router, "b")
+    async with router.engines["a"].begin() as conn:
+        await conn.execute(Contact.__table__.insert(), [contact(1, user_id)])
+    assert await prepare(router) == [Move(user_id, "a", "b")]
+    assert await router.placement(newcomer) == ("b", None)
+
+    # The newcomer had no contacts when prepare ran and wrote under the old shard map before it was deployed
+    async with router.engines["a"].begin() as conn:
+        await conn.execute(Contact.__table__.insert(), [contact(2, newcomer)])
+    assert await router.placement(newcomer) == ("a", PENDING)
+
+    moves = await rebalance(router, settle=0)
+    assert [(move.user_id, move.moved) for move in moves] == [(user_id, 1), (newcomer, 1)]
+    assert await router.placement(newcomer) == ("b", None)
+    assert await contacts_on(router, "b") == [(1, user_id), (2, newcomer)]
+
+
+@pytest.mark.asyncio
+async def test_rebalance_finishes_an_interrupted_move(router):
+    user_id, neighbour = users_on(router, "b")
+    # The copy was committed, but the rows left on the source were not deleted yet
+    async with router.engines["a"].begin() as conn:
+        await conn.execute(Contact.__table__.insert(), [contact(1, user_id)])
+    async with router.engines["b"].begin() as conn:
+        await conn.execute(Contact.__table__.insert(), [contact(1, user_id)])
+    await set_move_state(router.engines["b"], Move(user_id, "a", "b"), COPIED)
+    assert await router.placement(user_id) == ("b", None)
+
+    # A user who deleted all contacts while the move was pending
+    await set_move_state(router.engines["b"], Move(neighbour, "a", "b"), PENDING)
+
+    assert await rebalance(router, settle=0) == []
+    assert await contacts_on(router, "a") == []
+    assert await contacts_on(router, "b") == [(1, user_id)]
+    assert await moves_on(router, "b") == []
+
+
+@pytest.mark.asyncio
+async def test_rebalance_reports_conflicts(router):
+    user_id = users_on(router, "b", 1)[0]
+    async with router.engines["a"].begin() as conn:
+        await conn.execute(Contact.__table__.insert(), [contact(1, user_id)])
+    # The same contact was already created on the target
+    async with router.engines["b"].begin() as conn:
+        await conn.execute(Contact.__table__.insert(), [contact(5, user_id) | {"email": "shard1@example.com"}])
+
+    moves = await rebalance(router, settle=0)
+    assert moves == [Move(user_id, "a", "b", moved=0, error=moves[0].error)]
+    assert moves[0].error
+    assert await contacts_on(router, "a") == [(1, user_id)]
+    assert await contacts_on(router, "b") == [(5, user_id)]
+    assert await router.placement(user_id) == ("a", PENDING)
@@ -0,0 +1,75 @@
+import json
+from datetime import date
+from unittest.mock import MagicMock
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.database.query_stats import QueryStats, current_stats
+from src.database.slow_queries import SlowQueryLog, explain_statement, redact
+
+
+def test_redact():
+    assert redact((7, "olha@example.com", date(1990, 1, 1), None, True, 2.5)) == \
+        [7, "<str>", "<date>", None, True, 2.5]
+    assert redact({"user_id": 1, "email": "x"}) == {"user_id": 1, "email": "<str>"}
+
+
+def test_explain_statement():
+    assert explain_statement("postgresql", "SELECT 1", True) == "EXPLAIN (ANALYZE, BUFFERS) SELECT 1"
+    assert explain_statement("postgresql", "SELECT 1", False) == "EXPLAIN SELECT 1"
+    assert explain_statement("sqlite", "SELECT 1", True) == "EXPLAIN QUERY PLAN SELECT 1"
+
+
+@pytest_asyncio.fixture()
+async def engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'slow.db'}")
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE TABLE people (id INTEGER PRIMARY KEY, email TEXT)"))
+        await conn.execute(text("INSERT INTO people (email) VALUES ('olha@example.com')"))
+    yield engine
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_slow_query_log_records_and_explains(engine, tmp_path):
+    path = tmp_path / "slow.jsonl"
+    slow_query_log = SlowQueryLog(0, size=2, path=str(path))
+    slow_query_log.install(engine)
+    token = current_stats.set(QueryStats(scope={"route": MagicMock(path="/api/contacts/search/email")}))
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT id FROM people WHERE email = :email AND id > :id"),
+                               {"email": "olha@example.com", "id": 0})
+    finally:
+        current_stats.reset(token)
+    await slow_query_log.wait()
+
+    entry = slow_query_log.snapshot()[0]
+    assert entry["statement"].startswith("SELECT id FROM people")
+    assert entry["parameters"] == ["<str>", 0]
+    assert entry["route"] == "/api/contacts/search/email"
+    assert entry["plan"] and entry["explain_error"] is None
+    assert entry["analyzed"] is False
+    assert [json.loads(line) for line in path.read_text().splitlines()][-1] == entry
+    # The EXPLAIN itself is not recorded
+    assert not any(item["statement"].startswith("EXPLAIN") for item in slow_query_log.snapshot())
+
+
+@pytest.mark.asyncio
+async def test_slow_query_log_threshold_and_buffer(engine):
+    slow_query_log = SlowQueryLog(60_000)
+    slow_query_log.install(engine)
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+    assert slow_query_log.snapshot() == []
+
+    slow_query_log = SlowQueryLog(0, size=2)
+    slow_query_log.install(engine)
+    async with engine.connect() as conn:
+        for number in range(3):
+            await conn.execute(text(f"SELECT {number}"))
+    await slow_query_log.wait()
+    assert [entry["statement"] for entry in slow_query_log.snapshot()] == ["SELECT 2", "SELECT 1"]
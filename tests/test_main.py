@@ -2,6 +2,7 @@ from unittest.mock import MagicMock, patch
 from starlette.testclient import TestClient
 from sqlalchemy.orm import Session
 import main
+from src.config import messages
 
 client = TestClient(main.app)
 
@@ -12,6 +13,47 @@ def test_read_main():
     assert response.json() == {"message": "Hello, world!"}
 
 
-def test_process_time_header():
-    response = client.get("/")
-    assert "My-Process-Time" in response.headers
\ No newline at end of file
+def test_metrics():
+    client.get("/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_request_duration_seconds_count{method="GET",route="/",status="200"}' in response.text
+    assert "db_pool_checked_out" in response.text
+
+
+def test_metrics_unmatched_route():
+    client.get("/no/such/path")
+    response = client.get("/metrics")
+    assert 'route="unmatched",status="404"' in response.text
+
+
+def test_slow_queries_endpoint_disabled():
+    response = client.get("/slow-queries")
+    assert response.status_code == 404
+    assert response.json()["detail"] == messages.SLOW_QUERY_ENDPOINT_DISABLED
+
+
+def test_slow_queries_requires_admin_token():
+    with patch.object(main.settings, "slow_query_admin_token", "admin-token"):
+        assert client.get("/slow-queries").status_code == 401
+        response = client.get("/slow-queries", headers={"Authorization": "Bearer wrong"})
+    assert response.status_code == 401
+    assert response.json()["detail"] == messages.NOT_VALIDATE
+
+
+def test_slow_queries_disabled():
+    with patch.object(main.settings, "slow_query_admin_token", "admin-token"):
+        response = client.get("/slow-queries", headers={"Authorization": "Bearer admin-token"})
+    assert response.status_code == 404
+    assert response.json()["detail"] == messages.SLOW_QUERY_LOG_DISABLED
+
+
+def test_slow_queries():
+    slow_query_log = MagicMock()
+    slow_query_log.snapshot.return_value = [{"statement": "SELECT 1", "route": "/api/contacts/"}]
+    with patch.object(main.database, "slow_query_log", slow_query_log), \
+            patch.object(main.settings, "slow_query_admin_token", "admin-token"):
+        response = client.get("/slow-queries", headers={"Authorization": "Bearer admin-token"})
+    assert response.status_code == 200
+    assert response.json() == [{"statement": "SELECT 1", "route": "/api/contacts/"}]
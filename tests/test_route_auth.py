@@ -1,9 +1,12 @@
 from unittest.mock import Mock
 
+import pytest
+from passlib.context import CryptContext
 from sqlalchemy import select
 
 from src.config import messages
 from src.database.models import User
+from src.services.auth import auth_service
 from tests.conftest import TestingSessionLocal
 
 user_data = {"username": "jony", "email": "jony35@gmail.com", "password": "12345678"}
@@ -42,13 +45,14 @@ def test_login_user_not_confirmed(client):
     assert data["detail"] == messages.EMAIL_NOT_CONFIRM
 
 
-def test_login_user(client, session):
-    with TestingSessionLocal() as session:
-        current_user = session.execute(select(User).where(User.email == user_data.get("email")))
+@pytest.mark.asyncio
+async def test_login_user(client):
+    async with TestingSessionLocal() as session:
+        current_user = await session.execute(select(User).where(User.email == user_data.get("email")))
         current_user = current_user.scalar_one_or_none()
         if current_user:
             current_user.confirmed = True
-            session.commit()
+            await session.commit()
 
     response = client.post("api/auth/login",
                            data={"username": user_data.get("email"), "password": user_data.get("password")})
@@ -59,6 +63,26 @@ def test_login_user(client, session):
     assert "token_type" in data
 
 
+@pytest.mark.asyncio
+async def test_login_rehashes_outdated_password(client):
+    outdated_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash(user_data.get("password"))
+    async with TestingSessionLocal() as session:
+        current_user = await session.execute(select(User).where(User.email == user_data.get("email")))
+        current_user = current_user.scalar_one_or_none()
+        current_user.password = outdated_hash
+        await session.commit()
+
+    response = client.post("api/auth/login",
+                           data={"username": user_data.get("email"), "password": user_data.get("password")})
+    assert response.status_code == 200, response.text
+
+    async with TestingSessionLocal() as session:
+        current_user = await session.execute(select(User).where(User.email == user_data.get("email")))
+        current_user = current_user.scalar_one_or_none()
+    assert current_user.password != outdated_hash
+    assert not auth_service.password_needs_update(current_user.password)
+
+
 def test_login_wrong_password(client):
     response = client.post(
         "/api/auth/login",
@@ -1,10 +1,16 @@
+import asyncio
+import csv
+import io
+import json
 from unittest.mock import patch, MagicMock, AsyncMock
 
 import pytest
+from sqlalchemy import select
 
 from src.config import messages
 from src.database.models import User
-from src.services.auth import auth_service
+from src.services.cache import user_cache, contacts_version
+from tests.conftest import TestingSessionLocal
 
 contact_data = {"first_name": "Vanya",
                 "last_name": "Petrov",
@@ -18,13 +24,19 @@ user_data = {"username": "peter", "email": "peter@gmail.com", "password": "12345
 
 
 @pytest.fixture()
-def token(client, session, monkeypatch):
+def token(client, monkeypatch):
     mock_send_email = MagicMock()
     monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
     client.post("/api/auth/signup", json=user_data)
-    current_user: User = session.query(User).filter(User.email == user_data.get('email')).first()
-    current_user.confirmed = True
-    session.commit()
+
+    async def confirm_user():
+        async with TestingSessionLocal() as session:
+            current_user = await session.execute(select(User).where(User.email == user_data.get('email')))
+            current_user: User = current_user.scalar_one_or_none()
+            current_user.confirmed = True
+            await session.commit()
+
+    asyncio.run(confirm_user())
     response = client.post(
         "/api/auth/login",
         data={"username": user_data.get('email'), "password": user_data.get('password')},
@@ -34,8 +46,7 @@ def token(client, session, monkeypatch):
 
 
 def test_create_contact(client, token, monkeypatch):
-    with patch.object(auth_service, 'r') as redis_mock:
-        redis_mock.get.return_value = None
+    with patch.object(user_cache, 'get', return_value=None):
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
@@ -52,8 +63,7 @@ def test_create_contact(client, token, monkeypatch):
 
 
 def test_read_contacts(client, token, monkeypatch):
-    with patch.object(auth_service, 'r') as redis_mock:
-        redis_mock.get.return_value = None
+    with patch.object(user_cache, 'get', return_value=None):
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
@@ -68,9 +78,61 @@ def test_read_contacts(client, token, monkeypatch):
         assert "id" in data[0]
 
 
+def test_read_contacts_not_modified(client, token, monkeypatch):
+    with patch.object(user_cache, 'get', return_value=None):
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.get("/api/contacts/", headers=headers)
+        assert response.status_code == 200, response.text
+        etag = response.headers["ETag"]
+        assert etag.startswith('W/"')
+
+        response = client.get("/api/contacts/", headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 304, response.text
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+
+        with patch.object(contacts_version, 'get', return_value=2):
+            response = client.get("/api/contacts/", headers={**headers, "If-None-Match": etag})
+            assert response.status_code == 200, response.text
+            assert response.headers["ETag"] != etag
+
+
+def test_read_contacts_cursor(client, token, monkeypatch):
+    with patch.object(user_cache, 'get', return_value=None):
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.get("/api/contacts/", params={"limit": 1}, headers=headers)
+        assert response.status_code == 200, response.text
+        assert len(response.json()) == 1
+        next_cursor = response.headers["X-Next-Cursor"]
+
+        response = client.get("/api/contacts/", params={"limit": 1, "after": next_cursor}, headers=headers)
+        assert response.status_code == 200, response.text
+        assert response.json() == []
+        assert "X-Next-Cursor" not in response.headers
+
+
+def test_read_contacts_invalid_cursor(client, token, monkeypatch):
+    with patch.object(user_cache, 'get', return_value=None):
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+        response = client.get(
+            "/api/contacts/",
+            params={"after": "not a cursor!"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 400, response.text
+        assert response.json()["detail"] == messages.INVALID_CURSOR
+
+
 def test_read_contact_existing(client, token, monkeypatch):
-    with patch.object(auth_service, 'r') as redis_mock:
-        redis_mock.get.return_value = None
+    with patch.object(user_cache, 'get', return_value=None):
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
@@ -84,8 +146,7 @@ def test_read_contact_existing(client, token, monkeypatch):
 
 
 def test_read_contact_not_found(client, token, monkeypatch):
-    with patch.object(auth_service, 'r') as redis_mock:
-        redis_mock.get.return_value = None
+    with patch.object(user_cache, 'get', return_value=None):
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
@@ -98,9 +159,36 @@ def test_read_contact_not_found(client, token, monkeypatch):
         assert data["detail"] == messages.CONTACT_NOT_FOUND
 
 
+def test_get_birthdays(client, token, monkeypatch):
+    with patch.object(user_cache, 'get', return_value=None):
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+        response = client.get(
+            "/api/contacts/search/birthdays",
+            params={"days": 366},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data[0]["born_date"] == contact_data.get("born_date")
+
+
+def test_get_birthdays_invalid_window(client, token, monkeypatch):
+    with patch.object(user_cache, 'get', return_value=None):
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+        response = client.get(
+            "/api/contacts/search/birthdays",
+            params={"days": 0},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 422, response.text
+
+
 def test_update_contact_existing(client, token, monkeypatch):
-    with patch.object(auth_service, 'r') as redis_mock:
-        redis_mock.get.return_value = None
+    with patch.object(user_cache, 'get', return_value=None):
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
@@ -125,8 +213,7 @@ def test_update_contact_existing(client, token, monkeypatch):
 
 
 def test_update_contact_not_found(client, token, monkeypatch):
-    with patch.object(auth_service, 'r') as redis_mock:
-        redis_mock.get.return_value = None
+    with patch.object(user_cache, 'get', return_value=None):
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
@@ -145,9 +232,39 @@ def test_update_contact_not_found(client, token, monkeypatch):
         assert data["detail"] == messages.CONTACT_NOT_FOUND
 
 
+def test_patch_contact_existing(client, token, monkeypatch):
+    with patch.object(user_cache, 'get', return_value=None):
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.patch("/api/contacts/1", json={"born_date": "2023-12-31"}, headers=headers)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["born_date"] == "2023-12-31"
+        assert data["first_name"] == contact_data.get("first_name")
+        assert data["email"] == contact_data.get("email")
+
+        response = client.patch("/api/contacts/1", json={"first_name": None}, headers=headers)
+        assert response.status_code == 422, response.text
+
+
+def test_patch_contact_not_found(client, token, monkeypatch):
+    with patch.object(user_cache, 'get', return_value=None):
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+        response = client.patch(
+            "/api/contacts/2",
+            json={"description": "changed"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 404, response.text
+        assert response.json()["detail"] == messages.CONTACT_NOT_FOUND
+
+
 def test_delete_contact_existing(client, token, monkeypatch):
-    with patch.object(auth_service, 'r') as redis_mock:
-        redis_mock.get.return_value = None
+    with patch.object(user_cache, 'get', return_value=None):
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
@@ -162,17 +279,155 @@ def test_delete_contact_existing(client, token, monkeypatch):
 
 
 def test_repeat_delete_contact(client, token, monkeypatch):
-    with patch.object(auth_service, 'r') as redis_mock:
-        redis_mock.get.return_value = None
+    with patch.object(user_cache, 'get', return_value=None):
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
-        with patch.object(auth_service, 'r') as r_mock:
-            r_mock.get.return_value = None
+        with patch.object(user_cache, 'get', return_value=None):
             response = client.delete(
                 "/api/contacts/1",
                 headers={"Authorization": f"Bearer {token}"}
             )
             assert response.status_code == 404, response.text
             data = response.json()
-            assert data["detail"] == messages.CONTACT_NOT_FOUND
\ No newline at end of file
+            assert data["detail"] == messages.CONTACT_NOT_FOUND
+
+def test_import_contacts_ndjson(client, token, monkeypatch):
+    with patch.object(user_cache, 'get', return_value=None):
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+        rows = [
+            {**contact_data, "email": "import1@example.com", "phone_number": "100000001"},
+            {**contact_data, "email": "import2@example.com", "phone_number": "100000002"},
+            {**contact_data, "email": "import1@example.com", "phone_number": "100000003"},
+            {**contact_data, "email": "not an email", "phone_number": "100000004"},
+        ]
+        body = "\n".join(json.dumps(row) for row in rows) + "\n{broken\n"
+        response = client.post(
+            "/api/contacts/import",
+            content=body.encode(),
+            headers={"Authorization": f"Bearer {token}", "Content-Type": "application/x-ndjson"}
+        )
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["created"] == 2
+        assert [error["row"] for error in data["errors"]] == [3, 4, 5]
+        assert data["errors"][0]["detail"] == messages.DUPLICATE_EMAIL
+        assert data["errors"][1]["detail"].startswith("email:")
+        assert data["errors"][2]["detail"] == messages.INVALID_JSON
+
+
+def test_import_contacts_csv(client, token, monkeypatch):
+    with patch.object(user_cache, 'get', return_value=None):
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+        body = ("first_name,last_name,email,phone_number,born_date,description\r\n"
+                "Ivan,Franko,franko@example.com,200000001,1856-08-27,\"poet,\nwriter\"\r\n"
+                "Lesya,Ukrainka,ukrainka@example.com,100000001,1871-02-25,poet\r\n"
+                "Taras,Shevchenko,shevchenko@example.com\r\n")
+        response = client.post(
+            "/api/contacts/import",
+            content=body.encode(),
+            headers={"Authorization": f"Bearer {token}", "Content-Type": "text/csv"}
+        )
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["created"] == 1
+        assert data["errors"] == [{"row": 2, "detail": messages.DUPLICATE_PHONE},
+                                  {"row": 3, "detail": messages.INVALID_CSV_ROW}]
+
+
+def test_import_contacts_unsupported_format(client, token, monkeypatch):
+    with patch.object(user_cache, 'get', return_value=None):
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+        response = client.post(
+            "/api/contacts/import",
+            json=[contact_data],
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 415, response.text
+        assert response.json()["detail"] == messages.UNSUPPORTED_IMPORT_FORMAT
+
+
+def test_export_contacts_ndjson(client, token, monkeypatch):
+    with patch.object(user_cache, 'get', return_value=None):
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+        response = client.get(
+            "/api/contacts/export",
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["email"] for row in rows] == ["import1@example.com", "import2@example.com",
+                                                  "franko@example.com"]
+        assert rows[2]["description"] == "poet,\nwriter"
+        assert rows[2]["born_date"] == "1856-08-27"
+
+
+def test_export_contacts_csv(client, token, monkeypatch):
+    with patch.object(user_cache, 'get', return_value=None):
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+        response = client.get(
+            "/api/contacts/export",
+            params={"format": "csv"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"].startswith("text/csv")
+        assert response.headers["content-disposition"] == 'attachment; filename="contacts.csv"'
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert [row["email"] for row in rows] == ["import1@example.com", "import2@example.com",
+                                                  "franko@example.com"]
+        assert rows[2]["description"] == "poet,\nwriter"
+
+
+def test_batch_contacts(client, token, monkeypatch):
+    with patch.object(user_cache, 'get', return_value=None):
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+        headers = {"Authorization": f"Bearer {token}"}
+        first, second, third = client.get("/api/contacts/", headers=headers).json()
+        changed = {**contact_data, "email": "batch1@example.com", "phone_number": "300000001"}
+        operations = [
+            {"op": "update", "id": first["id"], "data": {**changed, "description": "updated"}},
+            {"op": "delete", "id": second["id"]},
+            {"op": "update", "id": second["id"], "data": changed},
+            {"op": "update", "id": third["id"], "data": {**changed, "phone_number": "300000002"}},
+            {"op": "create", "data": {**contact_data, "email": "batch2@example.com", "phone_number": "300000003"}},
+            {"op": "create", "data": {**contact_data, "email": "batch3@example.com",
+                                      "phone_number": third["phone_number"]}},
+        ]
+        response = client.post("/api/contacts/batch", json={"operations": operations}, headers=headers)
+        assert response.status_code == 200, response.text
+        results = response.json()["results"]
+        assert [result["status"] for result in results] == [200, 200, 404, 409, 201, 409]
+        assert results[3]["detail"] == messages.CONTACT_CONFLICT
+        assert results[5]["detail"] == messages.DUPLICATE_PHONE
+
+        contacts = client.get("/api/contacts/", headers=headers).json()
+        assert [contact["id"] for contact in contacts] == [first["id"], third["id"], results[4]["id"]]
+        assert contacts[0]["description"] == "updated"
+        assert contacts[1]["email"] == third["email"]
+
+
+def test_batch_contacts_invalid_operation(client, token, monkeypatch):
+    with patch.object(user_cache, 'get', return_value=None):
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+        response = client.post(
+            "/api/contacts/batch",
+            json={"operations": [{"op": "rename", "id": 1}]},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 422, response.text
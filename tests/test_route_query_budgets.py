@@ -0,0 +1,93 @@
+"""
+Query budgets of the routes: every request may run at most the given number of SQL statements.
+A budget that starts failing means a route gained a query (or an N+1 loop); raise it only on purpose.
+The user is looked up in the database on every request, as the user cache is disabled in the tests.
+SQLite cannot return the ids of a multi-row INSERT in parameter order, so SQLAlchemy inserts such batches
+row by row there: the budgets of the bulk routes grow with the batch, unlike on PostgreSQL.
+"""
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from src.services.auth import auth_service
+from tests.conftest import test_user
+
+contact_data = {"first_name": "Budget", "last_name": "Query", "email": "budget@example.com",
+                "phone_number": "555000001", "born_date": "1990-01-01", "description": "budget"}
+
+
+@pytest.fixture()
+def headers(client, monkeypatch):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    monkeypatch.setattr("src.routes.auth.send_email", MagicMock())
+    token = asyncio.run(auth_service.create_access_token(data={"sub": test_user["email"]}))
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_create_contact_budget(client, headers, assert_max_queries):
+    with assert_max_queries(3):
+        response = client.post("/api/contacts/", json=contact_data, headers=headers)
+    assert response.status_code == 201, response.text
+    assert response.headers["X-DB-Query-Count"] == "3"
+    assert float(response.headers["X-DB-Time-Ms"]) > 0
+
+
+@pytest.mark.parametrize("url, params, budget", [
+    ("/api/contacts/", {}, 2),
+    ("/api/contacts/", {"limit": 1}, 2),
+    ("/api/contacts/search/first_name", {"first_name": "Bud"}, 2),
+    ("/api/contacts/search/last_name", {"last_name": "Que"}, 2),
+    ("/api/contacts/search/email", {"email": "budget"}, 2),
+    ("/api/contacts/search/birthdays", {"days": 366}, 2),
+    ("/api/contacts/export", {"format": "csv"}, 2),
+])
+def test_read_contacts_budget(client, headers, assert_max_queries, url, params, budget):
+    with assert_max_queries(budget):
+        response = client.get(url, params=params, headers=headers)
+    assert response.status_code == 200, response.text
+
+
+def test_write_contacts_budget(client, headers, assert_max_queries):
+    contact_id = client.get("/api/contacts/", headers=headers).json()[0]["id"]
+    with assert_max_queries(2):
+        assert client.get(f"/api/contacts/{contact_id}", headers=headers).status_code == 200
+    with assert_max_queries(2):
+        assert client.put(f"/api/contacts/{contact_id}", json=contact_data, headers=headers).status_code == 200
+    with assert_max_queries(2):
+        response = client.patch(f"/api/contacts/{contact_id}", json={"description": "patched"}, headers=headers)
+        assert response.status_code == 200
+    rows = "\n".join(f'{{"first_name": "Row", "last_name": "Import", "email": "row{number}@example.com", '
+                     f'"phone_number": "55510000{number}", "born_date": "1990-01-01", "description": ""}}' for number in range(5))
+    # user, duplicate check, savepoint, five inserts, release
+    with assert_max_queries(9):
+        response = client.post("/api/contacts/import", content=rows.encode(),
+                               headers={**headers, "Content-Type": "application/x-ndjson"})
+        assert response.json()["created"] == 5
+    operations = [{"op": "update", "id": contact_id, "data": contact_data},
+                  {"op": "create", "data": {**contact_data, "email": "batch@example.com",
+                                            "phone_number": "555200001"}}]
+    with assert_max_queries(9):
+        assert client.post("/api/contacts/batch", json={"operations": operations},
+                           headers=headers).status_code == 200
+    with assert_max_queries(2):
+        assert client.delete(f"/api/contacts/{contact_id}", headers=headers).status_code == 200
+
+
+def test_auth_budget(client, headers, assert_max_queries):
+    with assert_max_queries(3):
+        response = client.post("/api/auth/signup", json={"username": "budget", "email": "budget@example.com",
+                                                         "password": "12345678"})
+        assert response.status_code == 201, response.text
+    with assert_max_queries(2):
+        response = client.post("/api/auth/login",
+                               data={"username": test_user["email"], "password": test_user["password"]})
+        assert response.status_code == 200, response.text
+    with assert_max_queries(2):
+        response = client.get("/api/auth/refresh_token",
+                              headers={"Authorization": f"Bearer {response.json()['refresh_token']}"})
+        assert response.status_code == 200, response.text
+    with assert_max_queries(1):
+        assert client.post("/api/auth/request_email", json={"email": test_user["email"]}).status_code == 200
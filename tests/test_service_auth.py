@@ -1,42 +1,64 @@
-from unittest.mock import patch, Mock
+import threading
+import time
+from unittest.mock import patch, Mock, AsyncMock
 from fastapi import HTTPException
 from jwt import PyJWTError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import pytest
 
 from src.config import messages
 from src.services.auth import Auth
+from src.services.cache import TokenCache
 
 
 @pytest.mark.asyncio
 async def test_get_current_user_valid_token():
     # Mocking dependencies
     token = "valid_token"
-    db = Mock(spec=Session)
+    db = Mock(spec=AsyncSession)
     auth_instance = Auth()
-    auth_instance.r = Mock()
+    auth_instance.user_cache = AsyncMock()
     auth_instance.SECRET_KEY = "test_secret_key"
     auth_instance.ALGORITHM = "test_algorithm"
 
     # Mocking jwt.decode
     with patch("src.services.auth.jwt.decode") as mock_jwt_decode:
         mock_jwt_decode.return_value = {"scope": "access_token", "sub": "test@example.com"}
-        auth_instance.r.get.return_value = None
+        auth_instance.user_cache.get.return_value = None
         user_data = {"id": 1, "email": "test@example.com"}
         with patch("src.services.auth.repository_users.get_user_by_email") as mock_get_user_by_email:
             mock_get_user_by_email.return_value = user_data
+            auth_instance.user_cache.generation.return_value = 4
             user = await auth_instance.get_current_user(token, db)
-            assert user == user_data
+            assert user == auth_instance.user_cache.set.return_value
+            auth_instance.user_cache.set.assert_awaited_once_with(user_data, 4)
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_from_cache():
+    token = "valid_token"
+    db = Mock(spec=AsyncSession)
+    auth_instance = Auth()
+    auth_instance.user_cache = AsyncMock()
+    cached_user = Mock()
+    auth_instance.user_cache.get.return_value = cached_user
+
+    with patch("src.services.auth.jwt.decode") as mock_jwt_decode:
+        mock_jwt_decode.return_value = {"scope": "access_token", "sub": "test@example.com"}
+        with patch("src.services.auth.repository_users.get_user_by_email") as mock_get_user_by_email:
+            user = await auth_instance.get_current_user(token, db)
+            assert user == cached_user
+            mock_get_user_by_email.assert_not_called()
 
 
 @pytest.mark.asyncio
 async def test_get_current_user_invalid_token():
     # Mocking dependencies
     token = "valid_token"
-    db = Mock(spec=Session)
+    db = Mock(spec=AsyncSession)
     auth_instance = Auth()
-    auth_instance.r = Mock()
+    auth_instance.user_cache = AsyncMock()
     auth_instance.SECRET_KEY = "test_secret_key"
     auth_instance.ALGORITHM = "test_algorithm"
 
@@ -54,9 +76,9 @@ async def test_get_current_user_invalid_token():
 async def test_get_current_user_invalid_scope():
     # Mocking dependencies
     token = "valid_token"
-    db = Mock(spec=Session)
+    db = Mock(spec=AsyncSession)
     auth_instance = Auth()
-    auth_instance.r = Mock()
+    auth_instance.user_cache = AsyncMock()
     auth_instance.SECRET_KEY = "test_secret_key"
     auth_instance.ALGORITHM = "test_algorithm"
 
@@ -69,4 +91,39 @@ async def test_get_current_user_invalid_scope():
             await auth_instance.get_current_user(token, db)
 
         assert exc_info.value.status_code == 401
-        assert exc_info.value.detail == messages.NOT_VALIDATE
\ No newline at end of file
+        assert exc_info.value.detail == messages.NOT_VALIDATE
+
+
+@pytest.mark.asyncio
+async def test_password_hashing_runs_in_executor():
+    auth_instance = Auth()
+    with patch.object(auth_instance, "pwd_context") as pwd_context_mock:
+        pwd_context_mock.hash.side_effect = lambda password: threading.current_thread().name
+        thread_name = await auth_instance.get_password_hash("12345678")
+    assert thread_name.startswith("password-hash")
+    assert thread_name != threading.current_thread().name
+
+
+@pytest.mark.asyncio
+async def test_verify_password():
+    auth_instance = Auth()
+    hashed_password = await auth_instance.get_password_hash("12345678")
+    assert await auth_instance.verify_password("12345678", hashed_password)
+    assert not await auth_instance.verify_password("87654321", hashed_password)
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_token_cache():
+    token = "cached_token"
+    db = Mock(spec=AsyncSession)
+    auth_instance = Auth()
+    auth_instance.user_cache = AsyncMock()
+    auth_instance.token_cache = TokenCache(maxsize=10)
+
+    with patch("src.services.auth.jwt.decode") as mock_jwt_decode:
+        mock_jwt_decode.return_value = {"scope": "access_token", "sub": "test@example.com",
+                                        "exp": time.time() + 60}
+        await auth_instance.get_current_user(token, db)
+        await auth_instance.get_current_user(token, db)
+        mock_jwt_decode.assert_called_once()
+        auth_instance.user_cache.get.assert_awaited_with("test@example.com")
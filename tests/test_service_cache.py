@@ -0,0 +1,180 @@
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from src.database.models import User
+from src.schemas import UserCacheModel
+from src.services.cache import UserCache, TokenCache, ContactsVersion, RecentWriters
+
+
+def make_user(user_id=1, email="test@example.com"):
+    return User(id=user_id, username="test", email=email, created_at=datetime(2024, 1, 1),
+                updated_at=datetime(2024, 1, 1), avatar=None, confirmed=True, password="hash")
+
+
+def make_cache(maxsize=10):
+    r = AsyncMock()
+    r.get.return_value = None
+    r.pipeline = MagicMock()
+    r.pipeline.return_value.execute = AsyncMock()
+    return UserCache(maxsize=maxsize, ttl=300, r=r)
+
+
+@pytest.mark.asyncio
+async def test_get_miss():
+    cache = make_cache()
+    assert await cache.get("test@example.com") is None
+
+
+@pytest.mark.asyncio
+async def test_set_stores_json_dto_with_expiry():
+    cache = make_cache()
+    user = await cache.set(make_user(), 0)
+    _, keys, key, generation_key, generation, value, ttl = cache.r.eval.call_args.args
+    assert (keys, key, generation_key, generation, ttl) == (2, "user:test@example.com",
+                                                           "user-generation:test@example.com", 0, 300)
+    assert "hash" not in value
+    assert UserCacheModel.model_validate_json(value).id == 1
+    assert isinstance(user, User) and user.id == 1
+    cache.r.set.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_set_after_invalidation_is_skipped():
+    cache = make_cache()
+    cache.r.get.return_value = b"3"
+    assert await cache.generation("test@example.com") == 3
+    cache.r.get.assert_awaited_once_with("user-generation:test@example.com")
+    cache.r.eval.return_value = 0
+    user = await cache.set(make_user(), 3)
+    assert user.email == "test@example.com"
+    cache.r.get.return_value = None
+    assert await cache.get("test@example.com") is None
+
+
+@pytest.mark.asyncio
+async def test_local_hit_skips_redis():
+    cache = make_cache()
+    await cache.set(make_user(), 0)
+    user = await cache.get("test@example.com")
+    assert isinstance(user, User)
+    assert user.id == 1
+    assert user.email == "test@example.com"
+    cache.r.get.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_redis_hit_fills_local():
+    cache = make_cache()
+    cache.r.get.return_value = UserCacheModel.model_validate(make_user()).model_dump_json()
+    assert (await cache.get("test@example.com")).id == 1
+    assert (await cache.get("test@example.com")).id == 1
+    cache.r.get.assert_awaited_once_with("user:test@example.com")
+
+
+@pytest.mark.asyncio
+async def test_lru_is_bounded():
+    cache = make_cache(maxsize=2)
+    for i in range(3):
+        await cache.set(make_user(i, f"user{i}@example.com"), 0)
+    assert await cache.get("user0@example.com") is None
+    assert (await cache.get("user2@example.com")).id == 2
+
+
+@pytest.mark.asyncio
+async def test_local_entry_expires():
+    cache = make_cache()
+    with patch("src.services.cache.time.monotonic", return_value=0):
+        await cache.set(make_user(), 0)
+    with patch("src.services.cache.time.monotonic", return_value=301):
+        assert await cache.get("test@example.com") is None
+
+
+@pytest.mark.asyncio
+async def test_invalidate_is_pipelined():
+    cache = make_cache()
+    await cache.set(make_user(), 0)
+    await cache.invalidate("test@example.com")
+    assert await cache.get("test@example.com") is None
+    pipe = cache.r.pipeline.return_value
+    pipe.incr.assert_called_once_with("user-generation:test@example.com")
+    pipe.delete.assert_called_once_with("user:test@example.com")
+    pipe.publish.assert_called_once_with(UserCache.channel, "test@example.com")
+    pipe.execute.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_invalidation_from_other_worker():
+    cache = make_cache()
+    await cache.set(make_user(), 0)
+    pubsub = MagicMock()
+    pubsub.subscribe = AsyncMock()
+    pubsub.aclose = AsyncMock()
+    pubsub.get_message = AsyncMock(side_effect=[{"type": "message", "channel": UserCache.channel,
+                                                 "data": "test@example.com"}, Exception("stop")])
+    cache.r.pubsub = MagicMock(return_value=pubsub)
+    with pytest.raises(Exception, match="stop"):
+        await cache._listen()
+    assert await cache.get("test@example.com") is None
+    pubsub.subscribe.assert_awaited_once_with(UserCache.channel)
+    pubsub.aclose.assert_awaited_once()
+
+
+def test_token_cache_hit():
+    cache = TokenCache(maxsize=10)
+    cache.set("token", {"scope": "access_token", "sub": "test@example.com", "exp": 2000, "iat": 1000})
+    with patch("src.services.cache.time.time", return_value=1500):
+        assert cache.get("token") == {"scope": "access_token", "sub": "test@example.com", "exp": 2000}
+        assert cache.get("other_token") is None
+
+
+def test_token_cache_expires_with_token():
+    cache = TokenCache(maxsize=10)
+    cache.set("token", {"scope": "access_token", "sub": "test@example.com", "exp": 2000})
+    with patch("src.services.cache.time.time", return_value=2000):
+        assert cache.get("token") is None
+
+
+def test_token_cache_skips_tokens_without_exp():
+    cache = TokenCache(maxsize=10)
+    cache.set("token", {"scope": "access_token", "sub": "test@example.com"})
+    assert cache.get("token") is None
+
+
+def test_token_cache_is_bounded():
+    cache = TokenCache(maxsize=2)
+    for i in range(3):
+        cache.set(f"token{i}", {"scope": "access_token", "sub": "test@example.com", "exp": 2000})
+    with patch("src.services.cache.time.time", return_value=1500):
+        assert cache.get("token0") is None
+        assert cache.get("token2") is not None
+
+
+@pytest.mark.asyncio
+async def test_contacts_version_starts_from_clock():
+    r = AsyncMock()
+    r.get.side_effect = [None, "1700000000000"]
+    version = ContactsVersion(r)
+    with patch("src.services.cache.time.time_ns", return_value=1_700_000_000_000_000_000):
+        assert await version.get(1) == 1700000000000
+    r.set.assert_awaited_once_with("contacts:version:1", 1700000000000, nx=True)
+
+
+@pytest.mark.asyncio
+async def test_contacts_version_bump():
+    r = AsyncMock()
+    await ContactsVersion(r).bump(1)
+    r.incr.assert_awaited_once_with("contacts:version:1")
+
+
+@pytest.mark.asyncio
+async def test_recent_writers():
+    r = AsyncMock()
+    writers = RecentWriters(window=2.5, r=r)
+    await writers.mark(7)
+    r.set.assert_awaited_once_with("recent-writer:7", 1, px=2500)
+    r.get.return_value = None
+    assert await writers.is_recent(7) is False
+    r.get.return_value = "1"
+    assert await writers.is_recent(7) is True
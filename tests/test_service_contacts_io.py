@@ -0,0 +1,70 @@
+import pytest
+
+from src.config import messages
+from src.services.contacts_io import iter_lines, iter_ndjson, iter_csv
+
+
+async def stream(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+@pytest.mark.asyncio
+async def test_iter_lines_across_chunks():
+    lines = await collect(iter_lines(stream(b"\xef\xbb\xbffirst\r\nsec", b"ond\nthi", "rd \xd1".encode()[:-1],
+                                            "rd \xd1".encode()[-1:])))
+    assert lines == ["first", "second", "third \xd1"]
+
+
+@pytest.mark.asyncio
+async def test_iter_lines_skips_lines_that_are_too_long():
+    lines = await collect(iter_lines(stream(b"short\nlo", b"ng line", b" without end", b"\nnext\nover long"),
+                                     max_line_size=8))
+    assert lines == ["short", None, "next", None]
+
+
+@pytest.mark.asyncio
+async def test_iter_ndjson_line_too_long():
+    rows = await collect(iter_ndjson(stream(b'{"a": 1}\n{"a": "' + b"x" * 100, b'"}\n{"a": 2}\n')))
+    assert rows == [({"a": 1}, None), ({"a": "x" * 100}, None), ({"a": 2}, None)]
+    rows = await collect(iter_ndjson(stream(b'{"a": "' + b"x" * 70000, b'"}\n{"a": 2}\n')))
+    assert rows == [(None, messages.LINE_TOO_LONG), ({"a": 2}, None)]
+
+
+@pytest.mark.asyncio
+async def test_iter_ndjson():
+    rows = await collect(iter_ndjson(stream(b'{"a": 1}\n\n[1, 2]\n{"a"', b': 2}\nnot json\n')))
+    assert rows == [({"a": 1}, None), (None, messages.INVALID_JSON), ({"a": 2}, None),
+                    (None, messages.INVALID_JSON)]
+
+
+@pytest.mark.asyncio
+async def test_iter_csv_multiline_quoted_values():
+    rows = await collect(iter_csv(stream(b'a,b\n1,"x\n', b'y"\n\n2,"say ""hi"""\n3\n')))
+    assert rows == [({"a": "1", "b": "x\ny"}, None), ({"a": "2", "b": 'say "hi"'}, None),
+                    (None, messages.INVALID_CSV_ROW)]
+
+
+@pytest.mark.asyncio
+async def test_iter_csv_quote_inside_unquoted_value():
+    rows = await collect(iter_csv(stream(b'first_name,last_name\nAnn,O"Brien\nBob,Smith\nCid,Lee\n')))
+    assert rows == [({"first_name": "Ann", "last_name": 'O"Brien'}, None),
+                    ({"first_name": "Bob", "last_name": "Smith"}, None),
+                    ({"first_name": "Cid", "last_name": "Lee"}, None)]
+
+
+@pytest.mark.asyncio
+async def test_iter_csv_unterminated_quoted_value():
+    rows = await collect(iter_csv(stream(b'a,b\n1,2\n3,"x\n4,5\n')))
+    assert rows == [({"a": "1", "b": "2"}, None), (None, messages.UNTERMINATED_CSV_VALUE)]
+
+
+@pytest.mark.asyncio
+async def test_iter_csv_record_too_long():
+    rows = await collect(iter_csv(stream(b'a,b\n1,"' + b"x\n" * 10 + b'2,3\n'), max_record_size=8))
+    assert rows[0] == (None, messages.CSV_RECORD_TOO_LONG)
+    assert rows[-1] == ({"a": "2", "b": "3"}, None)
@@ -0,0 +1,9 @@
+from src.services.etag import etag_matches
+
+
+def test_etag_matches():
+    assert etag_matches('W/"1-5"', 'W/"1-5"')
+    assert etag_matches('"1-4", "1-5"', 'W/"1-5"')
+    assert etag_matches("*", 'W/"1-5"')
+    assert not etag_matches('W/"1-4"', 'W/"1-5"')
+    assert not etag_matches(None, 'W/"1-5"')
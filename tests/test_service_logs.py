@@ -0,0 +1,50 @@
+import json
+import logging
+import sys
+
+from src.services.logs import DeferredQueueHandler, JsonFormatter, SamplingFilter
+
+
+def make_record(level=logging.INFO, msg="User %s logged in", args=(7,), exc_info=None, **extra):
+    record = logging.LogRecord("src.test", level, __file__, 1, msg, args, exc_info)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter():
+    entry = json.loads(JsonFormatter().format(make_record(user_id=7)))
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "src.test"
+    assert entry["message"] == "User 7 logged in"
+    assert entry["user_id"] == 7
+    assert "exc_info" not in entry
+
+
+def test_json_formatter_exception():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = make_record(level=logging.ERROR, msg="Failed", args=(), exc_info=sys.exc_info())
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "Failed"
+    assert "ValueError: boom" in entry["exc_info"]
+
+
+def test_sampling_filter(monkeypatch):
+    monkeypatch.setattr("src.services.logs.random.random", lambda: 0.5)
+    assert SamplingFilter(0.4).filter(make_record()) is False
+    assert SamplingFilter(0.6).filter(make_record()) is True
+    assert SamplingFilter(0).filter(make_record(level=logging.WARNING)) is True
+    assert SamplingFilter(1).filter(make_record(level=logging.DEBUG)) is True
+
+
+def test_deferred_queue_handler_keeps_exception():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = make_record(level=logging.ERROR, exc_info=sys.exc_info())
+    prepared = DeferredQueueHandler(None).prepare(record)
+    assert prepared.msg == "User 7 logged in"
+    assert prepared.args is None
+    assert prepared.exc_info is not None
+    assert record.args == (7,)
@@ -0,0 +1,41 @@
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.database.query_stats import QueryStats, current_stats, track_queries
+from src.services.metrics import RATE_LIMITED, count_rate_limited
+
+
+@pytest.mark.asyncio
+async def test_count_rate_limited():
+    request = MagicMock()
+    request.scope = {"route": MagicMock(path="/api/contacts/")}
+    before = RATE_LIMITED.labels("/api/contacts/")._value.get()
+    with pytest.raises(HTTPException) as error:
+        await count_rate_limited(request, MagicMock(), 1500)
+    assert error.value.status_code == 429
+    assert error.value.headers == {"Retry-After": "2"}
+    assert RATE_LIMITED.labels("/api/contacts/")._value.get() == before + 1
+
+
+@pytest.mark.asyncio
+async def test_track_queries_counts_per_request():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    track_queries(engine)
+    track_queries(engine)
+    stats = QueryStats()
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+        token = current_stats.set(stats)
+        try:
+            await conn.execute(text("SELECT 1"))
+            await conn.execute(text("SELECT 2"))
+        finally:
+            current_stats.reset(token)
+        await conn.execute(text("SELECT 3"))
+    await engine.dispose()
+    assert stats.count == 2
+    assert stats.duration > 0
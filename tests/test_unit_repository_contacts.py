@@ -2,20 +2,29 @@ import unittest
 
 from datetime import date, timedelta
 
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, AsyncMock, patch
 
-from sqlalchemy.orm import Session
+from sqlalchemy import UniqueConstraint, create_engine, inspect
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.schema import CreateIndex
 
-from src.database.models import Contact, User
-from src.schemas import ContactModel, ContactUpdate
+from src.config import messages
+from src.database.models import Base, Contact, User, to_birthday_key
+from src.schemas import ContactBatchRequest, ContactModel, ContactPatch, ContactUpdate
 from src.repository.contacts import (
     get_contacts,
     get_contact,
+    encode_cursor,
+    decode_cursor,
     get_contacts_first_name,
     get_contacts_last_name,
     get_contacts_email,
     get_contacts_birthday,
     create_contact,
+    create_contacts,
+    batch_contacts,
     remove_contact,
     update_contact,
 )
@@ -24,50 +33,148 @@ from src.repository.contacts import (
 class TestContactFunctions(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = AsyncMock(spec=AsyncSession)
+        self.session.bind = MagicMock()
         self.user = User(id=1)
+        patcher = patch("src.repository.contacts.contacts_version", new_callable=AsyncMock)
+        self.contacts_version = patcher.start()
+        self.addCleanup(patcher.stop)
 
     async def test_get_contacts(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().offset().limit().all.return_value = contacts
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = contacts
+        self.session.execute.return_value = mocked_contacts
         result = await get_contacts(skip=0, limit=10, user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
+    async def test_get_contacts_after_cursor(self):
+        contacts = [Contact(id=11), Contact(id=12)]
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = contacts
+        self.session.execute.return_value = mocked_contacts
+        result = await get_contacts(skip=0, limit=10, user=self.user, db=self.session, after=10)
+        self.assertEqual(result, contacts)
+        stmt = str(self.session.execute.call_args.args[0])
+        self.assertIn("contacts.id >", stmt)
+        self.assertNotIn("OFFSET", stmt)
+
+    def test_cursor_round_trip(self):
+        cursor = encode_cursor(12345)
+        self.assertNotIn("12345", cursor)
+        self.assertEqual(decode_cursor(cursor), 12345)
+
+    def test_decode_cursor_invalid(self):
+        with self.assertRaises(ValueError):
+            decode_cursor("not a cursor!")
+
     async def test_get_contact(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        mocked_contact = MagicMock()
+        mocked_contact.scalar_one_or_none.return_value = contact
+        self.session.execute.return_value = mocked_contact
         result = await get_contact(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_get_contact_nonexistent(self):
-        self.session.query().filter().first.return_value = None
+        mocked_contact = MagicMock()
+        mocked_contact.scalar_one_or_none.return_value = None
+        self.session.execute.return_value = mocked_contact
         result = await get_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_get_contacts_first_name(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().all.return_value = contacts
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = contacts
+        self.session.execute.return_value = mocked_contacts
         result = await get_contacts_first_name("Brad", user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contacts_last_name(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().all.return_value = contacts
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = contacts
+        self.session.execute.return_value = mocked_contacts
         result = await get_contacts_last_name("Lee", user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contacts_email(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().all.return_value = contacts
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = contacts
+        self.session.execute.return_value = mocked_contacts
         result = await get_contacts_email("example.com", user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
+    def test_search_indexes(self):
+        indexes = {index.name: index for index in Contact.__table__.indexes}
+        for column in ("first_name", "last_name", "email"):
+            index = indexes[f"ix_contacts_{column}_trgm"]
+            ddl = str(CreateIndex(index).compile(dialect=postgresql.dialect()))
+            self.assertIn("USING gin", ddl)
+            self.assertIn(f"{column} gin_trgm_ops", ddl)
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        names = {index["name"] for index in inspect(engine).get_indexes("contacts")}
+        engine.dispose()
+        self.assertIn("ix_contacts_user_id_last_name", names)
+        self.assertFalse(any(name.endswith("_trgm") for name in names))
+
+    def test_per_user_uniqueness(self):
+        unique = {tuple(column.name for column in constraint.columns)
+                  for constraint in Contact.__table__.constraints if isinstance(constraint, UniqueConstraint)}
+        self.assertEqual(unique, {("user_id", "email"), ("user_id", "phone_number")})
+        self.assertFalse(Contact.__table__.c.email.unique)
+        self.assertFalse(Contact.__table__.c.phone_number.unique)
+
     async def test_get_contacts_birthday(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().all.return_value = contacts
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = contacts
+        self.session.execute.return_value = mocked_contacts
         result = await get_contacts_birthday(user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
+    async def test_get_contacts_birthday_window(self):
+        self.session.execute.return_value = MagicMock()
+        with patch("src.repository.contacts.date") as mock_date:
+            mock_date.today.return_value = date(2026, 6, 10)
+            await get_contacts_birthday(user=self.user, db=self.session, days=7)
+        params = self.session.execute.call_args.args[0].compile().params
+        self.assertIn(610, params.values())
+        self.assertIn(616, params.values())
+
+    async def test_get_contacts_birthday_new_year_wraparound(self):
+        self.session.execute.return_value = MagicMock()
+        with patch("src.repository.contacts.date") as mock_date:
+            mock_date.today.return_value = date(2026, 12, 29)
+            await get_contacts_birthday(user=self.user, db=self.session, days=7)
+        compiled = self.session.execute.call_args.args[0].compile()
+        self.assertIn(" OR ", str(compiled))
+        self.assertIn(1229, compiled.params.values())
+        self.assertIn(104, compiled.params.values())
+
+    async def test_get_contacts_birthday_includes_february_29_in_common_years(self):
+        self.session.execute.return_value = MagicMock()
+        with patch("src.repository.contacts.date") as mock_date:
+            mock_date.today.return_value = date(2025, 2, 25)
+            await get_contacts_birthday(user=self.user, db=self.session, days=7)
+        self.assertIn(229, self.session.execute.call_args.args[0].compile().params.values())
+        with patch("src.repository.contacts.date") as mock_date:
+            mock_date.today.return_value = date(2025, 2, 22)
+            await get_contacts_birthday(user=self.user, db=self.session, days=7)
+        self.assertNotIn(229, self.session.execute.call_args.args[0].compile().params.values())
+        with patch("src.repository.contacts.date") as mock_date:
+            mock_date.today.return_value = date(2025, 3, 1)
+            await get_contacts_birthday(user=self.user, db=self.session, days=365)
+        self.assertNotIn("birthday_key", str(self.session.execute.call_args.args[0].whereclause))
+
+    def test_birthday_key(self):
+        self.assertEqual(to_birthday_key(date(1990, 1, 12)), 112)
+        self.assertEqual(to_birthday_key(date(1990, 11, 2)), 1102)
+        self.assertEqual(Contact(born_date=date(2000, 2, 29)).birthday_key, 229)
+
     async def test_create_contact(self):
         contact_data = ContactModel(
             first_name="Brad",
@@ -78,9 +185,6 @@ class TestContactFunctions(unittest.IsolatedAsyncioTestCase):
             description="A test contact",
         )
         expected_contact = Contact(**contact_data.dict(), user_id=self.user.id)
-        self.session.add(expected_contact)
-        self.session.commit()
-        self.session.refresh(expected_contact)
         result = await create_contact(body=contact_data, user=self.user, db=self.session)
 
         result_dict = result.__dict__.copy()
@@ -90,18 +194,87 @@ class TestContactFunctions(unittest.IsolatedAsyncioTestCase):
 
         self.assertDictEqual(result_dict, expected_contact_dict)
 
+    async def test_create_contacts(self):
+        bodies = [ContactModel(first_name="Brad", last_name="Lee", email=f"brad{i}@example.com",
+                               phone_number=f"12345678{i}", born_date=date(1990, 1, 1), description="")
+                  for i in range(3)]
+        bodies.append(bodies[0])
+        created = MagicMock()
+        created.scalars.return_value.all.return_value = [10, 11]
+        self.session.execute.side_effect = [[("brad1@example.com", "000")], created]
+        result = await create_contacts(bodies, user=self.user, db=self.session)
+        self.assertEqual(result, [None, messages.DUPLICATE_EMAIL, None, messages.DUPLICATE_EMAIL])
+        existing = self.session.execute.call_args_list[0].args[0]
+        self.assertIn("contacts.user_id = ", str(existing))
+        inserted = self.session.execute.call_args.args[1]
+        self.assertEqual([row["email"] for row in inserted], ["brad0@example.com", "brad2@example.com"])
+        self.assertEqual(inserted[0]["birthday_key"], 101)
+        self.session.commit.assert_awaited_once()
+
+    async def test_create_contacts_conflict_falls_back_to_rows(self):
+        bodies = [ContactModel(first_name="Brad", last_name="Lee", email=f"brad{i}@example.com",
+                               phone_number=f"12345678{i}", born_date=date(1990, 1, 1), description="")
+                  for i in range(2)]
+        conflict = IntegrityError("INSERT", {}, Exception("UNIQUE constraint failed"))
+        self.session.execute.side_effect = [[], conflict, MagicMock(), conflict]
+        result = await create_contacts(bodies, user=self.user, db=self.session)
+        self.assertEqual(result, [None, messages.CONTACT_CONFLICT])
+        self.session.commit.assert_awaited_once()
+
+    async def test_batch_contacts(self):
+        body = ContactModel(first_name="Brad", last_name="Lee", email="brad@example.com", phone_number="123456789",
+                            born_date=date(1990, 3, 4), description="")
+        operations = ContactBatchRequest.model_validate({"operations": [
+            {"op": "update", "id": 1, "data": body.model_dump()},
+            {"op": "delete", "id": 2},
+            {"op": "update", "id": 2, "data": body.model_dump()},
+            {"op": "delete", "id": 3},
+            {"op": "create", "data": body.model_dump()},
+        ]}).operations
+        owned = MagicMock()
+        owned.scalars.return_value.all.return_value = [1, 2]
+        created = MagicMock()
+        created.scalars.return_value.all.return_value = [10]
+        self.session.execute.side_effect = [owned, None, None, [], created]
+        result = await batch_contacts(operations, user=self.user, db=self.session)
+        self.assertEqual([(item["status"], item["id"]) for item in result],
+                         [(200, 1), (200, 2), (404, 2), (404, 3), (201, 10)])
+        updated = self.session.execute.call_args_list[2].args[1]
+        self.assertEqual([(row["id"], row["birthday_key"]) for row in updated], [(1, 304)])
+        self.session.commit.assert_awaited_once()
+
     async def test_remove_contact_found(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
-        self.session.delete(contact)
-        self.session.commit.return_value = None
+        mocked_contact = MagicMock()
+        mocked_contact.scalar_one_or_none.return_value = contact
+        self.session.execute.return_value = mocked_contact
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, contact)
+        stmt = self.session.execute.call_args.args[0]
+        self.assertIn("RETURNING", str(stmt.compile(dialect=postgresql.dialect())))
+        self.session.execute.assert_awaited_once()
+        self.session.delete.assert_not_awaited()
+        self.session.commit.assert_awaited_once()
+        self.contacts_version.bump.assert_awaited_once_with(self.user.id)
+
+    async def test_remove_contact_found_without_returning(self):
+        self.session.bind.dialect.delete_returning = False
+        contact = Contact()
+        mocked_contact = MagicMock()
+        mocked_contact.scalar_one_or_none.return_value = contact
+        self.session.execute.return_value = mocked_contact
+        result = await remove_contact(contact_id=1, user=self.user, db=self.session)
+        self.assertEqual(result, contact)
+        self.session.delete.assert_awaited_once_with(contact)
+        self.session.commit.assert_awaited_once()
 
     async def test_remove_contact_not_found(self):
-        self.session.query().filter().first.return_value = None
+        mocked_contact = MagicMock()
+        mocked_contact.scalar_one_or_none.return_value = None
+        self.session.execute.return_value = mocked_contact
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
+        self.contacts_version.bump.assert_not_awaited()
 
     async def test_update_contact_found(self):
         contact_data = ContactUpdate(
@@ -113,16 +286,44 @@ class TestContactFunctions(unittest.IsolatedAsyncioTestCase):
             description="Updated contact",
         )
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        mocked_contact = MagicMock()
+        mocked_contact.scalar_one_or_none.return_value = contact
+        self.session.execute.return_value = mocked_contact
         contact.first_name = contact_data.first_name
         contact.last_name = contact_data.last_name
         contact.email = contact_data.email
         contact.phone_number = contact_data.phone_number
         contact.born_date = contact_data.born_date
         contact.description = contact_data.description
-        self.session.commit.return_value = None
         result = await update_contact(contact_id=1, body=contact_data, user=self.user, db=self.session)
         self.assertEqual(result, contact)
+        stmt = self.session.execute.call_args.args[0]
+        self.assertIn("RETURNING", str(stmt.compile(dialect=postgresql.dialect())))
+        self.session.execute.assert_awaited_once()
+        self.session.commit.assert_awaited_once()
+
+    async def test_patch_contact_sets_only_sent_fields(self):
+        mocked_contact = MagicMock()
+        mocked_contact.scalar_one_or_none.return_value = Contact()
+        self.session.execute.return_value = mocked_contact
+        body = ContactPatch(born_date=date(1990, 12, 31))
+        await update_contact(contact_id=1, body=body, user=self.user, db=self.session)
+        params = self.session.execute.call_args.args[0].compile(dialect=postgresql.dialect()).params
+        self.assertEqual(params["born_date"], date(1990, 12, 31))
+        self.assertEqual(params["birthday_key"], 1231)
+        self.assertNotIn("first_name", params)
+
+    async def test_patch_contact_without_returning(self):
+        self.session.bind.dialect.update_returning = False
+        contact = Contact(first_name="Brad", born_date=date(1990, 1, 1))
+        mocked_contact = MagicMock()
+        mocked_contact.scalar_one_or_none.return_value = contact
+        self.session.execute.return_value = mocked_contact
+        body = ContactPatch(born_date=date(1990, 12, 31))
+        result = await update_contact(contact_id=1, body=body, user=self.user, db=self.session)
+        self.assertEqual(result.first_name, "Brad")
+        self.assertEqual(result.birthday_key, 1231)
+        self.session.commit.assert_awaited_once()
 
     async def test_update_contact_not_found(self):
         contact_data = ContactUpdate(
@@ -133,7 +334,9 @@ class TestContactFunctions(unittest.IsolatedAsyncioTestCase):
             born_date=date.today() - timedelta(days=365),
             description="Updated contact",
         )
-        self.session.query().filter().first.return_value = None
+        mocked_contact = MagicMock()
+        mocked_contact.scalar_one_or_none.return_value = None
+        self.session.execute.return_value = mocked_contact
         result = await update_contact(contact_id=1, body=contact_data, user=self.user, db=self.session)
         self.assertIsNone(result)
 
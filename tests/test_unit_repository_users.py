@@ -1,13 +1,14 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, AsyncMock
 from libgravatar import Gravatar
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from src.database.models import User
 from src.schemas import UserModel
 from src.repository.users import (
     get_user_by_email,
     create_user,
     update_token,
+    update_password,
     confirmed_email,
     update_avatar,
 )
@@ -16,16 +17,23 @@ from src.repository.users import (
 class TestUserFunctions(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = AsyncMock(spec=AsyncSession)
+        patcher = unittest.mock.patch("src.repository.users.user_cache", new_callable=AsyncMock)
+        self.user_cache = patcher.start()
+        self.addCleanup(patcher.stop)
 
     async def test_get_user_by_email(self):
         user = User(id=1, email="test@example.com")
-        self.session.query().filter().first.return_value = user
+        mocked_user = MagicMock()
+        mocked_user.scalar_one_or_none.return_value = user
+        self.session.execute.return_value = mocked_user
         result = await get_user_by_email(email="test@example.com", db=self.session)
         self.assertEqual(result, user)
 
     async def test_get_user_by_email_not_found(self):
-        self.session.query().filter().first.return_value = None
+        mocked_user = MagicMock()
+        mocked_user.scalar_one_or_none.return_value = None
+        self.session.execute.return_value = mocked_user
         result = await get_user_by_email(email="nonexistent@example.com", db=self.session)
         self.assertIsNone(result)
 
@@ -39,9 +47,6 @@ class TestUserFunctions(unittest.IsolatedAsyncioTestCase):
         gravatar_mock.get_image.return_value = "https://www.gravatar.com/avatar/55502f40dc8b7c769880b10874abc9d0"
         with unittest.mock.patch('libgravatar.Gravatar', return_value=gravatar_mock):
             new_user = User(**user_data.dict(), avatar="http://example.com/avatar.jpg")
-            self.session.add(new_user)
-            self.session.commit.return_value = None
-            self.session.refresh(new_user)
             result = await create_user(body=user_data, db=self.session)
             self.assertEqual(result.username, new_user.username)
             self.assertEqual(result.email, new_user.email)
@@ -58,9 +63,6 @@ class TestUserFunctions(unittest.IsolatedAsyncioTestCase):
         gravatar_mock.get_image.side_effect = Exception("Gravatar error")
         with unittest.mock.patch('libgravatar.Gravatar', return_value=gravatar_mock):
             new_user = User(**user_data.dict(), avatar=None)
-            self.session.add(new_user)
-            self.session.commit.return_value = None
-            self.session.refresh(new_user)
             result = await create_user(body=user_data, db=self.session)
             self.assertEqual(result.username, new_user.username)
             self.assertEqual(result.email, new_user.email)
@@ -69,30 +71,43 @@ class TestUserFunctions(unittest.IsolatedAsyncioTestCase):
 
     async def test_update_token(self):
         user = User(id=1, username="testuser", email="test@example.com", password="password123")
-        self.session.commit.return_value = None
         update_token_value = "new_token"
         user.refresh_token = update_token_value
         result = await update_token(user=user, token=update_token_value, db=self.session)
         self.assertIsNone(result)
         self.assertEqual(user.refresh_token, update_token_value)
+        self.user_cache.invalidate.assert_awaited_once_with(user.email)
+
+    async def test_update_password(self):
+        user = User(id=1, username="testuser", email="test@example.com", password="old_hash")
+        result = await update_password(user=user, password="new_hash", db=self.session)
+        self.assertIsNone(result)
+        self.assertEqual(user.password, "new_hash")
+        self.session.commit.assert_awaited_once()
+        self.user_cache.invalidate.assert_awaited_once_with(user.email)
 
     async def test_confirmed_email(self):
         user = User(id=1, username="testuser", email="test@example.com", password="password123")
-        user.confirmed = True
-        self.session.commit.return_value = None
+        mocked_user = MagicMock()
+        mocked_user.scalar_one_or_none.return_value = user
+        self.session.execute.return_value = mocked_user
         result = await confirmed_email(email="test@example.com", db=self.session)
         self.assertIsNone(result)
         self.assertTrue(user.confirmed)
+        self.session.commit.assert_awaited_once()
+        self.user_cache.invalidate.assert_awaited_once_with("test@example.com")
 
     async def test_update_avatar(self):
         email = "test@example.com"
         new_avatar_url = "http://example.com/new_avatar.jpg"
         user = User(id=1, username="testuser", email=email, password="password123")
-        session_mock = MagicMock(spec=Session)
-        session_mock.query().filter().first.return_value = user
-        updated_user = await update_avatar(email=email, url=new_avatar_url, db=session_mock)
+        mocked_user = MagicMock()
+        mocked_user.scalar_one_or_none.return_value = user
+        self.session.execute.return_value = mocked_user
+        updated_user = await update_avatar(email=email, url=new_avatar_url, db=self.session)
         self.assertEqual(updated_user.avatar, new_avatar_url)
-        session_mock.commit.assert_called_once()
+        self.session.commit.assert_awaited_once()
+        self.user_cache.invalidate.assert_awaited_once_with(email)
 
 
 if __name__ == '__main__':